@@ -1,9 +1,101 @@
+import importlib.util
+
 # Default mode
 MODE = "EDUCATIONAL"
 
+# Worker processes a full table scan is split across (1 = no parallel scan)
+PARALLEL_WORKERS = 1
+
+# Query execution: ROW (one row at a time) or VECTOR (NumPy column batches)
+EXECUTION = "ROW"
+EXECUTIONS = ["ROW", "VECTOR"]
+
+# Memory a sort may use before it spills sorted runs to disk (bytes)
+SORT_MEMORY = 64 * 1024 * 1024
+
+# Memory GROUP BY may use for group states before it spills rows to disk (bytes)
+AGGREGATE_MEMORY = 64 * 1024 * 1024
+
+# False positive rate of primary key Bloom filters, unless a table sets BLOOM_FP_RATE
+BLOOM_FP_RATE = 0.01
+
+# When the write-ahead log is fsynced: OFF, BATCH (not at COMMIT) or ALWAYS
+WAL_FSYNC = "BATCH"
+WAL_FSYNC_MODES = ["OFF", "BATCH", "ALWAYS"]
+
+# Share of a table's row bytes held by dead rows that has it compacted in
+# the background after a DELETE or UPDATE (None = only by VACUUM)
+AUTOVACUUM = 0.5
+
 def set_mode(new_mode):
     global MODE
     MODE = new_mode.upper()
 
 def get_mode():
     return MODE
+
+def set_execution(execution):
+    global EXECUTION
+    execution = execution.upper()
+    if execution not in EXECUTIONS:
+        raise Exception(f"Unknown execution {execution}, expected one of {', '.join(EXECUTIONS)}")
+    if execution == "VECTOR" and importlib.util.find_spec("numpy") is None:
+        raise Exception("Vectorized execution needs NumPy (pip install numpy)")
+    EXECUTION = execution
+
+def get_execution():
+    return EXECUTION
+
+def set_parallel_workers(workers):
+    global PARALLEL_WORKERS
+    PARALLEL_WORKERS = max(1, int(workers))
+
+def get_parallel_workers():
+    return PARALLEL_WORKERS
+
+def set_sort_memory(size):
+    global SORT_MEMORY
+    SORT_MEMORY = int(size)
+
+def get_sort_memory():
+    return SORT_MEMORY
+
+def set_aggregate_memory(size):
+    global AGGREGATE_MEMORY
+    AGGREGATE_MEMORY = int(size)
+
+def get_aggregate_memory():
+    return AGGREGATE_MEMORY
+
+def set_bloom_fp_rate(rate):
+    global BLOOM_FP_RATE
+    rate = float(rate)
+    if not 0 < rate < 1:
+        raise Exception("Bloom filter false positive rate must be between 0 and 1")
+    BLOOM_FP_RATE = rate
+
+def get_bloom_fp_rate():
+    return BLOOM_FP_RATE
+
+def set_wal_fsync(mode):
+    global WAL_FSYNC
+    mode = mode.upper()
+    if mode not in WAL_FSYNC_MODES:
+        raise Exception(f"Unknown WAL fsync mode {mode}, expected one of {', '.join(WAL_FSYNC_MODES)}")
+    WAL_FSYNC = mode
+
+def get_wal_fsync():
+    return WAL_FSYNC
+
+def set_autovacuum(ratio):
+    global AUTOVACUUM
+    if str(ratio).upper() == "OFF":
+        AUTOVACUUM = None
+        return
+    ratio = float(ratio)
+    if not 0 < ratio <= 1:
+        raise Exception("Autovacuum ratio must be between 0 and 1, or OFF")
+    AUTOVACUUM = ratio
+
+def get_autovacuum():
+    return AUTOVACUUM
@@ -1,6 +1,7 @@
 from storage import (
     create_table,
     insert_row,
+    insert_rows,
     select_rows,
     update_row,
     delete_row,
@@ -8,15 +9,59 @@ from storage import (
     alter_table,
     show_tables,
     describe_table,
-    truncate_table
+    truncate_table,
+    create_index,
+    drop_index,
+    begin_transaction,
+    commit_transaction,
+    rollback_transaction,
+    vacuum_table
 )
 
+from storage.wal import commit, checkpoint, rollback
+from storage.transaction import in_transaction
+from storage.vacuum_storage import statement_lock
 from visualizer import print_pipeline, print_trace
 import config
 
+# Data changes go through the write-ahead log and every statement that
+# logged any ends with a commit; schema changes are made durable by a
+# checkpoint before and after them. Inside a transaction data changes are
+# queued and written by COMMIT
+DDL_COMMANDS = ["CREATE", "DROP", "ALTER", "TRUNCATE", "CREATE_INDEX", "DROP_INDEX"]
+
 
 def execute_query(command):
 
+    cmd_type = command["type"]
+
+    # Schema changes cannot be queued
+    if cmd_type in DDL_COMMANDS and in_transaction():
+        raise Exception(
+            f"{cmd_type} is not allowed inside a transaction (COMMIT or ROLLBACK first)"
+        )
+
+    # Background compaction (see vacuum_storage.py) waits for the statement
+    with statement_lock:
+
+        if cmd_type in DDL_COMMANDS:
+            checkpoint()
+
+        try:
+            _execute(command)
+        except Exception:
+            # A statement that fails part way leaves nothing behind
+            rollback()
+            raise
+
+        if cmd_type in DDL_COMMANDS:
+            checkpoint()
+        else:
+            commit()
+
+
+def _execute(command):
+
     # Educational Pipeline
     # if config.get_mode() == "EDUCATIONAL":
     #     print_pipeline()
@@ -39,7 +84,11 @@ def execute_query(command):
 
             command["table"],
             command["columns"],
-            command.get("primary_key")
+            command.get("primary_key"),
+            command.get("engine"),
+            command.get("dictionary"),
+            command.get("compression"),
+            command.get("bloom_fp_rate")
 
         )
 
@@ -60,13 +109,12 @@ def execute_query(command):
         
         # Check if it's multiple rows or single row
         if values and isinstance(values[0], list):
-            # Multiple rows
-            for value_set in values:
-                insert_row(
-                    command["table"],
-                    value_set,
-                    command.get("columns")
-                )
+            # Multiple rows - validated and written as one batch
+            insert_rows(
+                command["table"],
+                values,
+                command.get("columns")
+            )
         else:
             # Single row (backward compatibility)
             insert_row(
@@ -103,7 +151,11 @@ def execute_query(command):
 
             command.get("order_by"),
 
-            command.get("limit")
+            command.get("limit"),
+
+            command.get("aggregates"),
+
+            command.get("having")
 
         )
 
@@ -216,6 +268,88 @@ def execute_query(command):
 
         truncate_table(command)
 
+    # =========================
+    # CREATE INDEX
+    # =========================
+
+    elif cmd_type == "CREATE_INDEX":
+
+        print_trace(
+            "EXECUTOR",
+            ["Operation Identified: CREATE INDEX"]
+        )
+
+        create_index(
+
+            command["table"],
+            command["index"],
+            command["column"],
+            command["index_type"]
+
+        )
+
+    # =========================
+    # DROP INDEX
+    # =========================
+
+    elif cmd_type == "DROP_INDEX":
+
+        print_trace(
+            "EXECUTOR",
+            ["Operation Identified: DROP INDEX"]
+        )
+
+        drop_index(
+
+            command["index"],
+            command.get("table")
+
+        )
+
+    # =========================
+    # VACUUM
+    # =========================
+
+    elif cmd_type == "VACUUM":
+
+        print_trace(
+            "EXECUTOR",
+            ["Operation Identified: VACUUM"]
+        )
+
+        vacuum_table(command["table"])
+
+    # =========================
+    # TRANSACTIONS
+    # =========================
+
+    elif cmd_type == "BEGIN":
+
+        print_trace(
+            "EXECUTOR",
+            ["Operation Identified: BEGIN TRANSACTION"]
+        )
+
+        begin_transaction()
+
+    elif cmd_type == "COMMIT":
+
+        print_trace(
+            "EXECUTOR",
+            ["Operation Identified: COMMIT"]
+        )
+
+        commit_transaction()
+
+    elif cmd_type == "ROLLBACK":
+
+        print_trace(
+            "EXECUTOR",
+            ["Operation Identified: ROLLBACK"]
+        )
+
+        rollback_transaction()
+
     else:
 
         raise Exception(
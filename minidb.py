@@ -3,12 +3,19 @@ import config
 from parser import parse_query
 from executor import execute_query
 from visualizer import print_header
+from storage.wal import recover, wal_path
 
 
 def setup():
     os.makedirs("data", exist_ok=True)
     os.makedirs("metadata", exist_ok=True)
 
+    # Repeat what the write-ahead log holds from before a crash, undoing
+    # a statement it cut short
+    replayed = recover()
+    if replayed:
+        print(f"🔁 Recovered {replayed} logged write(s) from {wal_path()}")
+
 
 def main():
     setup()
@@ -27,7 +34,7 @@ def main():
             query_lines.append(line)
             
             # Check if the line ends with semicolon or is a special command
-            if line.endswith(";") or line.lower() == "exit" or line.upper().startswith("SET MODE") or line.upper().startswith("SHOW MODE"):
+            if line.endswith(";") or line.lower() == "exit" or line.upper().startswith(("SET MODE", "SET PARALLEL", "SET EXECUTION", "SET WAL_FSYNC", "SET AUTOVACUUM", "SHOW MODE")):
                 break
             
             # Continue with continuation prompt
@@ -46,9 +53,57 @@ def main():
             print(f"🔄 Mode changed to {mode.upper()}")
             continue
 
+        # 🔹 SET PARALLEL
+        if query.upper().startswith("SET PARALLEL"):
+            workers = query.split()[-1].replace(";", "")
+            if not workers.isdigit():
+                print("❌ Error: SET PARALLEL expects a number of workers")
+                continue
+            config.set_parallel_workers(workers)
+            print(f"🔄 Parallel scan workers set to {config.get_parallel_workers()}")
+            continue
+
+        # 🔹 SET EXECUTION
+        if query.upper().startswith("SET EXECUTION"):
+            execution = query.split()[-1].replace(";", "")
+            try:
+                config.set_execution(execution)
+            except Exception as e:
+                print("❌ Error:", e)
+                continue
+            print(f"🔄 Execution changed to {config.get_execution()}")
+            continue
+
+        # 🔹 SET WAL_FSYNC
+        if query.upper().startswith("SET WAL_FSYNC"):
+            mode = query.split()[-1].replace(";", "")
+            try:
+                config.set_wal_fsync(mode)
+            except Exception as e:
+                print("❌ Error:", e)
+                continue
+            print(f"🔄 WAL fsync changed to {config.get_wal_fsync()}")
+            continue
+
+        # 🔹 SET AUTOVACUUM
+        if query.upper().startswith("SET AUTOVACUUM"):
+            ratio = query.split()[-1].replace(";", "")
+            try:
+                config.set_autovacuum(ratio)
+            except Exception as e:
+                print("❌ Error:", e)
+                continue
+            ratio = config.get_autovacuum()
+            print(f"🔄 Autovacuum {'off' if ratio is None else f'at {ratio:.0%} dead rows'}")
+            continue
+
         # 🔹 SHOW MODE
         if query.upper().startswith("SHOW MODE"):
             print("Current Mode:", config.get_mode())
+            print("Execution:", config.get_execution())
+            print("WAL fsync:", config.get_wal_fsync())
+            ratio = config.get_autovacuum()
+            print("Autovacuum:", "OFF" if ratio is None else f"{ratio:.0%} dead rows")
             continue
 
         try:
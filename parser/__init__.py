@@ -9,6 +9,9 @@ from .alter_parser import parse_alter
 from .show_parser import parse_show
 from .describe_parser import parse_describe
 from .truncate_parser import parse_truncate
+from .index_parser import parse_create_index, parse_drop_index
+from .transaction_parser import parse_transaction
+from .vacuum_parser import parse_vacuum
 
 # Import tokenizer for main parse_query function
 import sys
@@ -17,6 +20,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from tokenizer import tokenize
 from visualizer import print_trace
+from utils import format_condition, format_expression
 
 
 def parse_query(query):
@@ -35,7 +39,10 @@ def parse_query(query):
     command = None
     
     if command_type == "CREATE":
-        command = parse_create(tokens)
+        if len(tokens) > 1 and tokens[1] == "INDEX":
+            command = parse_create_index(tokens)
+        else:
+            command = parse_create(tokens)
     
     elif command_type == "INSERT":
         command = parse_insert(tokens)
@@ -50,7 +57,10 @@ def parse_query(query):
         command = parse_delete(tokens)
     
     elif command_type == "DROP":
-        command = parse_drop(tokens)
+        if len(tokens) > 1 and tokens[1] == "INDEX":
+            command = parse_drop_index(tokens)
+        else:
+            command = parse_drop(tokens)
     
     elif command_type == "ALTER":
         command = parse_alter(tokens)
@@ -64,6 +74,12 @@ def parse_query(query):
     elif command_type == "TRUNCATE":
         command = parse_truncate(tokens)
     
+    elif command_type == "VACUUM":
+        command = parse_vacuum(tokens)
+    
+    elif command_type in ("BEGIN", "COMMIT", "ROLLBACK"):
+        command = parse_transaction(tokens)
+    
     else:
         raise Exception(f"Unsupported command: {command_type}")
     
@@ -86,6 +102,12 @@ def _display_parsed_command(command):
     if 'table' in command:
         lines.append(f"Target Table   : {command['table']}")
     
+    if 'index' in command:
+        lines.append(f"Index Name     : {command['index']}")
+    
+    if 'index_type' in command:
+        lines.append(f"Index On       : {command['column']} ({command['index_type']})")
+    
     if 'columns' in command and command['columns']:
         if command['type'] == 'CREATE':
             cols = [f"{name}({dtype})" for name, dtype in command['columns']]
@@ -98,9 +120,9 @@ def _display_parsed_command(command):
     
     if 'condition' in command and command['condition']:
         cond = command['condition']
-        if isinstance(cond, tuple):
-            # Tuple format: (column, operator, value)
-            lines.append(f"Condition      : {cond[0]} {cond[1]} {cond[2]}")
+        if isinstance(cond, tuple) or (isinstance(cond, dict) and 'type' in cond):
+            # (column, operator, value) or an AND / OR / NOT tree
+            lines.append(f"Condition      : {format_condition(cond)}")
         elif isinstance(cond, dict):
             # Dict format: {'column': ..., 'operator': ..., 'value': ...}
             lines.append(f"Condition      : {cond['column']} {cond['operator']} {cond['value']}")
@@ -109,7 +131,11 @@ def _display_parsed_command(command):
     
     if 'set' in command:
         set_data = command['set']
-        if isinstance(set_data, tuple):
+        if isinstance(set_data, list):
+            # List format: [(column, expression), ...]
+            updates = [f"{col} = {format_expression(expr)}" for col, expr in set_data]
+            lines.append(f"Set Values     : {', '.join(updates)}")
+        elif isinstance(set_data, tuple):
             # Tuple format: (column, value)
             lines.append(f"Set Values     : {set_data[0]} = {set_data[1]}")
         elif isinstance(set_data, dict):
@@ -126,17 +152,38 @@ def _display_parsed_command(command):
         else:
             lines.append(f"Primary Key    : {pk}")
     
+    if command.get('engine'):
+        lines.append(f"Engine         : {command['engine']}")
+    
+    if command.get('compression'):
+        lines.append(f"Compression    : {command['compression']}")
+    
+    if command.get('dictionary'):
+        lines.append(f"Dictionary     : {', '.join(command['dictionary'])}")
+    
+    if command.get('bloom_fp_rate'):
+        lines.append(f"Bloom FP Rate  : {command['bloom_fp_rate']}")
+    
     if 'operation' in command:
         lines.append(f"ALTER Operation: {command['operation']}")
     
-    if 'aggregate' in command and command['aggregate']:
+    if command.get('aggregates') and len(command['aggregates']) > 1:
+        agg_display = ", ".join(f"{func}({col})" for func, col in command['aggregates'])
+        lines.append(f"Aggregate Func : {agg_display}")
+    elif 'aggregate' in command and command['aggregate']:
         agg_display = command['aggregate']
         if 'agg_column' in command and command['agg_column']:
             agg_display = f"{command['aggregate']}({command['agg_column']})"
         lines.append(f"Aggregate Func : {agg_display}")
     
     if 'group_by' in command and command['group_by']:
-        lines.append(f"Group By       : {command['group_by']}")
+        group_by = command['group_by']
+        if isinstance(group_by, list):
+            group_by = ", ".join(group_by)
+        lines.append(f"Group By       : {group_by}")
+    
+    if 'having' in command and command['having']:
+        lines.append(f"Having         : {format_condition(command['having'])}")
     
     if 'order_by' in command and command['order_by']:
         order = command['order_by']
@@ -166,5 +213,9 @@ __all__ = [
     'parse_alter',
     'parse_show',
     'parse_describe',
-    'parse_truncate'
+    'parse_truncate',
+    'parse_create_index',
+    'parse_drop_index',
+    'parse_transaction',
+    'parse_vacuum'
 ]
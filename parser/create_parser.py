@@ -2,13 +2,40 @@
 Parser for CREATE TABLE command
 """
 
+TABLE_OPTIONS = ["ENGINE", "COMPRESSION", "BLOOM_FP_RATE"]
+
+
 def parse_create(tokens):
     """
     Parse CREATE TABLE statement
     Syntax: CREATE TABLE table_name (col1 type1, col2 type2, ...) PRIMARY KEY (col)
+            [DICTIONARY (col, ...)] [ENGINE = COLUMNAR] [COMPRESSION = ZLIB | LZMA]
+            [BLOOM_FP_RATE = 0.01]
     """
     table = tokens[2]
 
+    # DICTIONARY (col, ...): text columns stored as dictionary codes
+    dictionary = None
+
+    for j in range(3, len(tokens) - 1):
+        if tokens[j].upper() == "DICTIONARY" and tokens[j + 1] == "(":
+            end = tokens.index(")", j)
+            dictionary = [t for t in tokens[j + 2:end] if t != ","]
+            tokens = tokens[:j] + tokens[end + 1:]
+            break
+
+    # ENGINE = name, COMPRESSION = name, BLOOM_FP_RATE = rate, before or
+    # after PRIMARY KEY; taken out of the tokens
+    options = {}
+    j = 3
+
+    while j < len(tokens) - 2:
+        if tokens[j].upper() in TABLE_OPTIONS and tokens[j + 1] == "=":
+            options[tokens[j].upper()] = tokens[j + 2].upper()
+            tokens = tokens[:j] + tokens[j + 3:]
+        else:
+            j += 1
+
     start = tokens.index("(") + 1
 
     columns = []
@@ -68,7 +95,15 @@ def parse_create(tokens):
 
         "columns": columns,
 
-        "primary_key": primary_key
+        "primary_key": primary_key,
+
+        "engine": options.get("ENGINE"),
+
+        "compression": options.get("COMPRESSION"),
+
+        "bloom_fp_rate": options.get("BLOOM_FP_RATE"),
+
+        "dictionary": dictionary
 
     }
     
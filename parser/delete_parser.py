@@ -1,6 +1,7 @@
 """
 Parser for DELETE command
 """
+from .where_parser import parse_where
 
 def parse_delete(tokens):
     """
@@ -16,11 +17,7 @@ def parse_delete(tokens):
 
     where_index = tokens.index("WHERE")
     
-    condition = (
-        tokens[where_index + 1],   # column
-        tokens[where_index + 2],   # operator
-        tokens[where_index + 3]    # value
-    )
+    condition = parse_where(tokens[where_index + 1:])
 
     command = {
         "type": "DELETE",
@@ -0,0 +1,56 @@
+"""
+Parser for CREATE INDEX and DROP INDEX commands
+"""
+
+INDEX_TYPES = ["BTREE", "HASH"]
+
+
+def parse_create_index(tokens):
+    """
+    Parse CREATE INDEX statement
+    Syntax: CREATE INDEX index_name ON table (column) [USING BTREE | HASH]
+    """
+    if len(tokens) < 8 or tokens[3] != "ON" or tokens[5] != "(" or tokens[7] != ")":
+        raise Exception("Invalid CREATE INDEX syntax")
+
+    index_type = "BTREE"
+
+    if "USING" in tokens:
+        using = tokens.index("USING")
+        if using + 1 >= len(tokens):
+            raise Exception("Invalid CREATE INDEX syntax - index type missing")
+        index_type = tokens[using + 1].upper()
+
+    if index_type not in INDEX_TYPES:
+        raise Exception(f"Unsupported index type {index_type}")
+
+    command = {
+        "type": "CREATE_INDEX",
+        "index": tokens[2],
+        "table": tokens[4],
+        "column": tokens[6],
+        "index_type": index_type
+    }
+
+    return command
+
+
+def parse_drop_index(tokens):
+    """
+    Parse DROP INDEX statement
+    Syntax: DROP INDEX index_name [ON table]
+    """
+    if len(tokens) < 3:
+        raise Exception("Invalid DROP INDEX syntax - index name required")
+
+    command = {
+        "type": "DROP_INDEX",
+        "index": tokens[2]
+    }
+
+    if len(tokens) > 3:
+        if tokens[3] != "ON" or len(tokens) < 5:
+            raise Exception("Invalid DROP INDEX syntax")
+        command["table"] = tokens[4]
+
+    return command
@@ -1,11 +1,13 @@
 """
 Parser for SELECT command
 """
+from .where_parser import parse_where, where_tokens
 
 def parse_select(tokens):
     """
     Parse SELECT statement
-    Syntax: SELECT columns FROM table [WHERE condition] [GROUP BY col] [ORDER BY col] [LIMIT n]
+    Syntax: SELECT columns FROM table [WHERE condition] [GROUP BY col, ...]
+            [HAVING condition] [ORDER BY col] [LIMIT n]
     """
     from_index = tokens.index("FROM")
 
@@ -18,6 +20,7 @@ def parse_select(tokens):
 
     condition = None
     group_by = None
+    having = None
     order_by = None
     limit = None
     aggregate = None
@@ -27,36 +30,63 @@ def parse_select(tokens):
     # ---------------- WHERE ----------------
     if "WHERE" in tokens:
         idx = tokens.index("WHERE")
-        condition = (
-            tokens[idx + 1],   # column
-            tokens[idx + 2],   # operator
-            tokens[idx + 3]    # value
+        condition = parse_where(
+            where_tokens(tokens, idx + 1, ["GROUP", "HAVING", "ORDER", "LIMIT"])
         )
 
 
     # ---------------- AGGREGATE ----------------
     aggregates = ["COUNT", "SUM", "AVG", "MIN", "MAX"]
 
-    if select_columns:
-
-        # Check all columns for aggregate functions
-        for col in select_columns:
-            if col.upper() in aggregates:
-                aggregate = col.upper()
-                # Find the column being aggregated
-                if "(" in tokens:
-                    # Find position of this aggregate in tokens
-                    for i, t in enumerate(tokens):
-                        if t.upper() == aggregate and i + 1 < len(tokens) and tokens[i + 1] == "(":
-                            agg_column = tokens[i + 2]
-                            break
-                break
+    # Every FUNC ( column ) in the select list, in order
+    agg_list = []
+    plain_columns = []
+
+    select_tokens = tokens[1:from_index]
+    i = 0
+
+    while i < len(select_tokens):
+        t = select_tokens[i]
+
+        if t.upper() in aggregates:
+            if i + 1 < len(select_tokens) and select_tokens[i + 1] == "(":
+                agg_list.append((t.upper(), select_tokens[i + 2]))
+                i += 4
+                continue
+            agg_list.append((t.upper(), None))
+        elif t != ",":
+            plain_columns.append(t)
+
+        i += 1
+
+    if agg_list:
+        aggregate, agg_column = agg_list[0]
 
 
     # ---------------- GROUP BY ----------------
     if "GROUP" in tokens and "BY" in tokens:
         g = tokens.index("GROUP")
-        group_by = tokens[g + 2]
+        group_by = []
+
+        for t in tokens[g + 2:]:
+            if t in ["HAVING", "ORDER", "LIMIT"]:
+                break
+            if t != ",":
+                group_by.append(t)
+
+        if not group_by:
+            raise Exception("Missing column after GROUP BY")
+
+
+    # ---------------- HAVING ----------------
+    if "HAVING" in tokens:
+        if not group_by:
+            raise Exception("HAVING requires GROUP BY")
+
+        h = tokens.index("HAVING")
+        having = parse_where(
+            where_tokens(tokens, h + 1, ["ORDER", "LIMIT"])
+        )
 
 
     # ---------------- ORDER BY ----------------
@@ -108,12 +138,8 @@ def parse_select(tokens):
     # Filter out aggregate function tokens from columns
     non_agg_columns = select_columns
     if aggregate:
-        # Remove aggregate-related tokens: aggregate name, '(', column, ')'
-        non_agg_columns = [
-            c for c in select_columns 
-            if c.upper() not in ["COUNT", "SUM", "AVG", "MIN", "MAX", "(", ")"]
-            and c != agg_column
-        ]
+        # Columns outside the aggregate calls
+        non_agg_columns = plain_columns
         # If we have GROUP BY, use non-aggregate columns, otherwise None
         if group_by:
             select_columns = non_agg_columns if non_agg_columns else None
@@ -126,8 +152,10 @@ def parse_select(tokens):
         "columns": select_columns,
         "aggregate": aggregate,
         "agg_column": agg_column,
+        "aggregates": agg_list,
         "condition": condition,
         "group_by": group_by,
+        "having": having,
         "order_by": order_by,
         "limit": limit
     }
@@ -0,0 +1,19 @@
+"""
+Parser for BEGIN, COMMIT and ROLLBACK
+"""
+
+def parse_transaction(tokens):
+    """
+    Parse a transaction statement
+    Syntax: BEGIN [TRANSACTION], COMMIT [TRANSACTION] or ROLLBACK [TRANSACTION]
+    """
+    command_type = tokens[0].upper()
+
+    if tokens[1:] not in ([], ["TRANSACTION"]):
+        raise Exception(f"Invalid {command_type} syntax")
+
+    command = {
+        "type": command_type
+    }
+
+    return command
@@ -1,11 +1,25 @@
 """
 Parser for UPDATE command
+
+SET takes one or more assignments separated by commas. The value of an
+assignment is an expression: a literal, a column of the row, or
+arithmetic on those with +, -, * and / (usual precedence, parentheses
+group). A literal or column is kept as its token; arithmetic as a dict:
+
+    {"type": "ARITHMETIC", "op": "+", "left": ..., "right": ...}
+    {"type": "NEGATE", "operand": ...}
 """
+import re
+from .where_parser import parse_where
+
+# A number (with an exponent), an operator, or anything up to the next operator
+_PIECE = re.compile(r"(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?|[+\-*/]|[^+\-*/]+")
+
 
 def parse_update(tokens):
     """
     Parse UPDATE statement
-    Syntax: UPDATE table SET column = value WHERE condition
+    Syntax: UPDATE table SET column = expression [, ...] WHERE condition
     """
     table = tokens[1]
 
@@ -17,17 +31,9 @@ def parse_update(tokens):
 
     where_index = tokens.index("WHERE")
 
-    set_column = tokens[set_index + 1]
-
-    set_value = tokens[set_index + 3]
-
-    condition = (
-
-        tokens[where_index + 1],   # column
-        tokens[where_index + 2],   # operator
-        tokens[where_index + 3]    # value
+    assignments = parse_set(tokens[set_index + 1:where_index])
 
-    )
+    condition = parse_where(tokens[where_index + 1:])
 
     command = {
 
@@ -35,15 +41,125 @@ def parse_update(tokens):
 
         "table":table,
 
-        "set":(
-
-            set_column,
-            set_value
-
-        ),
+        "set":assignments,
 
         "condition":condition
 
     }
-    
+
     return command
+
+
+def parse_set(tokens):
+    """
+    Parse the tokens of a SET clause (without the SET keyword) into a list
+    of (column, expression)
+    """
+    assignments = []
+
+    for part in _split_commas(tokens):
+        if len(part) < 3 or part[1] != "=":
+            raise Exception("Invalid SET clause: expected column = value")
+
+        pieces = _split_operators(part[2:])
+        expression, pos = _parse_sum(pieces, 0)
+
+        if pos != len(pieces):
+            raise Exception(f"Unexpected token in SET clause: {pieces[pos]}")
+
+        assignments.append((part[0], expression))
+
+    return assignments
+
+
+def _split_commas(tokens):
+    """Split tokens at the commas outside parentheses"""
+    parts = [[]]
+    depth = 0
+
+    for token in tokens:
+        if token == "," and depth == 0:
+            parts.append([])
+            continue
+
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+
+        parts[-1].append(token)
+
+    if any(not part for part in parts):
+        raise Exception("Invalid SET clause: empty assignment")
+
+    return parts
+
+
+def _split_operators(tokens):
+    """Break tokens such as c+1 into c, +, 1 (quoted strings stay whole)"""
+    pieces = []
+
+    for token in tokens:
+        if token[0] in "'\"":
+            pieces.append(token)
+        else:
+            pieces.extend(_PIECE.findall(token))
+
+    return pieces
+
+
+def _parse_sum(tokens, pos):
+    left, pos = _parse_product(tokens, pos)
+
+    while pos < len(tokens) and tokens[pos] in ("+", "-"):
+        op = tokens[pos]
+        right, pos = _parse_product(tokens, pos + 1)
+        left = {"type": "ARITHMETIC", "op": op, "left": left, "right": right}
+
+    if pos < len(tokens) and tokens[pos] != ")":
+        raise Exception(f"Unexpected token in SET clause: {tokens[pos]}")
+
+    return left, pos
+
+
+def _parse_product(tokens, pos):
+    left, pos = _parse_factor(tokens, pos)
+
+    while pos < len(tokens) and tokens[pos] in ("*", "/"):
+        op = tokens[pos]
+        right, pos = _parse_factor(tokens, pos + 1)
+        left = {"type": "ARITHMETIC", "op": op, "left": left, "right": right}
+
+    return left, pos
+
+
+def _parse_factor(tokens, pos):
+    if pos >= len(tokens):
+        raise Exception("Incomplete expression in SET clause")
+
+    token = tokens[pos]
+
+    # ---------- ( expression ) ----------
+
+    if token == "(":
+        expression, pos = _parse_sum(tokens, pos + 1)
+
+        if pos >= len(tokens) or tokens[pos] != ")":
+            raise Exception("Missing ) in SET clause")
+
+        return expression, pos + 1
+
+    # ---------- - factor ----------
+
+    if token in ("+", "-"):
+        operand, pos = _parse_factor(tokens, pos + 1)
+        if token == "+":
+            return operand, pos
+        return {"type": "NEGATE", "operand": operand}, pos
+
+    if token in (")", "*", "/"):
+        raise Exception(f"Unexpected token in SET clause: {token}")
+
+    # ---------- literal or column ----------
+
+    return token, pos + 1
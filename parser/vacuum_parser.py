@@ -0,0 +1,23 @@
+"""
+Parser for VACUUM command
+"""
+
+def parse_vacuum(tokens):
+    """
+    Parse VACUUM statement
+    Syntax: VACUUM table_name OR VACUUM TABLE table_name
+    """
+    # VACUUM students or VACUUM TABLE students
+    if len(tokens) > 2 and tokens[1] == "TABLE":
+        table = tokens[2]
+    elif len(tokens) == 2:
+        table = tokens[1]
+    else:
+        raise Exception("Invalid VACUUM syntax")
+
+    command = {
+        "type": "VACUUM",
+        "table": table
+    }
+
+    return command
@@ -0,0 +1,140 @@
+"""
+Parser for WHERE conditions
+
+A condition is either a comparison, kept as a (column, operator, value)
+tuple, or a dict combining other conditions:
+
+    {"type": "AND", "conditions": [...]}
+    {"type": "OR",  "conditions": [...]}
+    {"type": "NOT", "condition": ...}
+
+Precedence is NOT, then AND, then OR; parentheses group as usual.
+
+The same grammar is used for HAVING, where a comparison may name an
+aggregate such as COUNT(*); its column is then the label "COUNT(*)".
+"""
+
+OPERATORS = ["=", "!=", "<>", "<", ">", "<=", ">="]
+
+AGGREGATES = ["COUNT", "SUM", "AVG", "MIN", "MAX"]
+
+
+def parse_where(tokens):
+    """
+    Parse the tokens of a WHERE clause (without the WHERE keyword)
+    """
+    if not tokens:
+        raise Exception("Missing condition after WHERE")
+
+    condition, pos = _parse_or(tokens, 0)
+
+    if pos != len(tokens):
+        raise Exception(f"Unexpected token in WHERE clause: {tokens[pos]}")
+
+    return condition
+
+
+def _combine(kind, conditions):
+    if len(conditions) == 1:
+        return conditions[0]
+
+    return {
+        "type": kind,
+        "conditions": conditions
+    }
+
+
+def _parse_or(tokens, pos):
+    conditions = []
+
+    condition, pos = _parse_and(tokens, pos)
+    conditions.append(condition)
+
+    while pos < len(tokens) and tokens[pos] == "OR":
+        condition, pos = _parse_and(tokens, pos + 1)
+        conditions.append(condition)
+
+    return _combine("OR", conditions), pos
+
+
+def _parse_and(tokens, pos):
+    conditions = []
+
+    condition, pos = _parse_not(tokens, pos)
+    conditions.append(condition)
+
+    while pos < len(tokens) and tokens[pos] == "AND":
+        condition, pos = _parse_not(tokens, pos + 1)
+        conditions.append(condition)
+
+    return _combine("AND", conditions), pos
+
+
+def _parse_not(tokens, pos):
+    if pos < len(tokens) and tokens[pos] == "NOT":
+        condition, pos = _parse_not(tokens, pos + 1)
+        return {"type": "NOT", "condition": condition}, pos
+
+    return _parse_primary(tokens, pos)
+
+
+def _parse_primary(tokens, pos):
+    if pos >= len(tokens):
+        raise Exception("Incomplete WHERE clause")
+
+    # ---------- ( condition ) ----------
+
+    if tokens[pos] == "(":
+        condition, pos = _parse_or(tokens, pos + 1)
+
+        if pos >= len(tokens) or tokens[pos] != ")":
+            raise Exception("Missing ) in WHERE clause")
+
+        return condition, pos + 1
+
+    # ---------- column op value ----------
+
+    column, pos = _parse_operand(tokens, pos)
+
+    if pos + 1 >= len(tokens):
+        raise Exception("Incomplete WHERE clause")
+
+    op, value = tokens[pos:pos + 2]
+
+    if op not in OPERATORS:
+        raise Exception(f"Unsupported operator {op}")
+
+    if op == "<>":
+        op = "!="
+
+    return (column, op, value), pos + 2
+
+
+def _parse_operand(tokens, pos):
+    """A column name, or an aggregate FUNC ( column ) as its label"""
+    if (tokens[pos].upper() in AGGREGATES and pos + 3 < len(tokens)
+            and tokens[pos + 1] == "(" and tokens[pos + 3] == ")"):
+        return f"{tokens[pos].upper()}({tokens[pos + 2]})", pos + 4
+
+    return tokens[pos], pos + 1
+
+
+def where_tokens(tokens, start, stop_words=()):
+    """
+    Return the tokens of a WHERE clause starting at index start, ending
+    before the first stop word outside parentheses
+    """
+    depth = 0
+    end = start
+
+    while end < len(tokens):
+        token = tokens[end]
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth == 0 and token in stop_words:
+            break
+        end += 1
+
+    return tokens[start:end]
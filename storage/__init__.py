@@ -1,6 +1,6 @@
 # Storage module - Modular database operations
 from .create_storage import create_table
-from .insert_storage import insert_row
+from .insert_storage import insert_row, insert_rows
 from .select_storage import select_rows
 from .update_storage import update_row
 from .delete_storage import delete_row
@@ -9,10 +9,14 @@ from .alter_storage import alter_table
 from .show_storage import show_tables
 from .describe_storage import describe_table
 from .truncate_storage import truncate_table
+from .index_storage import create_index, drop_index
+from .transaction_storage import begin_transaction, commit_transaction, rollback_transaction
+from .vacuum_storage import vacuum_table
 
 __all__ = [
     'create_table',
     'insert_row',
+    'insert_rows',
     'select_rows',
     'update_row',
     'delete_row',
@@ -20,5 +24,11 @@ __all__ = [
     'alter_table',
     'show_tables',
     'describe_table',
-    'truncate_table'
+    'truncate_table',
+    'create_index',
+    'drop_index',
+    'begin_transaction',
+    'commit_transaction',
+    'rollback_transaction',
+    'vacuum_table'
 ]
@@ -0,0 +1,172 @@
+"""
+Aggregate functions computed with running accumulators
+
+Every aggregate in a SELECT list becomes an Aggregate. All of them are
+updated together from one pass over the rows, and each keeps only a small
+running state (a count, a running sum, the current minimum ...), so the
+rows themselves are never collected. The same state is kept per group
+under GROUP BY.
+
+The results match what the aggregates used to compute from a list of the
+values: COUNT counts rows, the others skip NULLs and give None (shown as
+NULL) when no value was seen.
+"""
+from .catalog import TableInfo
+
+AGGREGATES = ["COUNT", "SUM", "AVG", "MIN", "MAX"]
+
+
+class Aggregate:
+    """One aggregate function of the select list, e.g. SUM(cgpa)"""
+
+    def __init__(self, func, column, position):
+        self.func = func
+        self.column = column
+        self.position = position
+
+    @property
+    def label(self):
+        return f"{self.func}({self.column if self.column else '*'})"
+
+
+def build_aggregates(info, items):
+    """Turn (func, column) pairs from the parser into Aggregates"""
+    aggregates = []
+
+    for func, column in items:
+        if func == "COUNT":
+            position = None
+        else:
+            if not column or column == "*":
+                raise Exception(f"{func} needs a column")
+            position = info.position(column)
+
+        aggregates.append(Aggregate(func, column, position))
+
+    return aggregates
+
+
+# ===================================
+# ACCUMULATORS
+# ===================================
+#
+# The state of a list of aggregates is a list with one entry each:
+#   COUNT    -> number of rows
+#   SUM, AVG -> [running sum, number of values]
+#   MIN, MAX -> current minimum / maximum, None before the first value
+
+def new_state(aggregates):
+    return [
+        0 if a.func == "COUNT" else [0.0, 0] if a.func in ("SUM", "AVG") else None
+        for a in aggregates
+    ]
+
+
+def update_state(state, aggregates, row):
+    """Fold one row into the state"""
+    for i, a in enumerate(aggregates):
+        func = a.func
+
+        if func == "COUNT":
+            state[i] += 1
+            continue
+
+        value = row[a.position]
+        if value is None:
+            continue
+        value = float(value)
+
+        if func == "SUM" or func == "AVG":
+            acc = state[i]
+            acc[0] += value
+            acc[1] += 1
+        elif func == "MIN":
+            if state[i] is None or value < state[i]:
+                state[i] = value
+        elif state[i] is None or value > state[i]:
+            state[i] = value
+
+
+def merge_state(state, other, aggregates):
+    """Combine two states of the same aggregates into state"""
+    for i, a in enumerate(aggregates):
+        func = a.func
+
+        if func == "COUNT":
+            state[i] += other[i]
+        elif func == "SUM" or func == "AVG":
+            state[i][0] += other[i][0]
+            state[i][1] += other[i][1]
+        elif other[i] is None:
+            continue
+        elif state[i] is None:
+            state[i] = other[i]
+        elif func == "MIN":
+            state[i] = min(state[i], other[i])
+        else:
+            state[i] = max(state[i], other[i])
+
+
+def final_values(state, aggregates):
+    """Aggregate results; None when no value was aggregated"""
+    values = []
+
+    for i, a in enumerate(aggregates):
+        func = a.func
+
+        if func == "COUNT":
+            values.append(state[i])
+        elif func == "SUM" or func == "AVG":
+            total, n = state[i]
+            if not n:
+                values.append(None)
+            else:
+                values.append(total if func == "SUM" else total / n)
+        else:
+            values.append(state[i])
+
+    return values
+
+
+# ===================================
+# HAVING
+# ===================================
+
+def parse_label(label):
+    """(func, column) of an aggregate label such as SUM(cgpa), or None"""
+    func, paren, rest = label.partition("(")
+
+    if not paren or not rest.endswith(")") or func.upper() not in AGGREGATES:
+        return None
+
+    return func.upper(), rest[:-1]
+
+
+def condition_aggregates(condition):
+    """(func, column) of every aggregate a HAVING condition compares"""
+    if isinstance(condition, tuple):
+        item = parse_label(condition[0])
+        return [item] if item else []
+
+    if condition["type"] == "NOT":
+        return condition_aggregates(condition["condition"])
+
+    return [
+        item
+        for c in condition["conditions"]
+        for item in condition_aggregates(c)
+    ]
+
+
+def result_info(info, group_by, aggregates):
+    """
+    Describe a grouped result row - the group columns followed by the
+    aggregates - like a table, so HAVING compiles as a WHERE would.
+    """
+    columns = [[col, info.types[info.position(col)]] for col in group_by]
+    columns += [
+        [a.label, "INT" if a.func == "COUNT" else "DOUBLE"]
+        for a in aggregates
+    ]
+
+    return TableInfo(info.table, {"columns": columns}, None, 0)
@@ -2,9 +2,21 @@
 Storage operations for ALTER TABLE
 """
 import os
-import json
 from visualizer import print_trace, print_result
-from utils import table_paths, check_table_exists
+from utils import table_paths, cast_value, format_value
+from .indexes import (
+    PK_INDEX,
+    build_primary_index,
+    drop_index_file,
+    rebuild_indexes,
+    rename_indexes,
+    secondary_indexes
+)
+from .table import open_table
+from .columnfile import rename_column_files
+from .zonemap import zone_path
+from .dictionary import dictionary_path, encoded_columns
+from .catalog import get_table, save_table, forget_table, get_dictionary
 
 DATA_DIR = "data"
 META_DIR = "metadata"
@@ -26,11 +38,12 @@ def alter_table(command):
     table = command["table"]
     operation = command["operation"]
     tbl, meta = table_paths(table)
-    check_table_exists(tbl, meta)
     
-    metadata = json.load(open(meta))
+    # Work on a copy so a failed ALTER leaves the catalog untouched
+    metadata = get_table(table).editable()
     columns = metadata["columns"]
     primary_key = metadata.get("primary_key")
+    heap = open_table(table, metadata)
     
     # ===================================
     # ADD COLUMN
@@ -54,18 +67,14 @@ def alter_table(command):
         metadata["columns"] = columns
         
         # Update all rows with NULL for each new column
-        rows = open(tbl).readlines()
-        new_rows = []
-        for row in rows:
-            row = row.strip()
-            if row:
-                nulls = ",NULL" * len(columns_to_add)
-                new_rows.append(row + nulls + "\n")
+        new_rows = [vals + [None] * len(columns_to_add) for _, vals in heap.scan()]
+        
+        new_heap = open_table(table, metadata)
+        new_heap.rewrite(new_heap.codec.encode(vals) for vals in new_rows)
         
-        open(tbl, "w").writelines(new_rows)
+        save_table(table, metadata)
         
-        with open(meta, "w") as f:
-            json.dump(metadata, f)
+        rebuild_indexes(table, metadata)
         
         if len(columns_to_add) == 1:
             col_name, col_type = columns_to_add[0]
@@ -101,17 +110,27 @@ def alter_table(command):
         columns.pop(col_index)
         metadata["columns"] = columns
         
-        rows = open(tbl).readlines()
+        if column_name in encoded_columns(metadata):
+            metadata["dictionary"].remove(column_name)
+        
+        # Indexes on the dropped column go with it
+        indexes = secondary_indexes(metadata)
+        for name in [n for n, info in indexes.items() if info["column"] == column_name]:
+            del indexes[name]
+            drop_index_file(table, name)
+        
         new_rows = []
-        for row in rows:
-            vals = row.strip().split(",")
+        for _, vals in heap.scan():
             vals.pop(col_index)
-            new_rows.append(",".join(vals) + "\n")
+            new_rows.append(vals)
+        
+        new_heap = open_table(table, metadata)
+        new_heap.rewrite(new_heap.codec.encode(vals) for vals in new_rows)
         
-        open(tbl, "w").writelines(new_rows)
+        save_table(table, metadata)
+        _prune_dictionary(table, metadata)
         
-        with open(meta, "w") as f:
-            json.dump(metadata, f)
+        rebuild_indexes(table, metadata)
         
         print_trace("STORAGE ENGINE", [
             f"Dropped column: {column_name}",
@@ -139,12 +158,29 @@ def alter_table(command):
         columns[col_index] = (column_name, new_datatype)
         metadata["columns"] = columns
         
-        with open(meta, "w") as f:
-            json.dump(metadata, f)
+        # Only text columns are dictionary encoded
+        if column_name in encoded_columns(metadata) and new_datatype.upper() not in ("CHAR", "VARCHAR"):
+            metadata["dictionary"].remove(column_name)
+        
+        # Stored values are typed, so convert them before touching the metadata
+        new_rows = []
+        for _, vals in heap.scan():
+            vals[col_index] = cast_value(vals[col_index], new_datatype)
+            new_rows.append(vals)
+        
+        new_heap = open_table(table, metadata)
+        new_heap.rewrite(new_heap.codec.encode(vals) for vals in new_rows)
+        
+        save_table(table, metadata)
+        _prune_dictionary(table, metadata)
+        
+        # The rewrite may move rows and key components are typed
+        rebuild_indexes(table, metadata)
         
         print_trace("STORAGE ENGINE", [
             f"Modified column: {column_name}",
-            f"Datatype changed: {old_datatype} → {new_datatype}"
+            f"Datatype changed: {old_datatype} → {new_datatype}",
+            f"Converted {len(new_rows)} row(s)"
         ])
         
         print_result(f"✅ Column {column_name} Modified Successfully")
@@ -178,8 +214,18 @@ def alter_table(command):
                     for pk_col in primary_key
                 ]
         
-        with open(meta, "w") as f:
-            json.dump(metadata, f)
+        for info in secondary_indexes(metadata).values():
+            if info["column"] == old_column:
+                info["column"] = new_column
+        
+        if old_column in encoded_columns(metadata):
+            encoded = metadata["dictionary"]
+            encoded[encoded.index(old_column)] = new_column
+            dictionary = get_dictionary(table)
+            dictionary.rename(old_column, new_column)
+            dictionary.save()
+        
+        save_table(table, metadata)
         
         print_trace("STORAGE ENGINE", [
             f"Renamed column: {old_column} → {new_column}"
@@ -200,6 +246,14 @@ def alter_table(command):
         
         os.rename(tbl, new_tbl)
         os.rename(meta, new_meta)
+        rename_indexes(table, new_table_name)
+        rename_column_files(table, new_table_name)
+        if os.path.exists(dictionary_path(table)):
+            os.rename(dictionary_path(table), dictionary_path(new_table_name))
+        if os.path.exists(zone_path(tbl)):
+            os.rename(zone_path(tbl), zone_path(new_tbl))
+        forget_table(table)
+        forget_table(new_table_name)
         
         print_trace("STORAGE ENGINE", [
             f"Renamed table: {table} → {new_table_name}",
@@ -224,23 +278,21 @@ def alter_table(command):
             if pk_col not in column_names:
                 raise Exception(f"Column '{pk_col}' does not exist")
         
-        rows = open(tbl).readlines()
+        rows = [vals for _, vals in heap.scan()]
         pk_indices = [column_names.index(pk_col) for pk_col in pk_columns]
         
-        for row_num, row in enumerate(rows, 1):
-            vals = row.strip().split(",")
+        for row_num, vals in enumerate(rows, 1):
             for i, pk_col in zip(pk_indices, pk_columns):
-                if vals[i] == "NULL":
+                if vals[i] is None:
                     raise Exception(
                         f"Cannot add PRIMARY KEY: Column '{pk_col}' has NULL values (row {row_num})"
                     )
         
         pk_values_set = set()
-        for row_num, row in enumerate(rows, 1):
-            vals = row.strip().split(",")
+        for row_num, vals in enumerate(rows, 1):
             pk_tuple = tuple(vals[i] for i in pk_indices)
             if pk_tuple in pk_values_set:
-                pk_display = ", ".join([f"{pk_columns[i]}={vals[pk_indices[i]]}" for i in range(len(pk_columns))])
+                pk_display = ", ".join([f"{pk_columns[i]}={format_value(vals[pk_indices[i]])}" for i in range(len(pk_columns))])
                 raise Exception(
                     f"Cannot add PRIMARY KEY: Duplicate values found ({pk_display})"
                 )
@@ -248,8 +300,9 @@ def alter_table(command):
         
         metadata["primary_key"] = pk_columns
         
-        with open(meta, "w") as f:
-            json.dump(metadata, f)
+        save_table(table, metadata)
+        
+        build_primary_index(table, metadata)
         
         if len(pk_columns) == 1:
             print_trace("STORAGE ENGINE", [
@@ -277,8 +330,9 @@ def alter_table(command):
         
         metadata["primary_key"] = None
         
-        with open(meta, "w") as f:
-            json.dump(metadata, f)
+        save_table(table, metadata)
+        
+        drop_index_file(table, PK_INDEX)
         
         print_trace("STORAGE ENGINE", [
             f"Dropped PRIMARY KEY constraint: {pk_display}"
@@ -288,3 +342,14 @@ def alter_table(command):
     
     else:
         raise Exception(f"Unsupported ALTER operation: {operation}")
+
+
+def _prune_dictionary(table, metadata):
+    """Forget the values of columns that are no longer dictionary encoded"""
+    dictionary = get_dictionary(table)
+
+    for name in list(dictionary.columns):
+        if name not in encoded_columns(metadata):
+            dictionary.drop(name)
+
+    dictionary.save()
@@ -0,0 +1,130 @@
+"""
+Bloom filter over the primary key tuples of a table
+
+Every table with a primary key keeps one next to its B+tree index:
+
+    data/<table>.pk.bloom    [header][bit array]
+
+The filter answers "is this key possibly in the table?". A key it has
+never seen is reported absent with certainty, so an INSERT of a new key
+skips the duplicate probe of the B+tree; a key it has seen, and a small
+share of the others (the false positive rate), is probed as before.
+
+The bit array is sized for a capacity of keys at the table's false
+positive rate (BLOOM_FP_RATE, config.BLOOM_FP_RATE by default). Inserts
+set their bits in place; keys are never removed, so a deleted or updated
+key only costs an unneeded probe until the filter is rebuilt, which
+happens with the primary index and whenever the keys outgrow the
+capacity.
+"""
+import os
+import math
+import struct
+import hashlib
+from utils import DATA_DIR
+from .hash_index import _normalize
+
+MAGIC = b"MINIDB\x00B"
+HEADER = struct.Struct("<8sdQQII")    # magic, rate, capacity, keys, bits, hashes
+MIN_CAPACITY = 1024
+
+
+def bloom_path(table):
+    return os.path.join(DATA_DIR, f"{table}.pk.bloom")
+
+
+def _sizing(capacity, rate):
+    """(bits, hashes) of a filter for capacity keys at the given false positive rate"""
+    bits = max(64, math.ceil(-capacity * math.log(rate) / math.log(2) ** 2))
+    hashes = max(1, round(bits / capacity * math.log(2)))
+    return bits, hashes
+
+
+class BloomFilter:
+
+    def __init__(self, path, rate, capacity, keys, bits, hashes, data):
+        self.path = path
+        self.rate = rate
+        self.capacity = capacity
+        self.keys = keys
+        self.bits = bits
+        self.hashes = hashes
+        self.data = data
+        self.dirty = set()
+
+    @staticmethod
+    def create(path, rate, capacity):
+        """An empty filter, not yet written"""
+        capacity = max(MIN_CAPACITY, capacity)
+        bits, hashes = _sizing(capacity, rate)
+        return BloomFilter(path, rate, capacity, 0, bits, hashes, bytearray((bits + 7) // 8))
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            magic, rate, capacity, keys, bits, hashes = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise Exception(f"{path} is not a bloom filter file")
+            data = bytearray(f.read())
+        return BloomFilter(path, rate, capacity, keys, bits, hashes, data)
+
+    # ---------- KEYS ----------
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(repr(_normalize(key)).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def __contains__(self, key):
+        data = self.data
+        return all(data[p >> 3] >> (p & 7) & 1 for p in self._positions(key))
+
+    def add(self, key):
+        """Add a key; one the filter already holds is not counted again"""
+        data = self.data
+        new = False
+        for p in self._positions(key):
+            if not data[p >> 3] >> (p & 7) & 1:
+                data[p >> 3] |= 1 << (p & 7)
+                self.dirty.add(p >> 3)
+                new = True
+        if new:
+            self.keys += 1
+
+    def full(self):
+        return self.keys > self.capacity
+
+    def estimated_rate(self):
+        """False positive rate for the keys added so far"""
+        return (1 - math.exp(-self.hashes * self.keys / self.bits)) ** self.hashes
+
+    def size(self):
+        return HEADER.size + len(self.data)
+
+    # ---------- FILE ----------
+
+    def _header(self):
+        return HEADER.pack(MAGIC, self.rate, self.capacity, self.keys, self.bits, self.hashes)
+
+    def save(self):
+        """Write the whole filter (via a new file)"""
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(self._header())
+            f.write(self.data)
+        os.replace(tmp, self.path)
+        self.dirty = set()
+
+    def flush(self):
+        """Write the header and the bytes changed since the last write, in place"""
+        # Past a few changed bytes per block, one sequential write is cheaper
+        if not os.path.exists(self.path) or len(self.dirty) * 64 > len(self.data):
+            return self.save()
+
+        with open(self.path, "r+b") as f:
+            f.write(self._header())
+            for i in sorted(self.dirty):
+                f.seek(HEADER.size + i)
+                f.write(self.data[i:i + 1])
+        self.dirty = set()
@@ -0,0 +1,302 @@
+"""
+On-disk B+tree used for table indexes
+
+The tree is stored in a single file of fixed-size pages. Page 0 holds the
+header (root page and page count), every other page holds exactly one node.
+Nodes are pickled, so keys can be any tuples of mutually comparable values.
+
+Keys are unique inside the tree. Non-unique indexes append the row location
+to the key, which keeps every entry distinct while entries with the same
+leading values stay next to each other.
+
+Deletes are lazy: a key is removed from its leaf but leaves are never merged.
+"""
+from bisect import bisect_left, bisect_right
+from .pager import PageFile, PAGE_SIZE
+
+FILL_FACTOR = 0.9
+
+
+class DuplicateKeyError(Exception):
+    """Raised when a key is inserted twice"""
+
+    def __init__(self, key):
+        super().__init__(f"Duplicate key {key}")
+        self.key = key
+
+
+def _leaf(keys=None, vals=None, next_page=None):
+    return {"leaf": True, "keys": keys or [], "vals": vals or [], "next": next_page}
+
+
+def _internal(keys, children):
+    return {"leaf": False, "keys": keys, "children": children}
+
+
+def _prefix_cmp(key, bound):
+    """Compare the leading part of key against a (possibly shorter) bound"""
+    head = key[:len(bound)]
+    if head < bound:
+        return -1
+    if head > bound:
+        return 1
+    return 0
+
+
+class BPlusTree:
+    """
+    B+tree persisted in a page file.
+
+    Nodes that have been read stay cached in memory; modified nodes are
+    written back by flush().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pages = PageFile(path)
+        self.nodes = {}
+        self.dirty = set()
+
+        if self.pages.is_new:
+            self._reset()
+        else:
+            header = self.pages.read(0)
+            self.root = header["root"]
+            self.num_pages = header["pages"]
+
+    # ===================================
+    # PAGE I/O
+    # ===================================
+
+    def _node(self, page_no):
+        node = self.nodes.get(page_no)
+        if node is None:
+            node = self.pages.read(page_no)
+            self.nodes[page_no] = node
+        return node
+
+    def _allocate(self, node):
+        page_no = self.num_pages
+        self.num_pages += 1
+        self.nodes[page_no] = node
+        self.dirty.add(page_no)
+        return page_no
+
+    def _reset(self):
+        self.pages.truncate()
+        self.nodes = {}
+        self.dirty = set()
+        self.num_pages = 1
+        self.root = self._allocate(_leaf())
+
+    def flush(self):
+        """Write modified nodes and the header back to disk"""
+        for page_no in sorted(self.dirty):
+            self.pages.write(page_no, self.nodes[page_no])
+        self.pages.write(0, {"root": self.root, "pages": self.num_pages})
+        self.dirty = set()
+        self.pages.flush()
+
+    def close(self):
+        self.flush()
+        self.pages.close()
+
+    # ===================================
+    # LOOKUP
+    # ===================================
+
+    def _find_leaf(self, key):
+        page_no = self.root
+        path = []
+        node = self._node(page_no)
+        while not node["leaf"]:
+            path.append(page_no)
+            page_no = node["children"][bisect_right(node["keys"], key)]
+            node = self._node(page_no)
+        return page_no, node, path
+
+    def search(self, key):
+        """Return the value stored under key, or None"""
+        _, leaf, _ = self._find_leaf(key)
+        i = bisect_left(leaf["keys"], key)
+        if i < len(leaf["keys"]) and leaf["keys"][i] == key:
+            return leaf["vals"][i]
+        return None
+
+    def range(self, lo=None, hi=None, lo_inclusive=True, hi_inclusive=True):
+        """
+        Yield (key, value) pairs in key order between lo and hi.
+
+        Bounds are compared against the leading part of each key, so a
+        bound of (v,) matches every key that starts with v.
+        """
+        if lo is None:
+            page_no = self.root
+            node = self._node(page_no)
+            while not node["leaf"]:
+                node = self._node(node["children"][0])
+            i = 0
+        else:
+            _, node, _ = self._find_leaf(lo)
+            i = bisect_left(node["keys"], lo)
+
+        while True:
+            keys = node["keys"]
+            while i < len(keys):
+                key = keys[i]
+                if lo is not None and not lo_inclusive and _prefix_cmp(key, lo) == 0:
+                    i += 1
+                    continue
+                if hi is not None:
+                    c = _prefix_cmp(key, hi)
+                    if c > 0 or (c == 0 and not hi_inclusive):
+                        return
+                yield key, node["vals"][i]
+                i += 1
+
+            if node["next"] is None:
+                return
+            node = self._node(node["next"])
+            i = 0
+
+    def prefix(self, key):
+        """Yield (key, value) pairs whose key starts with the given prefix"""
+        return self.range(key, key)
+
+    # ===================================
+    # MODIFICATION
+    # ===================================
+
+    def insert(self, key, value, check=True):
+        """
+        Insert key -> value, raising DuplicateKeyError if key exists.
+
+        With check=False the caller vouches that key is new, and the leaf
+        is not searched for it.
+        """
+        page_no, leaf, path = self._find_leaf(key)
+        keys = leaf["keys"]
+        if check:
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                raise DuplicateKeyError(key)
+        else:
+            i = bisect_right(keys, key)
+
+        keys.insert(i, key)
+        leaf["vals"].insert(i, value)
+        self.dirty.add(page_no)
+
+        if self.pages.fits_after(page_no, leaf, (key, value)):
+            return
+
+        # ---------- SPLIT LEAF ----------
+        mid = len(keys) // 2
+        right = _leaf(keys[mid:], leaf["vals"][mid:], leaf["next"])
+        right_no = self._allocate(right)
+        del keys[mid:]
+        del leaf["vals"][mid:]
+        leaf["next"] = right_no
+        self.pages.forget_size(page_no)
+
+        self._insert_in_parent(path, page_no, right["keys"][0], right_no)
+
+    def _insert_in_parent(self, path, left_no, separator, right_no):
+        if not path:
+            self.root = self._allocate(_internal([separator], [left_no, right_no]))
+            return
+
+        parent_no = path.pop()
+        parent = self._node(parent_no)
+        i = parent["children"].index(left_no)
+        parent["keys"].insert(i, separator)
+        parent["children"].insert(i + 1, right_no)
+        self.dirty.add(parent_no)
+
+        if self.pages.fits_after(parent_no, parent, (separator, right_no)):
+            return
+
+        # ---------- SPLIT INTERNAL ----------
+        keys = parent["keys"]
+        children = parent["children"]
+        mid = len(keys) // 2
+        up = keys[mid]
+        right = _internal(keys[mid + 1:], children[mid + 1:])
+        new_no = self._allocate(right)
+        del keys[mid:]
+        del children[mid + 1:]
+        self.pages.forget_size(parent_no)
+
+        self._insert_in_parent(path, parent_no, up, new_no)
+
+    def delete(self, key):
+        """Remove key from the tree; returns True if it was present"""
+        page_no, leaf, _ = self._find_leaf(key)
+        keys = leaf["keys"]
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            del keys[i]
+            del leaf["vals"][i]
+            self.dirty.add(page_no)
+            return True
+        return False
+
+    def clear(self):
+        """Remove every entry"""
+        self._reset()
+        self.flush()
+
+    def bulk_load(self, items):
+        """
+        Replace the tree contents with items, an iterable of (key, value)
+        pairs sorted by key. Nodes are packed bottom-up.
+        """
+        self.pages.truncate()
+        self.nodes = {}
+        self.dirty = set()
+        self.num_pages = 1
+        budget = PAGE_SIZE * FILL_FACTOR
+
+        def pack(entries):
+            groups, current, size = [], [], 64
+            for entry in entries:
+                entry_size = self.pages.entry_size(entry)
+                if current and size + entry_size > budget:
+                    groups.append(current)
+                    current, size = [], 64
+                current.append(entry)
+                size += entry_size
+            if current or not groups:
+                groups.append(current)
+            return groups
+
+        # ---------- LEAVES ----------
+        previous = None
+        level = []
+        last_key = None
+        checked = []
+        for key, value in items:
+            if last_key is not None and key <= last_key:
+                if key == last_key:
+                    raise DuplicateKeyError(key)
+                raise Exception("bulk_load requires sorted keys")
+            last_key = key
+            checked.append((key, value))
+
+        for group in pack(checked):
+            page_no = self._allocate(_leaf([k for k, _ in group], [v for _, v in group]))
+            if previous is not None:
+                self.nodes[previous]["next"] = page_no
+            previous = page_no
+            level.append((group[0][0] if group else None, page_no))
+
+        # ---------- INTERNAL LEVELS ----------
+        while len(level) > 1:
+            parents = []
+            for group in pack(level):
+                node = _internal([k for k, _ in group[1:]], [p for _, p in group])
+                parents.append((group[0][0], self._allocate(node)))
+            level = parents
+
+        self.root = level[0][1]
+        self.flush()
@@ -0,0 +1,107 @@
+"""
+In-process catalog of table metadata
+
+Each .meta file is parsed once and kept together with the lookups the
+handlers need on every statement (column positions, datatypes and the
+primary key positions). An entry is reused while the file's modification
+time and size are unchanged, so edits made by another process are still
+picked up. Handlers that change a table's schema write through
+save_table(), which refreshes the entry in place.
+
+The value dictionaries of dictionary encoded columns are cached the
+same way, so a statement does not re-read the .dict file.
+"""
+import os
+import copy
+import json
+from utils import table_paths, check_table_exists
+from .dictionary import Dictionary, dictionary_path
+
+# Loaded tables and dictionaries, keyed by table name
+_tables = {}
+_dictionaries = {}
+
+
+class TableInfo:
+    """Metadata of one table plus the lookups derived from it"""
+
+    def __init__(self, table, metadata, stamp, version):
+        self.table = table
+        self.metadata = metadata
+        self.stamp = stamp
+        self.version = version
+
+        self.columns = [c[0] for c in metadata["columns"]]
+        self.types = [c[1] for c in metadata["columns"]]
+        self.positions = {name: i for i, name in enumerate(self.columns)}
+
+        pk = metadata.get("primary_key")
+        self.primary_key = ([pk] if isinstance(pk, str) else list(pk)) if pk else []
+        self.pk_positions = [
+            (self.positions[col], self.types[self.positions[col]])
+            for col in self.primary_key
+        ]
+
+    def position(self, column):
+        """Return the index of a column in the row"""
+        if column not in self.positions:
+            raise Exception(f"Column {column} not found")
+        return self.positions[column]
+
+    def editable(self):
+        """A copy of the metadata that can be changed and passed to save_table"""
+        return copy.deepcopy(self.metadata)
+
+
+def _stamp(meta):
+    st = os.stat(meta)
+    return st.st_mtime_ns, st.st_size
+
+
+def get_table(table):
+    """Return the TableInfo of a table, reloading it if the file changed"""
+    tbl, meta = table_paths(table)
+    check_table_exists(tbl, meta)
+
+    stamp = _stamp(meta)
+    info = _tables.get(table)
+
+    if info is None or info.stamp != stamp:
+        with open(meta) as f:
+            metadata = json.load(f)
+        info = TableInfo(table, metadata, stamp, info.version + 1 if info else 1)
+        _tables[table] = info
+
+    return info
+
+
+def save_table(table, metadata):
+    """Write a table's metadata and update its catalog entry"""
+    _, meta = table_paths(table)
+
+    with open(meta, "w") as f:
+        json.dump(metadata, f)
+
+    old = _tables.get(table)
+    info = TableInfo(table, metadata, _stamp(meta), old.version + 1 if old else 1)
+    _tables[table] = info
+    return info
+
+
+def get_dictionary(table):
+    """Return the value dictionary of a table, reloading it if the file changed"""
+    path = dictionary_path(table)
+    stamp = _stamp(path) if os.path.exists(path) else None
+    dictionary = _dictionaries.get(table)
+
+    # The stamp a save wrote is stored on the dictionary itself
+    if dictionary is None or (dictionary.stamp != stamp and not dictionary.dirty):
+        dictionary = _dictionaries[table] = Dictionary.load(path)
+
+    return dictionary
+
+
+def forget_table(table):
+    """Drop a table from the catalog (after DROP or RENAME)"""
+    _tables.pop(table, None)
+    _dictionaries.pop(table, None)
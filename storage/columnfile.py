@@ -0,0 +1,716 @@
+"""
+Column store table files (CREATE TABLE ... ENGINE=COLUMNAR)
+
+A columnar table keeps each column of its .meta definition in a file of
+its own, so a query reads only the columns it references:
+
+    data/<table>.tbl        file header + block directory
+    data/<table>.<i>.col    the values of column i
+
+Rows are stored in blocks of up to BLOCK_ROWS rows. A block has one or
+more segments (pieces) in every column file, each holding a run of its
+rows, and the block directory lists each block's row count and the
+(offset, length, row count) of its pieces, column by column.
+
+A segment is (row count, NULL count), the positions of the NULLs and the
+values: INT and DOUBLE as packed 8 byte arrays, CHAR / VARCHAR as a
+pickled list, or as packed 4 byte codes when the column is dictionary
+encoded.
+
+DELETE records the numbers of the dead rows of each block after the
+directory, in the same file (one small write); scans skip them, and
+VACUUM rewrites the table without them.
+
+UPDATE writes only the columns whose values change. A fixed width value
+(INT, DOUBLE or a dictionary code) that stays NULL or not NULL is
+overwritten where it is; any other changed piece is encoded again and
+written at the end of its column file, the old one staying unused until
+VACUUM. Rows keep their numbers.
+
+Inserts fill up the last block and then start new ones. The rows an
+INSERT adds to the last block become a piece of their own; trailing
+pieces are merged as they pile up (a piece is merged into the new one
+when it holds no more rows), so a block has a few pieces at most, and
+a block that fills up is merged into one. Merged pieces at the end of a
+column file are written over. Every write goes through the write-ahead
+log (see wal.py). Rows are addressed by (block number, row number) and
+keep their address until the table is rewritten.
+
+With COMPRESSION = ZLIB / LZMA every segment is compressed on its own,
+so a scan still decompresses only the columns it reads.
+
+A scan with a filter reads the columns of the filter first and decodes
+the other referenced columns only for blocks with matches, building rows
+only for the rows that pass (late materialization).
+"""
+import os
+import sys
+import glob
+import pickle
+import struct
+from array import array
+from contextlib import ExitStack
+from itertools import groupby, islice, repeat
+from utils import DATA_DIR
+from .heapfile import NUMERIC_TYPES
+from .dictionary import CODE_TYPE, save_dictionary
+from .compression import compressor, Tail
+from .wal import write_all, replace_file, replace_files
+
+MAGIC = b"MINIDB\x00C"
+FORMAT_VERSION = 2
+FILE_HEADER = struct.Struct("<8sH6x")
+BLOCK_ROWS = 4096
+SEGMENT_HEADER = struct.Struct("<II")
+
+_SWAP = sys.byteorder == "big"
+
+
+class RowCodec:
+    """
+    Records of a column store are the row lists themselves: VACUUM and
+    ALTER pass them back to rewrite() unchanged.
+    """
+
+    def encode(self, vals, flags=0):
+        return list(vals)
+
+    def decode(self, record, offset=0):
+        return list(record)
+
+
+def column_files(table):
+    return glob.glob(os.path.join(DATA_DIR, glob.escape(table) + ".*.col"))
+
+
+def rename_column_files(table, new_table):
+    for path in column_files(table):
+        name = os.path.basename(path)[len(table) + 1:]
+        os.rename(path, os.path.join(DATA_DIR, f"{new_table}.{name}"))
+
+
+# ===================================
+# SEGMENTS
+# ===================================
+
+def _typecode(datatype, column=None):
+    return CODE_TYPE if column is not None else "q" if datatype == "INT" else "d"
+
+
+def fixed_width(datatype, column=None):
+    """Bytes per value of a column stored as a packed array, else None"""
+    if column is None and datatype not in NUMERIC_TYPES:
+        return None
+    return array(_typecode(datatype, column)).itemsize
+
+
+def _pack(values, datatype, column=None, nulls=True):
+    """Packed bytes of INT / DOUBLE values or of dictionary codes (NULL as 0)"""
+    if column is not None:
+        values = [0 if v is None else column.code(v) for v in values]
+
+    elif nulls:
+        values = [0 if v is None else v for v in values]
+
+    try:
+        packed = array(_typecode(datatype, column), values)
+    except (OverflowError, TypeError):
+        raise Exception(f"Value out of range for column type {datatype}")
+
+    if _SWAP:
+        packed.byteswap()
+
+    return packed.tobytes()
+
+
+def encode_segment(values, datatype, column=None):
+    """column is the DictionaryColumn of a dictionary encoded column"""
+    nulls = [i for i, v in enumerate(values) if v is None]
+    head = SEGMENT_HEADER.pack(len(values), len(nulls))
+
+    positions = array("I", nulls)
+    if _SWAP:
+        positions.byteswap()
+
+    if column is None and datatype not in NUMERIC_TYPES:
+        return head + positions.tobytes() + pickle.dumps(values, pickle.HIGHEST_PROTOCOL)
+
+    return head + positions.tobytes() + _pack(values, datatype, column, bool(nulls))
+
+
+def decode_segment(data, datatype, column=None):
+    count, null_count = SEGMENT_HEADER.unpack_from(data)
+    pos = SEGMENT_HEADER.size + 4 * null_count
+
+    if column is None and datatype not in NUMERIC_TYPES:
+        return pickle.loads(data[pos:])
+
+    packed = array(_typecode(datatype, column))
+    packed.frombytes(data[pos:pos + packed.itemsize * count])
+    if _SWAP:
+        packed.byteswap()
+    values = packed.tolist()
+
+    if column is not None:
+        # NULLs are stored as code 0, which exists unless every value is NULL
+        if not column.values:
+            return [None] * count
+        lookup = column.values
+        values = [lookup[code] for code in values]
+
+    if null_count:
+        positions = array("I")
+        positions.frombytes(data[SEGMENT_HEADER.size:pos])
+        if _SWAP:
+            positions.byteswap()
+        for i in positions:
+            values[i] = None
+
+    return values
+
+
+# ===================================
+# COLUMN FILE
+# ===================================
+
+class ColumnFile:
+
+    ENGINE = "COLUMNAR"
+
+    def __init__(self, path, types, encoded=None, compression=None, zonemap=None):
+        self.path = path
+        self.zonemap = zonemap
+        self.types = [t.upper() for t in types]
+        self.width = len(self.types)
+        self.encoded = encoded or {}
+        self.compression = compression
+        self.compress, self.decompress = compressor(compression) if compression else (None, None)
+        self.codec = RowCodec()
+        self._blocks = None
+        self._dead = None
+
+    @staticmethod
+    def create(path):
+        with open(path, "wb") as f:
+            f.write(FILE_HEADER.pack(MAGIC, FORMAT_VERSION))
+            pickle.dump([], f, pickle.HIGHEST_PROTOCOL)
+
+        for col in glob.glob(glob.escape(path[:-len(".tbl")]) + ".*.col"):
+            os.remove(col)
+
+    def is_legacy(self):
+        return False
+
+    def is_outdated(self):
+        return False
+
+    def column_path(self, i):
+        return f"{self.path[:-len('.tbl')]}.{i}.col"
+
+    # ---------- BLOCK DIRECTORY ----------
+
+    def _load(self):
+        """[(row count, [[(offset, length, rows) per piece] per column]) per block]"""
+        if self._blocks is None:
+            with open(self.path, "rb") as f:
+                magic, version = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+                if magic != MAGIC:
+                    raise Exception(f"{self.path} is not a column store file")
+                blocks = pickle.load(f)
+
+                # Version 1 kept one (offset, length) segment per column
+                if version < 2:
+                    blocks = [
+                        (rows, [[(offset, length, rows)] for offset, length in segments])
+                        for rows, segments in blocks
+                    ]
+                self._blocks = blocks
+
+                # Files without deletes end after the block list
+                try:
+                    self._dead = pickle.load(f)
+                except EOFError:
+                    self._dead = {}
+        return self._blocks
+
+    def _dead_rows(self):
+        """{block number: frozenset of dead row numbers}"""
+        self._load()
+        return self._dead
+
+    @staticmethod
+    def _directory(blocks, dead=None):
+        data = FILE_HEADER.pack(MAGIC, FORMAT_VERSION) + pickle.dumps(blocks, pickle.HIGHEST_PROTOCOL)
+        if dead:
+            data += pickle.dumps(dead, pickle.HIGHEST_PROTOCOL)
+        return data
+
+    def _save(self, blocks, dead=None):
+        dead = self._dead_rows() if dead is None else dead
+        replace_file(self.path, self._directory(blocks, dead))
+        self._blocks = blocks
+        self._dead = dead
+
+    def page_count(self):
+        return len(self._load())
+
+    def stored_size(self):
+        """(bytes stored, uncompressed bytes or None when not recorded)"""
+        stored = sum(
+            length
+            for _, columns in self._load()
+            for pieces in columns
+            for _, length, _ in pieces
+        )
+        return stored, None if self.compress else stored
+
+    def count(self):
+        return sum(rows for rows, _ in self._load()) - sum(len(rows) for rows in self._dead_rows().values())
+
+    def dead_ratio(self):
+        """
+        Share of the column files not holding live rows: segments UPDATE
+        replaced, and the deleted share of the stored rows
+        """
+        total = sum(rows for rows, _ in self._load())
+        if not total:
+            return 0.0
+
+        live = 1 - sum(len(rows) for rows in self._dead_rows().values()) / total
+        stored, _ = self.stored_size()
+        size = sum(
+            os.path.getsize(self.column_path(i))
+            for i in range(self.width)
+            if os.path.exists(self.column_path(i))
+        )
+        return 1 - live * stored / size if size else 1 - live
+
+    # ---------- READ ----------
+
+    def _piece(self, files, i, piece):
+        """Segment bytes of a piece of column i; files keeps the open column files"""
+        f = files.get(i)
+        if f is None:
+            f = files[i] = open(self.column_path(i), "rb")
+
+        offset, length, _ = piece
+        f.seek(offset)
+        data = f.read(length)
+        return self.decompress(data) if self.decompress else data
+
+    def _column(self, files, block, i):
+        """Values of column i in a block"""
+        pieces = block[1][i]
+        values = decode_segment(self._piece(files, i, pieces[0]), self.types[i], self.encoded.get(i))
+
+        for piece in pieces[1:]:
+            values += decode_segment(self._piece(files, i, piece), self.types[i], self.encoded.get(i))
+
+        return values
+
+    def _rows(self, files, block, columns):
+        """Rows of a block with only the given columns filled in"""
+        count = block[0]
+        values = {i: self._column(files, block, i) for i in columns}
+        return [
+            list(vals)
+            for vals in zip(*[
+                values[i] if i in values else repeat(None, count)
+                for i in range(self.width)
+            ])
+        ]
+
+    def scan_columns(self, columns, predicate=None, filter_columns=(), stats=None,
+                     first=0, last=None, zones=None):
+        """
+        Yield (rid, values) for the rows that match predicate, reading only
+        the given column positions; the other values are None.
+
+        The filter_columns (the ones predicate looks at) are read first, so
+        blocks without a match never have their other columns decoded.
+        Blocks a zone filter rules out are not read at all.
+        """
+        blocks = self._load()[first:last]
+        dead_rows = self._dead_rows()
+        filter_columns = sorted(set(filter_columns))
+        rest = [i for i in sorted(set(columns)) if i not in filter_columns]
+        files = {}
+
+        try:
+            for block_no, block in enumerate(blocks, first):
+                if zones is not None and not zones(block_no):
+                    continue
+
+                if stats is not None:
+                    stats.rows_read += block[0]
+
+                dead = dead_rows.get(block_no, ())
+
+                if predicate is None:
+                    for r, vals in enumerate(self._rows(files, block, filter_columns + rest)):
+                        if r not in dead:
+                            yield (block_no, r), vals
+                    continue
+
+                matched = [
+                    (r, vals)
+                    for r, vals in enumerate(self._rows(files, block, filter_columns))
+                    if r not in dead and predicate(vals)
+                ]
+                if not matched:
+                    continue
+
+                # Late materialization: the rest only for the matching rows
+                for i in rest:
+                    values = self._column(files, block, i)
+                    for r, vals in matched:
+                        vals[i] = values[r]
+
+                for r, vals in matched:
+                    yield (block_no, r), vals
+        finally:
+            for f in files.values():
+                f.close()
+
+    def scan(self, first=0, last=None, zones=None):
+        """Yield (rid, values) for every row, or for blocks first to last - 1"""
+        return self.scan_columns(range(self.width), first=first, last=last, zones=zones)
+
+    def scan_records(self):
+        """Yield (rid, record); the records of a column store are row lists"""
+        return self.scan()
+
+    def fetch(self, rids):
+        """Yield (rid, values) for the given rids in storage order"""
+        blocks = self._load()
+        dead_rows = self._dead_rows()
+        files = {}
+
+        try:
+            for block_no, group in groupby(sorted(set(rids)), key=lambda rid: rid[0]):
+                if block_no >= len(blocks):
+                    continue
+
+                block = blocks[block_no]
+                dead = dead_rows.get(block_no, ())
+                rows = self._rows(files, block, range(self.width))
+
+                for _, r in group:
+                    if r < block[0] and r not in dead:
+                        yield (block_no, r), rows[r]
+        finally:
+            for f in files.values():
+                f.close()
+
+    # ---------- WRITE ----------
+
+    def _encode(self, values, i):
+        data = encode_segment(values, self.types[i], self.encoded.get(i))
+        return self.compress(data) if self.compress else data
+
+    def _file_size(self, i):
+        path = self.column_path(i)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _write_blocks(self, rows, files, first=0):
+        """
+        Write rows as blocks, numbered from first, at the current position
+        of the column files
+        """
+        blocks = []
+        rows = iter(rows)
+
+        while True:
+            chunk = [list(vals) for vals in islice(rows, BLOCK_ROWS)]
+            if not chunk:
+                return blocks
+
+            if self.zonemap is not None:
+                self.zonemap.set_rows(first + len(blocks), chunk)
+
+            columns = list(zip(*chunk))
+            segments = []
+
+            for i, f in enumerate(files):
+                data = self._encode(list(columns[i]), i)
+                segments.append([(f.tell(), len(data), len(chunk))])
+                f.write(data)
+
+            blocks.append((len(chunk), segments))
+
+    def append(self, rows):
+        """Append rows, filling up the last block first; returns their rids"""
+        rows = [list(vals) for vals in rows]
+        if not rows:
+            return []
+
+        blocks = list(self._load())
+        rids = []
+        fill = 0
+        files = None
+
+        # The rows that fit in the last block are added to it as a piece;
+        # rows already there keep their numbers, deleted ones included
+        if blocks and blocks[-1][0] < BLOCK_ROWS:
+            block_no = len(blocks) - 1
+            count, columns = blocks[-1]
+            fill = min(len(rows), BLOCK_ROWS - count)
+            added = rows[:fill]
+            full = count + fill == BLOCK_ROWS
+
+            files = []
+            pieces = []
+            handles = {}
+            try:
+                for i in range(self.width):
+                    tail, column = self._add_piece(handles, i, columns[i], [vals[i] for vals in added], full)
+                    files.append(tail)
+                    pieces.append(column)
+            finally:
+                for f in handles.values():
+                    f.close()
+
+            blocks[-1] = (count + fill, pieces)
+            rids = [(block_no, count + j) for j in range(fill)]
+
+            if self.zonemap is not None:
+                self.zonemap.add_rows(block_no, added)
+
+        if files is None:
+            files = [Tail(self._file_size(i)) for i in range(self.width)]
+
+        first = len(blocks)
+        blocks += self._write_blocks(rows[fill:], files, first)
+        rids += [(first + j // BLOCK_ROWS, j % BLOCK_ROWS) for j in range(len(rows) - fill)]
+
+        save_dictionary(self.encoded)
+        if self.zonemap is not None:
+            self.zonemap.save()
+
+        write_all([
+            (self.column_path(i), tail.base, tail.getvalue(), True)
+            for i, tail in enumerate(files)
+        ])
+        self._save(blocks)
+
+        return rids
+
+    def _add_piece(self, files, i, pieces, values, full):
+        """
+        Add values to the pieces of column i of the last block, merging the
+        trailing pieces that hold no more rows than the new one (all of them
+        if full). Returns (Tail with the piece to write, new pieces); the
+        piece goes over the ones it merges when they end the file.
+        """
+        rows = len(values)
+        merged = len(pieces) if full else 0
+
+        while merged < len(pieces) and pieces[-1 - merged][2] <= rows:
+            rows += pieces[-1 - merged][2]
+            merged += 1
+
+        keep = pieces[:len(pieces) - merged]
+        old = pieces[len(keep):]
+
+        if old:
+            column = self.encoded.get(i)
+            values = [
+                value
+                for piece in old
+                for value in decode_segment(self._piece(files, i, piece), self.types[i], column)
+            ] + values
+
+        end = self._file_size(i)
+        offset = end
+
+        if old and all(a[0] + a[1] == b[0] for a, b in zip(old, old[1:] + [(end,)])):
+            offset = old[0][0]
+
+        tail = Tail(offset)
+        data = self._encode(values, i)
+        tail.write(data)
+
+        return tail, keep + [(offset, len(data), len(values))]
+
+    def delete(self, rids):
+        """
+        Record the rows at rids as dead, rewriting only the block
+        directory. Returns the number of rows deleted.
+        """
+        blocks = self._load()
+        dead = dict(self._dead_rows())
+        deleted = 0
+
+        for block_no, group in groupby(sorted(set(rids)), key=lambda rid: rid[0]):
+            if block_no >= len(blocks):
+                continue
+
+            before = dead.get(block_no, frozenset())
+            after = before | {r for _, r in group if r < blocks[block_no][0]}
+            if len(after) > len(before):
+                dead[block_no] = after
+                deleted += len(after) - len(before)
+
+        if deleted:
+            self._save(blocks, dead)
+
+        return deleted
+
+    def update(self, rows):
+        """
+        Write new values for (rid, values) rows, in the columns where they
+        differ only; rows keep their rids, so returns {} (no row moved).
+        """
+        blocks = list(self._load())
+        values = dict(rows)
+        files = {}
+        writes = []
+        tails = {}
+        moved = False
+
+        try:
+            for block_no, group in groupby(sorted(values), key=lambda rid: rid[0]):
+                if block_no >= len(blocks):
+                    continue
+
+                count, columns = blocks[block_no]
+                changes = [(r, values[(block_no, r)]) for _, r in group if r < count]
+                if not changes:
+                    continue
+
+                if self.zonemap is not None:
+                    self.zonemap.add_rows(block_no, [vals for _, vals in changes])
+
+                columns = list(columns)
+                for i in range(self.width):
+                    pieces = self._update_column(files, i, columns[i], [(r, vals[i]) for r, vals in changes],
+                                                 writes, tails)
+                    if pieces is not columns[i]:
+                        columns[i] = pieces
+                        moved = True
+
+                blocks[block_no] = (count, columns)
+        finally:
+            for f in files.values():
+                f.close()
+
+        if not writes and not tails:
+            return {}
+
+        save_dictionary(self.encoded)
+        if self.zonemap is not None:
+            self.zonemap.save()
+
+        write_all(writes + [
+            (self.column_path(i), tail.base, tail.getvalue(), False)
+            for i, tail in tails.items()
+        ])
+        if moved:
+            self._save(blocks)
+
+        return {}
+
+    def _update_column(self, files, i, pieces, changes, writes, tails):
+        """
+        Apply (row number, value) changes, in row order, to the pieces of
+        column i of a block. Values overwritten in place are added to
+        writes, pieces encoded again to tails[i]; returns the pieces, a new
+        list when one of them moved.
+        """
+        datatype = self.types[i]
+        column = self.encoded.get(i)
+        width = None if self.compress else fixed_width(datatype, column)
+        result = pieces
+        first = 0
+        k = 0
+
+        for p, (offset, length, rows) in enumerate(pieces):
+            mine = []
+            while k < len(changes) and changes[k][0] < first + rows:
+                mine.append((changes[k][0] - first, changes[k][1]))
+                k += 1
+            first += rows
+
+            if not mine:
+                continue
+
+            data = self._piece(files, i, pieces[p])
+            old = decode_segment(data, datatype, column)
+            mine = [(r, value) for r, value in mine if old[r] != value]
+            if not mine:
+                continue
+
+            in_place = width is not None and all((old[r] is None) == (value is None) for r, value in mine)
+
+            for r, value in mine:
+                old[r] = value
+
+            if in_place:
+                # One write from the first to the last changed value
+                _, null_count = SEGMENT_HEADER.unpack_from(data)
+                lo, hi = mine[0][0], mine[-1][0] + 1
+                start = offset + SEGMENT_HEADER.size + 4 * null_count + width * lo
+                writes.append((self.column_path(i), start, _pack(old[lo:hi], datatype, column), False))
+                continue
+
+            tail = tails.get(i)
+            if tail is None:
+                tail = tails[i] = Tail(self._file_size(i))
+
+            encoded = self._encode(old, i)
+            if result is pieces:
+                result = list(pieces)
+            result[p] = (tail.tell(), len(encoded), rows)
+            tail.write(encoded)
+
+        return result
+
+    def rewrite(self, records):
+        """
+        Replace the contents with the given rows. New column files are
+        written next to the old ones and swapped in.
+        """
+        if self.zonemap is not None:
+            self.zonemap.reset()
+
+        with ExitStack() as stack:
+            files = [
+                stack.enter_context(open(self.column_path(i) + ".tmp", "wb"))
+                for i in range(self.width)
+            ]
+            blocks = self._write_blocks(records, files)
+
+        save_dictionary(self.encoded)
+
+        with open(self.path + ".tmp", "wb") as f:
+            f.write(self._directory(blocks))
+
+        # Ranges may shrink, so no block is skipped until the new map is saved
+        if self.zonemap is not None:
+            self.zonemap.invalidate()
+
+        replace_files(
+            [(self.column_path(i) + ".tmp", self.column_path(i)) for i in range(self.width)]
+            + [(self.path + ".tmp", self.path)]
+        )
+        self._blocks = blocks
+        self._dead = {}
+
+        # Files of columns an ALTER TABLE dropped
+        base = self.path[:-len(".tbl")]
+        for path in glob.glob(glob.escape(base) + ".*.col"):
+            number = path[len(base) + 1:-len(".col")]
+            if number.isdigit() and int(number) >= self.width:
+                os.remove(path)
+
+        if self.zonemap is not None:
+            self.zonemap.save()
+
+    def truncate(self):
+        ColumnFile.create(self.path)
+        self._blocks = []
+        self._dead = {}
+        if self.zonemap is not None:
+            self.zonemap.reset()
+            self.zonemap.save()
+
@@ -0,0 +1,432 @@
+"""
+Block compression of table files (CREATE TABLE ... COMPRESSION = ZLIB)
+
+A compressed heap file holds the usual slotted pages, BLOCK_PAGES of
+them at a time compressed together into a block:
+
+    [file header][block 0][block 1] ... [block index][index offset]
+
+The block index at the end lists the (offset, length, page count) of
+every block, so a page is found by seeking to its block and decompressing
+only that block. Page numbers, and so rids, are the same as in an
+uncompressed heap. All blocks but the last hold BLOCK_PAGES pages;
+inserts decompress the last block, fill it up and write it again,
+together with the new blocks, in place of the old one (through the
+write-ahead log, see wal.py).
+
+DELETE and UPDATE decompress the blocks of the rows, change their pages
+as in a heap file (tombstones, records written over in place, grown rows
+appended before their tombstones) and write the blocks again after the last block (over their
+old bytes when those are at the end), followed by a new block index.
+Bytes of replaced blocks stay unused until VACUUM.
+
+Blocks are independent, so a parallel scan decompresses the blocks of
+each page range in its own worker process. A block is one zone of the
+zone map, so a range scan skips blocks without decompressing them.
+
+Column stores compress each column segment on its own instead (see
+columnfile.py). Both use zlib or lzma from the standard library.
+"""
+import io
+import os
+import lzma
+import zlib
+import pickle
+import struct
+from itertools import groupby
+from .heapfile import (
+    HeapFile,
+    FILE_HEADER,
+    FORMAT_VERSION,
+    BYTE_COUNTS,
+    BYTE_COUNTS_OFFSET,
+    PAGE_SIZE,
+    new_page,
+    page_bytes,
+    page_slots,
+    page_delete,
+    page_update,
+    slot_length,
+    place_records,
+    build_pages
+)
+from .dictionary import save_dictionary
+from .wal import write_all, replace_files
+
+MAGIC = b"MINIDB\x00Z"
+BLOCK_PAGES = 16
+INDEX_OFFSET = struct.Struct("<Q")
+
+COMPRESSIONS = {
+    "ZLIB": (zlib.compress, zlib.decompress),
+    "LZMA": (lzma.compress, lzma.decompress)
+}
+
+
+def compressor(name):
+    """(compress, decompress) functions of a COMPRESSION name"""
+    if name not in COMPRESSIONS:
+        raise Exception(f"Unsupported compression {name}")
+    return COMPRESSIONS[name]
+
+
+class CompressedHeapFile(HeapFile):
+
+    def __init__(self, path, types, encoded=None, compression="ZLIB", zonemap=None):
+        super().__init__(path, types, encoded, zonemap)
+        self.compression = compression
+        self.compress, self.decompress = compressor(compression)
+        self._blocks = None
+
+    @staticmethod
+    def create(path):
+        with open(path, "wb") as f:
+            f.write(FILE_HEADER.pack(MAGIC, FORMAT_VERSION, 0, 0))
+            _write_index(f, [])
+
+    def is_legacy(self):
+        return False
+
+    def upgrade(self):
+        """Write a version 1 file again behind the current header; rids stay"""
+        with open(self.path, "rb") as f:
+            pages = [page for _, page in self._pages(f)]
+        self._write_file(pages)
+
+    # ---------- BLOCK INDEX ----------
+
+    def _load(self):
+        """[(offset, length, page count) per block]"""
+        if self._blocks is None:
+            with open(self.path, "rb") as f:
+                if not f.read(FILE_HEADER.size).startswith(MAGIC):
+                    raise Exception(f"{self.path} is not a compressed table file")
+                f.seek(-INDEX_OFFSET.size, os.SEEK_END)
+                f.seek(INDEX_OFFSET.unpack(f.read(INDEX_OFFSET.size))[0])
+                self._blocks = pickle.load(f)
+        return self._blocks
+
+    def page_count(self):
+        return sum(pages for _, _, pages in self._load())
+
+    def stored_size(self):
+        """(compressed, uncompressed) bytes of the table's pages"""
+        blocks = self._load()
+        return sum(length for _, length, _ in blocks), self.page_count() * PAGE_SIZE
+
+    def _block(self, f, block_no):
+        """The pages of a block as one bytes object"""
+        offset, length, _ = self._load()[block_no]
+        f.seek(offset)
+        return self.decompress(f.read(length))
+
+    # ---------- READ ----------
+
+    def _pages(self, f, first=0, last=None, zones=None):
+        blocks = self._load()
+        last = self.page_count() if last is None else min(last, self.page_count())
+
+        for block_no in range(first // BLOCK_PAGES, len(blocks)):
+            start = block_no * BLOCK_PAGES
+            if start >= last:
+                return
+
+            # A skipped zone is never decompressed
+            if zones is not None and not zones(start // self.zonemap.zone_size):
+                continue
+
+            data = self._block(f, block_no)
+            for page_no in range(max(start, first), min(start + blocks[block_no][2], last)):
+                pos = (page_no - start) * PAGE_SIZE
+                yield page_no, data[pos:pos + PAGE_SIZE]
+
+    def page_batches(self, pages, zones=None):
+        """Yield the pages of whole blocks, about pages pages at a time"""
+        batch = []
+        with open(self.path, "rb") as f:
+            for block_no in range(len(self._load())):
+                if zones is not None and not zones(block_no * BLOCK_PAGES // self.zonemap.zone_size):
+                    continue
+                batch.append(self._block(f, block_no))
+                if len(batch) * BLOCK_PAGES >= pages:
+                    yield b"".join(batch)
+                    batch = []
+        if batch:
+            yield b"".join(batch)
+
+    def fetch(self, rids):
+        """Yield (rid, values) for the given rids; each block is decompressed once"""
+        blocks = self._load()
+
+        with open(self.path, "rb") as f:
+            for block_no, group in groupby(sorted(set(rids)), key=lambda rid: rid[0] // BLOCK_PAGES):
+                if block_no >= len(blocks):
+                    continue
+
+                data = self._block(f, block_no)
+                live = {}
+
+                for rid in group:
+                    pos = (rid[0] - block_no * BLOCK_PAGES) * PAGE_SIZE
+                    page = data[pos:pos + PAGE_SIZE]
+                    if rid[0] not in live:
+                        live[rid[0]] = {slot: offset for slot, offset, _ in page_slots(page)}
+                    if rid[1] in live[rid[0]]:
+                        yield rid, self.codec.decode(page, live[rid[0]][rid[1]])
+
+    # ---------- WRITE ----------
+
+    def _compressed(self, pages):
+        """Yield (compressed block, page count) for blocks of BLOCK_PAGES pages"""
+        chunk = []
+        for page in pages:
+            chunk.append(page)
+            if len(chunk) == BLOCK_PAGES:
+                yield self.compress(b"".join(chunk)), len(chunk)
+                chunk = []
+        if chunk:
+            yield self.compress(b"".join(chunk)), len(chunk)
+
+    def append(self, rows):
+        """Append rows, filling up the last block first; returns their rids"""
+        records = [self.codec.encode(vals) for vals in rows]
+        if not records:
+            return []
+
+        save_dictionary(self.codec.encoded)
+
+        blocks = list(self._load())
+
+        # The last block is decompressed and written again with the new
+        # pages, over its old bytes if nothing follows them
+        if blocks:
+            with open(self.path, "rb") as f:
+                data = self._block(f, len(blocks) - 1)
+            blocks.pop()
+            offset = _data_end(blocks)
+            pages = [bytearray(data[i:i + PAGE_SIZE]) for i in range(0, len(data), PAGE_SIZE)]
+        else:
+            offset, pages = FILE_HEADER.size, [new_page()]
+
+        first = len(blocks) * BLOCK_PAGES
+        dirty, rids = place_records(records, first + len(pages) - 1, pages[-1])
+        pages += [page for _, page in dirty[1:]]
+
+        if self.zonemap is not None:
+            for page_no, page in dirty:
+                self.zonemap.add_page(page_no, page, self.codec)
+            self.zonemap.save()
+
+        tail = Tail(offset)
+        for data, count in self._compressed(pages):
+            blocks.append((tail.tell(), len(data), count))
+            tail.write(data)
+        _write_index(tail, blocks)
+
+        write_all([
+            self._count_bytes(sum(len(record) for record in records), 0),
+            (self.path, offset, tail.getvalue(), True)
+        ])
+
+        self._blocks = blocks
+        return rids
+
+    def delete(self, rids):
+        """
+        Leave tombstones for the rows at rids; every block they are in is
+        compressed and written again. Returns the number of rows deleted.
+        """
+        blocks = list(self._load())
+        changed = {}
+        freed = 0
+        deleted = 0
+
+        with open(self.path, "rb") as f:
+            for block_no, group in groupby(sorted(set(rids)), key=lambda rid: rid[0] // BLOCK_PAGES):
+                if block_no >= len(blocks):
+                    continue
+
+                data = bytearray(self._block(f, block_no))
+                lengths = [
+                    page_delete(data, slot, (page_no - block_no * BLOCK_PAGES) * PAGE_SIZE)
+                    for page_no, slot in group
+                    if page_no < block_no * BLOCK_PAGES + blocks[block_no][2]
+                ]
+                if any(lengths):
+                    changed[block_no] = data
+                    freed += sum(lengths)
+                    deleted += sum(1 for length in lengths if length)
+
+        self._write_changed(blocks, changed, freed)
+
+        return deleted
+
+    def update(self, rows):
+        """
+        Write new values for (rid, values) rows, in place in their
+        decompressed blocks. Rows whose record grew are appended first and
+        then get a tombstone; returns {old rid: new rid} for them.
+        """
+        values = dict(rows)
+        records = {rid: self.codec.encode(vals) for rid, vals in rows}
+        save_dictionary(self.codec.encoded)
+
+        def base(rid):
+            return (rid[0] % BLOCK_PAGES) * PAGE_SIZE
+
+        def pages_of(rid):
+            """The decompressed block holding the page of rid, None if there is no such page"""
+            data = changed.get(rid[0] // BLOCK_PAGES)
+            return data if data is not None and base(rid) < len(data) else None
+
+        changed = self._read_blocks({rid[0] // BLOCK_PAGES for rid in records})
+        moved = [
+            rid for rid in sorted(records)
+            if pages_of(rid) is not None
+            and 0 < slot_length(pages_of(rid), rid[1], base(rid)) < len(records[rid])
+        ]
+
+        relocated = {}
+        if moved:
+            last = len(self._load()) - 1
+            relocated = dict(zip(moved, self.append([values[rid] for rid in moved])))
+
+            # The rows may have gone to the last of the blocks
+            if last in changed:
+                changed.update(self._read_blocks([last]))
+
+        blocks = list(self._load())
+        freed = 0
+
+        for rid in sorted(records):
+            data = pages_of(rid)
+            if data is None:
+                continue
+
+            if rid in relocated:
+                freed += page_delete(data, rid[1], base(rid))
+                continue
+
+            kept = page_update(data, rid[1], records[rid], base(rid))
+            if kept is None:
+                continue
+
+            freed += kept
+            if self.zonemap is not None:
+                self.zonemap.add_rows(rid[0] // self.zonemap.zone_size, [values[rid]])
+
+        if self.zonemap is not None:
+            self.zonemap.save()
+
+        self._write_changed(blocks, changed, freed)
+
+        return relocated
+
+    def _read_blocks(self, block_numbers):
+        """{block number: decompressed pages} for the given blocks that exist"""
+        blocks = self._load()
+        with open(self.path, "rb") as f:
+            return {
+                block_no: bytearray(self._block(f, block_no))
+                for block_no in sorted(block_numbers)
+                if block_no < len(blocks)
+            }
+
+    def _write_changed(self, blocks, changed, freed):
+        """
+        Compress the changed blocks ({block number: pages}) and write them
+        after every block that stays, followed by the block index; freed
+        bytes of records went dead
+        """
+        if not changed:
+            return
+
+        offset = _data_end([block for i, block in enumerate(blocks) if i not in changed])
+        tail = Tail(offset)
+        for block_no, data in sorted(changed.items()):
+            packed = self.compress(bytes(data))
+            blocks[block_no] = (tail.tell(), len(packed), blocks[block_no][2])
+            tail.write(packed)
+        _write_index(tail, blocks)
+
+        write_all([
+            self._count_bytes(-freed, freed),
+            (self.path, offset, tail.getvalue(), True)
+        ])
+        self._blocks = blocks
+
+    def rewrite(self, records):
+        """Replace the contents with the given encoded records (via a new file)"""
+        # Ranges may shrink, so no zone is skipped until the new map is saved
+        if self.zonemap is not None:
+            self.zonemap.reset()
+            self.zonemap.invalidate()
+
+        self._write_file(self._zoned(build_pages(records)))
+
+        if self.zonemap is not None:
+            self.zonemap.save()
+
+    def _write_file(self, pages):
+        """Compress pages into a new file and swap it in for the table's"""
+        tmp = self.path + ".tmp"
+        blocks = []
+        counts = [0, 0]
+
+        def counted(pages):
+            for page in pages:
+                live, dead = page_bytes([page])
+                counts[0] += live
+                counts[1] += dead
+                yield page
+
+        with open(tmp, "wb") as f:
+            f.write(FILE_HEADER.pack(MAGIC, FORMAT_VERSION, 0, 0))
+            for data, count in self._compressed(counted(pages)):
+                blocks.append((f.tell(), len(data), count))
+                f.write(data)
+            _write_index(f, blocks)
+            f.seek(BYTE_COUNTS_OFFSET)
+            f.write(BYTE_COUNTS.pack(*counts))
+
+        save_dictionary(self.codec.encoded)
+        replace_files([(tmp, self.path)])
+
+        self._blocks = blocks
+
+    def _zoned(self, pages):
+        """Pass pages through, adding each to the zone map"""
+        for page_no, page in enumerate(pages):
+            if self.zonemap is not None:
+                self.zonemap.add_page(page_no, page, self.codec)
+            yield page
+
+    def truncate(self):
+        CompressedHeapFile.create(self.path)
+        self._blocks = []
+        if self.zonemap is not None:
+            self.zonemap.reset()
+            self.zonemap.save()
+
+
+class Tail(io.BytesIO):
+    """Bytes to be written at offset base of a file; tell() is the file offset"""
+
+    def __init__(self, base):
+        super().__init__()
+        self.base = base
+
+    def tell(self):
+        return self.base + super().tell()
+
+
+def _data_end(blocks):
+    """Offset just past the last of the blocks in the file"""
+    return max((offset + length for offset, length, _ in blocks), default=FILE_HEADER.size)
+
+
+def _write_index(f, blocks):
+    """Write the block index and its offset at the current position"""
+    offset = f.tell()
+    pickle.dump(blocks, f, pickle.HIGHEST_PROTOCOL)
+    f.write(INDEX_OFFSET.pack(offset))
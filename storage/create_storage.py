@@ -2,24 +2,55 @@
 Storage operations for CREATE TABLE
 """
 import os
-import json
 from visualizer import print_trace, print_result
-from utils import table_paths
+from utils import table_paths, index_path
+from .indexes import PK_INDEX, build_primary_index
+from .heapfile import HeapFile
+from .columnfile import ColumnFile
+from .compression import CompressedHeapFile, COMPRESSIONS
+from .table import ENGINES
+from .dictionary import dictionary_path
+from .zonemap import zone_path
+from .bloom import bloom_path
+from .catalog import save_table, forget_table
 
 DATA_DIR = "data"
 META_DIR = "metadata"
 SUPPORTED_TYPES = ["INT", "DOUBLE", "CHAR", "VARCHAR"]
 
 
-def create_table(table, columns, primary_key=None):
+def create_table(table, columns, primary_key=None, engine=None, dictionary=None, compression=None,
+                 bloom_fp_rate=None):
     """
-    Create a new table with specified columns and optional primary key
+    Create a new table with specified columns and optional primary key,
+    stored by the given engine (HEAP unless ENGINE=COLUMNAR was given).
+    dictionary lists the CHAR / VARCHAR columns to store as dictionary
+    codes; compression (ZLIB or LZMA) stores the data in compressed blocks.
+    bloom_fp_rate is the false positive rate of the primary key's Bloom
+    filter (config.BLOOM_FP_RATE when not given).
     """
+    engine = (engine or "HEAP").upper()
+    compression = compression.upper() if compression else None
+
     tbl, meta = table_paths(table)
 
     if os.path.exists(tbl):
         raise Exception("Table already exists")
 
+    if engine not in ENGINES:
+        raise Exception(f"Unsupported engine {engine}")
+
+    if compression and compression not in COMPRESSIONS:
+        raise Exception(f"Unsupported compression {compression}")
+
+    if bloom_fp_rate is not None:
+        try:
+            bloom_fp_rate = float(bloom_fp_rate)
+        except ValueError:
+            raise Exception(f"Invalid BLOOM_FP_RATE {bloom_fp_rate}")
+        if not 0 < bloom_fp_rate < 1:
+            raise Exception("BLOOM_FP_RATE must be between 0 and 1")
+
     # datatype validation
     for name, dtype in columns:
         if dtype.upper() not in SUPPORTED_TYPES:
@@ -41,18 +72,58 @@ def create_table(table, columns, primary_key=None):
                     f"Primary Key column '{pk_col}' must be valid column"
                 )
 
-    open(tbl, "w").close()
+    types = dict(columns)
+
+    for col in dictionary or []:
+        if col not in types:
+            raise Exception(f"Dictionary column '{col}' must be valid column")
+        if types[col].upper() not in ("CHAR", "VARCHAR"):
+            raise Exception(f"Dictionary column '{col}' must be CHAR or VARCHAR")
+
+    if engine == "COLUMNAR":
+        ColumnFile.create(tbl)
+    elif compression:
+        CompressedHeapFile.create(tbl)
+    else:
+        HeapFile.create(tbl)
+
+    # A dictionary or zone map left behind by an older table of the same name
+    forget_table(table)
+    for path in (dictionary_path(table), zone_path(tbl)):
+        if os.path.exists(path):
+            os.remove(path)
+
+    metadata = {
+        "columns": columns,
+        "primary_key": primary_key,
+        "engine": engine
+    }
 
-    with open(meta, "w") as f:
-        json.dump({
-            "columns": columns,
-            "primary_key": primary_key
-        }, f)
+    if dictionary:
+        metadata["dictionary"] = list(dictionary)
 
-    print_trace("STORAGE ENGINE", [
-        f"Created Data File : {tbl}",
+    if compression:
+        metadata["compression"] = compression
+
+    if bloom_fp_rate is not None:
+        metadata["bloom_fp_rate"] = bloom_fp_rate
+
+    save_table(table, metadata)
+
+    trace = [
+        f"Created Data File : {tbl} ({engine}{', ' + compression if compression else ''})",
         f"Created Metadata : {meta}"
-    ])
+    ]
+
+    if dictionary:
+        trace.append(f"Dictionary Encoded : {', '.join(dictionary)} ({dictionary_path(table)})")
+
+    if primary_key:
+        build_primary_index(table, metadata)
+        trace.append(f"Created Index : {index_path(table, PK_INDEX)}")
+        trace.append(f"Created Bloom Filter : {bloom_path(table)}")
+
+    print_trace("STORAGE ENGINE", trace)
 
     print_trace("FILE SYSTEM", [
         f"{table}.tbl initialized"
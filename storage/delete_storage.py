@@ -1,52 +1,84 @@
 """
 Storage operations for DELETE
 """
-import json
 from visualizer import print_trace, print_result
-from utils import (
-    table_paths,
-    check_table_exists,
-    compare
-)
+from utils import table_paths, format_condition
+from .indexes import index_scan, remove_from_indexes
+from .table import open_table
+from .catalog import get_table
+from .predicates import compile_condition
+from .zonemap import zone_filter
+from .parallel import parallel_degree, parallel_rids
+from .transaction import in_transaction, queue
+from .vacuum_storage import autovacuum
 
 
 def delete_row(table, condition):
     """
     Delete rows from a table based on condition
     """
-    tbl, meta = table_paths(table)
-    check_table_exists(tbl, meta)
+    tbl, _ = table_paths(table)
 
-    metadata = json.load(open(meta))
-    columns = [c[0] for c in metadata["columns"]]
+    info = get_table(table)
+    metadata = info.metadata
 
-    cond_col, op, val = condition
-    ci = columns.index(cond_col)
+    if in_transaction():
+        matches = compile_condition(info, condition, dictionary=False) if condition else None
+        pending = queue(table, ("DELETE", matches))
 
-    new = []
-    deleted = 0
+        print_trace("STORAGE ENGINE", [
+            f"Deleting rows where {format_condition(condition)}",
+            f"Queued in transaction : {pending} change(s) pending for {table}"
+        ])
+
+        print_result("✅ DELETE Queued until COMMIT")
+        return
+
+    heap = open_table(table, metadata)
+
+    # An index narrows the search down to a few rows
+    rids, index_used, residual = index_scan(table, metadata, condition)
+
+    # Without an index the matching rows may be found by worker processes
+    workers = parallel_degree(heap) if rids is None and residual else 1
+    if workers > 1:
+        rids, residual = parallel_rids(heap, info, residual, workers), None
+
+    matches = compile_condition(info, residual) if residual else None
 
-    for row in open(tbl):
-        vals = row.strip().split(",")
+    # Zones whose value ranges cannot match are not read
+    zones = zone_filter(heap, info, residual) if rids is None else None
 
-        if compare(
-            vals[ci],
-            op,
-            val
-        ):
-            deleted += 1
-        else:
-            new.append(row)
+    source = heap.fetch(rids) if rids is not None else heap.scan(zones=zones)
+    dead = [(rid, vals) for rid, vals in source if matches is None or matches(vals)]
 
-    open(tbl, "w").writelines(new)
+    # Tombstones in place of the rows; the space is reclaimed by VACUUM
+    deleted = 0
+    if dead:
+        deleted = heap.delete([rid for rid, _ in dead])
+        remove_from_indexes(table, metadata, dead)
 
-    print_trace("STORAGE ENGINE", [
-        f"Deleting rows where {cond_col} {op} {val}",
+    trace = [
+        f"Deleting rows where {format_condition(condition)}",
+        f"Index Lookup : {index_used or 'none (full scan)'}",
         f"Rows Deleted : {deleted}"
-    ])
+    ]
+
+    if workers > 1:
+        trace.insert(2, f"Parallel Scan : {workers} workers")
+
+    if zones is not None:
+        trace.insert(2, f"Zone Map : {zones.skipped} zone(s) skipped")
+
+    if deleted:
+        trace.append(f"Dead Bytes : {heap.dead_ratio():.1%} of the stored rows, kept until VACUUM")
+        if autovacuum(table, heap):
+            trace.append("Autovacuum : table queued for background compaction")
+
+    print_trace("STORAGE ENGINE", trace)
 
     print_trace("FILE SYSTEM", [
-        f"{table}.tbl rewritten"
+        f"{table}.tbl : {deleted} row(s) marked dead in place"
     ])
 
     print_result("✅ DELETE Completed")
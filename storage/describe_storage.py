@@ -1,30 +1,34 @@
 """
 Storage operations for DESCRIBE TABLE
 """
-import json
 from visualizer import print_trace, print_result
-from utils import table_paths, check_table_exists
+from .table import open_table, table_engine
+from .dictionary import encoded_columns
+from .catalog import get_table, get_dictionary
+from .indexes import primary_bloom
 
 
 def describe_table(command):
     """Display table structure and metadata"""
     
     table = command["table"]
-    tbl, meta = table_paths(table)
-    check_table_exists(tbl, meta)
-    
-    metadata = json.load(open(meta))
+    info = get_table(table)
+    metadata = info.metadata
     columns = metadata["columns"]
     primary_key = metadata.get("primary_key")
     
     # Count rows
-    rows = open(tbl).readlines()
-    row_count = len(rows)
+    heap = open_table(table, metadata)
+    row_count = heap.count()
+    
+    engine = table_engine(metadata)
     
     print_trace("STORAGE ENGINE", [
         f"Reading metadata for table: {table}",
+        f"Engine: {engine}",
         f"Columns: {len(columns)}",
-        f"Rows: {row_count}"
+        f"Rows: {row_count}",
+        f"Blocks: {heap.page_count()}" if engine == "COLUMNAR" else f"Pages: {heap.page_count()}"
     ])
     
     # Display table structure
@@ -59,5 +63,44 @@ def describe_table(command):
     else:
         print("Primary Key: None")
     
+    bloom = primary_bloom(table, metadata)
+    if bloom is not None:
+        print(
+            f"Bloom Filter: {bloom.rate:.2%} target false positive rate, "
+            f"{bloom.estimated_rate():.2%} estimated for {bloom.keys} keys ({bloom.size()} bytes)"
+        )
+    
+    indexes = metadata.get("indexes") or {}
+    if indexes:
+        index_list = ", ".join(
+            f"{name} ({info['type']} on {info['column']})"
+            for name, info in indexes.items()
+        )
+        print(f"Indexes: {index_list}")
+    
+    encoded = encoded_columns(metadata)
+    if encoded:
+        dictionary = get_dictionary(table)
+        encoded_list = ", ".join(
+            f"{name} ({len(dictionary.column(name).values)} values)"
+            for name in encoded
+        )
+        print(f"Dictionary Encoded: {encoded_list}")
+    
+    print(f"Storage Engine: {engine}")
+    
+    compression = metadata.get("compression")
+    if compression:
+        stored, raw = heap.stored_size()
+        if raw is None:
+            print(f"Compression: {compression} ({stored} bytes stored)")
+        else:
+            ratio = f", {raw / stored:.1f}x" if stored else ""
+            print(f"Compression: {compression} ({stored} bytes stored for {raw} bytes{ratio})")
+    
+    dead = heap.dead_ratio()
+    if dead:
+        print(f"Dead Bytes: {dead:.1%} of the stored rows (reclaimed by VACUUM {table})")
+    
     print(f"Total Rows: {row_count}")
     print("=" * 80 + "\n")
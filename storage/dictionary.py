@@ -0,0 +1,127 @@
+"""
+Dictionary encoding of CHAR / VARCHAR columns
+
+Columns listed in a table's DICTIONARY (...) clause are stored as integer
+codes instead of strings. The distinct values of every such column are
+kept in one file per table:
+
+    data/<table>.dict    {"column": ["value for code 0", "code 1", ...]}
+
+A value gets the next free code the first time it is written and keeps
+it; codes are never reused while the table exists. Heap records and
+column store segments hold the 4 byte code, and decoding a row is a list
+lookup that returns the same string object every time.
+
+A comparison on an encoded column is decided once per distinct value
+(see predicates.dictionary_matches), so filters and GROUP BY compare
+codes, or the shared strings they stand for, instead of text.
+"""
+import os
+import json
+from utils import DATA_DIR
+from .wal import replace_file
+
+CODE_TYPE = "I"
+
+
+def dictionary_path(table):
+    return os.path.join(DATA_DIR, f"{table}.dict")
+
+
+def encoded_columns(metadata):
+    """Names of the dictionary encoded columns of a table"""
+    return metadata.get("dictionary") or []
+
+
+class DictionaryColumn:
+    """The values of one encoded column; a value's code is its position"""
+
+    def __init__(self, dictionary, values):
+        self.dictionary = dictionary
+        self.values = values
+        self.codes = {value: code for code, value in enumerate(values)}
+
+    def code(self, value):
+        """Code of a value, adding it to the dictionary if it is new"""
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+            self.dictionary.dirty = True
+        return code
+
+
+class Dictionary:
+    """The dictionary file of one table"""
+
+    def __init__(self, path, values, stamp=None):
+        self.path = path
+        self.stamp = stamp
+        self.dirty = False
+        self.columns = {
+            name: DictionaryColumn(self, list(column))
+            for name, column in values.items()
+        }
+
+    @staticmethod
+    def load(path):
+        if not os.path.exists(path):
+            return Dictionary(path, {})
+
+        with open(path) as f:
+            values = json.load(f)
+        return Dictionary(path, values, _stamp(path))
+
+    def column(self, name):
+        if name not in self.columns:
+            self.columns[name] = DictionaryColumn(self, [])
+        return self.columns[name]
+
+    def encoding(self, metadata):
+        """{column position: DictionaryColumn} for the encoded columns"""
+        names = [c[0] for c in metadata["columns"]]
+        return {
+            names.index(name): self.column(name)
+            for name in encoded_columns(metadata)
+            if name in names
+        }
+
+    # ---------- CHANGES ----------
+
+    def drop(self, name):
+        if self.columns.pop(name, None) is not None:
+            self.dirty = True
+
+    def rename(self, old, new):
+        if old in self.columns:
+            self.columns[new] = self.columns.pop(old)
+            self.dirty = True
+
+    def clear(self):
+        """Forget every value (TRUNCATE); open codecs see the change"""
+        for column in self.columns.values():
+            column.values.clear()
+            column.codes.clear()
+        self.dirty = True
+
+    def save(self):
+        """Write the file if values were added since it was last written"""
+        if not self.dirty:
+            return
+
+        data = json.dumps({name: c.values for name, c in self.columns.items()})
+        replace_file(self.path, data.encode())
+
+        self.stamp = _stamp(self.path)
+        self.dirty = False
+
+
+def save_dictionary(encoded):
+    """Save the dictionary behind a {position: DictionaryColumn} encoding"""
+    if encoded:
+        next(iter(encoded.values())).dictionary.save()
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
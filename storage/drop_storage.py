@@ -7,6 +7,11 @@ from utils import (
     table_paths,
     check_table_exists
 )
+from .indexes import drop_indexes
+from .catalog import forget_table
+from .columnfile import column_files
+from .dictionary import dictionary_path
+from .zonemap import zone_path
 
 
 def drop_table(table):
@@ -19,6 +24,15 @@ def drop_table(table):
     os.remove(tbl)
     os.remove(meta)
 
+    # Column files of a columnar table, value dictionary, zone map
+    for path in column_files(table):
+        os.remove(path)
+    for path in (dictionary_path(table), zone_path(tbl)):
+        if os.path.exists(path):
+            os.remove(path)
+    drop_indexes(table)
+    forget_table(table)
+
     print_trace("STORAGE ENGINE", [
         f"Deleted {tbl}",
         f"Deleted {meta}"
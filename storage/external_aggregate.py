@@ -0,0 +1,169 @@
+"""
+Hash aggregation that spills to disk
+
+Groups are aggregated in a dict while their states fit in the aggregate
+memory budget (config.AGGREGATE_MEMORY). Once it is full, the groups in
+memory keep being updated, but rows of any other group are written to
+one of FANOUT partition files in the data directory, chosen by a hash of
+the group key. Each partition is then aggregated in turn the same way,
+splitting again with a different hash if it still does not fit.
+
+A group is never split between memory and a partition, and its rows
+reach it in input order on either path, so every state is folded
+exactly as it is in memory. Groups are returned in the order they were
+first seen: the result equals the in-memory aggregation.
+
+The input can also be (key, state) pairs of partial aggregates, such as
+the parallel workers send back (merge=True): states of the same key are
+then merged instead of rows folded, under the same budget.
+"""
+import os
+import pickle
+import tempfile
+import config
+from utils import DATA_DIR
+from .aggregates import new_state, update_state, merge_state
+from .external_sort import external_sort, _size, _read_run
+
+FANOUT = 16
+PARTITION_BATCH = 1024
+
+
+class AggregateStats:
+    """How an aggregation was carried out, for the execution trace"""
+
+    def __init__(self):
+        self.groups = 0
+        self.partitions = 0
+
+
+class _Partition:
+    """A partition file that (seq, row) entries are appended to"""
+
+    def __init__(self):
+        fd, self.path = tempfile.mkstemp(prefix="agg-", suffix=".part", dir=DATA_DIR)
+        self.file = os.fdopen(fd, "wb")
+        self.buffer = []
+        self.count = 0
+
+    def add(self, entry):
+        self.buffer.append(entry)
+        self.count += 1
+        if len(self.buffer) >= PARTITION_BATCH:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            pickle.dump(self.buffer, self.file, pickle.HIGHEST_PROTOCOL)
+            self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def _remove(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# ===================================
+# AGGREGATION
+# ===================================
+
+def _aggregate_pass(entries, group_key, aggregates, memory, depth, spilled, merge):
+    """
+    Fold (seq, row) entries into groups until the budget is used up, then
+    send the rows of groups not in memory to partition files.
+
+    Returns {key: (first seq, state)}; the paths of the partitions written
+    are appended to spilled as (path, depth).
+    """
+    groups = {}
+    used = 0
+    partitions = None
+    state_size = 32 + 40 * len(aggregates)
+
+    for seq, row in entries:
+        key = group_key(row)
+        entry = groups.get(key)
+
+        if entry is None:
+            size = _size(key) + state_size
+
+            # Past the budget new groups go to disk; the first group of a
+            # pass is always kept so every pass makes progress
+            if partitions is None and used + size > memory and groups:
+                partitions = [_Partition() for _ in range(FANOUT)]
+                spilled.extend((p.path, depth + 1) for p in partitions)
+
+            if partitions is not None:
+                partitions[hash((depth, key)) % FANOUT].add((seq, row))
+                continue
+
+            entry = groups[key] = (seq, new_state(aggregates))
+            used += size
+
+        if merge:
+            merge_state(entry[1], row[1], aggregates)
+        else:
+            update_state(entry[1], aggregates, row)
+
+    if partitions is not None:
+        for p in partitions:
+            p.close()
+            if not p.count:
+                spilled.remove((p.path, depth + 1))
+                os.remove(p.path)
+
+    return groups
+
+
+def external_aggregate(rows, group_key, aggregates, memory=None, stats=None, merge=False):
+    """
+    Aggregate rows per group_key(row), spilling to disk past the memory
+    budget. Yields (key, state) pairs in the order the groups were first
+    seen. With merge, rows are (key, state) pairs whose states are merged.
+    """
+    if memory is None:
+        memory = config.get_aggregate_memory()
+
+    spilled = []   # (path, depth) of partitions still to aggregate
+
+    try:
+        groups = _aggregate_pass(enumerate(rows), group_key, aggregates, memory, 0, spilled, merge)
+
+        if not spilled:
+            if stats is not None:
+                stats.groups = len(groups)
+            for key, (_, state) in groups.items():
+                yield key, state
+            return
+
+        def results():
+            yield from ((seq, key, state) for key, (seq, state) in groups.items())
+
+            while spilled:
+                path, depth = spilled.pop()
+                try:
+                    part = _aggregate_pass(_read_run(path), group_key, aggregates, memory, depth, spilled, merge)
+                finally:
+                    os.remove(path)
+
+                if stats is not None:
+                    stats.partitions += 1
+
+                yield from ((seq, key, state) for key, (seq, state) in part.items())
+
+        # Put the groups back in first-seen order
+        count = 0
+        for _, key, state in external_sort(results(), key=lambda e: e[0]):
+            count += 1
+            yield key, state
+
+        if stats is not None:
+            stats.groups = count
+
+    finally:
+        _remove(path for path, _ in spilled)
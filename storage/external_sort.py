@@ -0,0 +1,152 @@
+"""
+External merge sort
+
+Items are collected until their estimated size reaches the sort memory
+budget (config.SORT_MEMORY). A full buffer is sorted and written to a
+run file in the data directory, and at the end the runs are merged with
+a k-way heap merge that reads each run back in small batches. Inputs
+that fit in the budget are sorted in memory without touching the disk.
+
+The result equals a stable sorted(items, key=key, reverse=reverse).
+"""
+import os
+import heapq
+import pickle
+import tempfile
+import config
+from utils import DATA_DIR
+
+RUN_BATCH = 1024
+
+
+class SortStats:
+    """How a sort was carried out, for the execution trace"""
+
+    def __init__(self):
+        self.runs = 0
+
+
+def _size(value):
+    """Rough in-memory size of a row or key, in bytes"""
+    if isinstance(value, (list, tuple)):
+        return 56 + 8 * len(value) + sum(_size(v) for v in value)
+    if isinstance(value, str):
+        return 49 + len(value)
+    return 32
+
+
+# ===================================
+# RUN FILES
+# ===================================
+
+def _write_run(entries):
+    fd, path = tempfile.mkstemp(prefix="sort-", suffix=".run", dir=DATA_DIR)
+    with os.fdopen(fd, "wb") as f:
+        for i in range(0, len(entries), RUN_BATCH):
+            pickle.dump(entries[i:i + RUN_BATCH], f, pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _read_run(path):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                return
+            yield from batch
+
+
+def _remove_runs(runs):
+    for path, _ in runs:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# ===================================
+# SORT
+# ===================================
+
+def _sort_entries(entries, key, reverse):
+    # entries are (seq, item) and already in seq order, so a stable sort
+    # on the item key keeps equal items in input order
+    entries.sort(key=lambda e: key(e[1]), reverse=reverse)
+
+
+def external_sort(items, key, reverse=False, fallback=None, memory=None, stats=None):
+    """
+    Sort items by key, spilling to disk when they do not fit in memory.
+
+    If key raises ValueError for some item, every item is sorted by the
+    fallback key instead, as if the fallback had been used from the start.
+
+    Returns a list when the input fit in memory, otherwise a generator
+    that merges the runs and removes them when it is done.
+    """
+    if memory is None:
+        memory = config.get_sort_memory()
+
+    runs = []   # (path, key the run is sorted by)
+    buffer = []
+    used = 0
+
+    def sort_buffer():
+        nonlocal key, fallback
+        try:
+            _sort_entries(buffer, key, reverse)
+        except ValueError:
+            if fallback is None:
+                raise
+            key, fallback = fallback, None
+            _sort_entries(buffer, key, reverse)
+
+    try:
+        for seq, item in enumerate(items):
+            buffer.append((seq, item))
+            used += _size(item)
+
+            if used > memory:
+                sort_buffer()
+                runs.append((_write_run(buffer), key))
+                buffer, used = [], 0
+
+        sort_buffer()
+
+        if not runs:
+            return [item for _, item in buffer]
+
+        if buffer:
+            runs.append((_write_run(buffer), key))
+
+        if stats is not None:
+            stats.runs = len(runs)
+
+        # Runs written before a switch to the fallback key are re-sorted;
+        # each one fit in memory when it was written
+        for i, (path, run_key) in enumerate(runs):
+            if run_key is not key:
+                entries = sorted(_read_run(path), key=lambda e: e[0])
+                _sort_entries(entries, key, reverse)
+                os.remove(path)
+                runs[i] = (_write_run(entries), key)
+
+    except BaseException:
+        _remove_runs(runs)
+        raise
+
+    return _merge_runs(runs, key, reverse)
+
+
+def _merge_runs(runs, key, reverse):
+    # Ties are broken by input position, ascending in both directions
+    if reverse:
+        merge_key = lambda e: (key(e[1]), -e[0])
+    else:
+        merge_key = lambda e: (key(e[1]), e[0])
+
+    try:
+        streams = [_read_run(path) for path, _ in runs]
+        for _, item in heapq.merge(*streams, key=merge_key, reverse=reverse):
+            yield item
+    finally:
+        _remove_runs(runs)
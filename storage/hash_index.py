@@ -0,0 +1,191 @@
+"""
+On-disk hash index used for equality lookups
+
+Page 0 holds the header, pages 1..n are the primary bucket pages and any
+further pages are overflow pages chained from a bucket. Each entry is a
+(key, row location) pair, so the same key may appear many times.
+
+When the average bucket holds more than BUCKET_LOAD entries the number of
+buckets is doubled and every entry is rehashed.
+"""
+import zlib
+from .pager import PageFile, PAGE_SIZE
+
+INITIAL_BUCKETS = 8
+BUCKET_LOAD = 64
+FILL_FACTOR = 0.9
+
+# Largest page number a bucket page may link to (pickled the widest)
+MAX_LINK = 2 ** 31 - 1
+
+
+def _normalize(part):
+    # 5 and 5.0 are the same key and must land in the same bucket
+    if isinstance(part, float) and part.is_integer():
+        return int(part)
+    if isinstance(part, tuple):
+        return tuple(_normalize(p) for p in part)
+    return part
+
+
+def stable_hash(key):
+    """Hash that does not change between runs (unlike hash() on str)"""
+    return zlib.crc32(repr(_normalize(key)).encode())
+
+
+class HashIndex:
+
+    def __init__(self, path):
+        self.path = path
+        self.pages = PageFile(path)
+        self.cache = {}
+        self.dirty = set()
+
+        if self.pages.is_new:
+            self._reset(INITIAL_BUCKETS)
+        else:
+            header = self.pages.read(0)
+            self.buckets = header["buckets"]
+            self.count = header["count"]
+            self.num_pages = header["pages"]
+
+    # ===================================
+    # PAGE I/O
+    # ===================================
+
+    def _page(self, page_no):
+        page = self.cache.get(page_no)
+        if page is None:
+            page = self.pages.read(page_no)
+            self.cache[page_no] = page
+        return page
+
+    def _reset(self, buckets):
+        self.pages.truncate()
+        self.cache = {}
+        self.dirty = set()
+        self.buckets = buckets
+        self.count = 0
+        self.num_pages = buckets + 1
+        for page_no in range(1, buckets + 1):
+            self.cache[page_no] = {"entries": [], "next": None}
+            self.dirty.add(page_no)
+
+    def _bucket_page(self, key):
+        return 1 + stable_hash(key) % self.buckets
+
+    def flush(self):
+        for page_no in sorted(self.dirty):
+            self.pages.write(page_no, self.cache[page_no])
+        self.pages.write(0, {
+            "buckets": self.buckets,
+            "count": self.count,
+            "pages": self.num_pages
+        })
+        self.dirty = set()
+        self.pages.flush()
+
+    def close(self):
+        self.flush()
+        self.pages.close()
+
+    # ===================================
+    # OPERATIONS
+    # ===================================
+
+    def search(self, key):
+        """Return the row locations stored under key"""
+        found = []
+        page_no = self._bucket_page(key)
+        while page_no is not None:
+            page = self._page(page_no)
+            found.extend(loc for k, loc in page["entries"] if k == key)
+            page_no = page["next"]
+        return found
+
+    def insert(self, key, location):
+        page_no = self._bucket_page(key)
+        page = self._page(page_no)
+
+        # walk to the last page of the chain
+        while page["next"] is not None:
+            page_no = page["next"]
+            page = self._page(page_no)
+
+        page["entries"].append((key, location))
+
+        # Measured with a link to an overflow page, so that one can still
+        # be added to a page that is full
+        page["next"] = MAX_LINK
+        fits = self.pages.fits_after(page_no, page, (key, location))
+        page["next"] = None
+
+        if not fits:
+            page["entries"].pop()
+            self.pages.forget_size(page_no)
+            new_no = self.num_pages
+            self.num_pages += 1
+            self.cache[new_no] = {"entries": [(key, location)], "next": None}
+            self.dirty.add(new_no)
+            page["next"] = new_no
+
+        self.dirty.add(page_no)
+        self.count += 1
+
+        if self.count > self.buckets * BUCKET_LOAD:
+            self.bulk_load(list(self.items()), self.buckets * 2)
+
+    def delete(self, key, location):
+        page_no = self._bucket_page(key)
+        while page_no is not None:
+            page = self._page(page_no)
+            if (key, location) in page["entries"]:
+                page["entries"].remove((key, location))
+                self.dirty.add(page_no)
+                self.count -= 1
+                return True
+            page_no = page["next"]
+        return False
+
+    def items(self):
+        """Yield every (key, location) entry"""
+        for bucket in range(1, self.buckets + 1):
+            page_no = bucket
+            while page_no is not None:
+                page = self._page(page_no)
+                yield from page["entries"]
+                page_no = page["next"]
+
+    def clear(self):
+        self._reset(INITIAL_BUCKETS)
+        self.flush()
+
+    def bulk_load(self, entries, buckets=None):
+        """Replace the index contents with entries"""
+        if buckets is None:
+            buckets = INITIAL_BUCKETS
+            while len(entries) > buckets * BUCKET_LOAD:
+                buckets *= 2
+
+        self._reset(buckets)
+        tails = {}
+        budget = PAGE_SIZE * FILL_FACTOR
+
+        for key, location in entries:
+            bucket = self._bucket_page(key)
+            page_no, size = tails.get(bucket, (bucket, 64))
+            entry_size = self.pages.entry_size((key, location))
+
+            if size + entry_size > budget:
+                new_no = self.num_pages
+                self.num_pages += 1
+                self.cache[new_no] = {"entries": [], "next": None}
+                self.dirty.add(new_no)
+                self.cache[page_no]["next"] = new_no
+                page_no, size = new_no, 64
+
+            self.cache[page_no]["entries"].append((key, location))
+            tails[bucket] = (page_no, size + entry_size)
+
+        self.count = len(entries)
+        self.flush()
@@ -0,0 +1,592 @@
+"""
+Binary heap file with slotted pages
+
+Layout of a .tbl file:
+
+    [file header][page 0][page 1] ...
+
+The 32 byte file header holds a magic string, the format version and
+two byte counts: of the live records and of the dead ones.
+Every page is PAGE_SIZE bytes:
+
+    [page header][slot 0][slot 1] ... free space ... [record 1][record 0]
+
+The page header is (lsn, slot count, start of the record area) and each
+slot is (record offset, record length). A slot with length 0 is empty.
+
+DELETE leaves a tombstone: the slot's length is set to 0 in place and
+the record bytes stay where they are, so removing a row writes one slot
+array and every scan skips it like any empty slot. UPDATE writes a new
+record over the old one when it is no longer, and only a row that grew
+moves: the row is appended and then its old slot gets a tombstone. The dead
+byte count covers dead records (and the tail a shorter record leaves);
+VACUUM (a rewrite) reclaims them. Version 1 files, whose 16 byte header
+had only the dead bytes, are upgraded on first access.
+
+A record is a flags byte, a null bitmap, the fixed-size part of the row
+(INT as 8 byte integers, DOUBLE as 8 byte floats and a 2 byte length for
+each CHAR/VARCHAR) and then the UTF-8 bytes of the strings, so a row is
+decoded with one struct call instead of splitting and re-parsing text.
+Dictionary encoded columns (see dictionary.py) store a 4 byte code in
+the fixed-size part and nothing after it.
+
+Rows are addressed by their (page number, slot number).
+
+A heap may keep a zone map (see zonemap.py) of the value ranges of every
+run of pages; scans given a zone filter skip the runs it rules out.
+
+Pages written in place go through the write-ahead log (see wal.py).
+"""
+import os
+import struct
+from itertools import groupby
+from .dictionary import CODE_TYPE, save_dictionary
+from .wal import write_all, replace_files
+
+MAGIC = b"MINIDB\x00H"
+FORMAT_VERSION = 2
+FILE_HEADER = struct.Struct("<8sH6xQQ")    # magic, version, live bytes, dead bytes
+BYTE_COUNTS = struct.Struct("<QQ")
+BYTE_COUNTS_OFFSET = 16
+V1_HEADER_SIZE = 16
+
+PAGE_SIZE = 4096
+PAGE_HEADER = struct.Struct("<QHH")
+SLOT = struct.Struct("<HH")
+MAX_RECORD = PAGE_SIZE - PAGE_HEADER.size - SLOT.size
+
+NUMERIC_TYPES = ["INT", "DOUBLE"]
+
+
+# ===================================
+# RECORDS
+# ===================================
+
+class RecordCodec:
+    """
+    Encodes rows of typed values (int, float, str, None) into records.
+    encoded maps the positions of dictionary encoded columns to their
+    DictionaryColumn.
+    """
+
+    def __init__(self, types, encoded=None):
+        self.types = [t.upper() for t in types]
+        self.encoded = encoded or {}
+        self.null_bytes = (len(self.types) + 7) // 8
+        self.no_nulls = bytes(self.null_bytes)
+        self.strings = [
+            i for i, t in enumerate(self.types)
+            if t not in NUMERIC_TYPES and i not in self.encoded
+        ]
+        self.lookups = [(i, column.values) for i, column in sorted(self.encoded.items())]
+
+        codes = "".join(
+            CODE_TYPE if i in self.encoded else "q" if t == "INT" else "d" if t == "DOUBLE" else "H"
+            for i, t in enumerate(self.types)
+        )
+        self.fixed = struct.Struct(f"<B{self.null_bytes}s{codes}")
+
+    def encode(self, vals, flags=0):
+        nulls = 0
+        fixed = []
+        tail = []
+
+        for i, (value, datatype) in enumerate(zip(vals, self.types)):
+            if value is None:
+                nulls |= 1 << i
+                fixed.append(0)
+            elif datatype in NUMERIC_TYPES:
+                fixed.append(value)
+            elif i in self.encoded:
+                fixed.append(self.encoded[i].code(value))
+            else:
+                data = value.encode()
+                fixed.append(len(data))
+                tail.append(data)
+
+        try:
+            head = self.fixed.pack(flags, nulls.to_bytes(self.null_bytes, "little"), *fixed)
+        except struct.error:
+            raise Exception(f"Value out of range for column type in row {vals}")
+
+        record = head + b"".join(tail)
+        if len(record) > MAX_RECORD:
+            raise Exception(f"Row too large for a {PAGE_SIZE} byte page")
+        return record
+
+    def decode(self, buf, offset=0):
+        parts = self.fixed.unpack_from(buf, offset)
+        vals = list(parts[2:])
+
+        pos = offset + self.fixed.size
+        for i in self.strings:
+            length = vals[i]
+            vals[i] = buf[pos:pos + length].decode()
+            pos += length
+
+        if parts[1] != self.no_nulls:
+            bits = int.from_bytes(parts[1], "little")
+            for i in range(len(vals)):
+                if bits >> i & 1:
+                    vals[i] = None
+
+        for i, values in self.lookups:
+            code = vals[i]
+            if code is not None:
+                vals[i] = values[code]
+
+        return vals
+
+
+# ===================================
+# PAGES
+# ===================================
+
+def new_page():
+    page = bytearray(PAGE_SIZE)
+    PAGE_HEADER.pack_into(page, 0, 0, 0, PAGE_SIZE)
+    return page
+
+
+def page_insert(page, record):
+    """Add a record to a page; returns the slot number or None if it is full"""
+    lsn, count, start = PAGE_HEADER.unpack_from(page)
+    if start - len(record) < PAGE_HEADER.size + (count + 1) * SLOT.size:
+        return None
+
+    start -= len(record)
+    page[start:start + len(record)] = record
+    SLOT.pack_into(page, PAGE_HEADER.size + count * SLOT.size, start, len(record))
+    PAGE_HEADER.pack_into(page, 0, lsn, count + 1, start)
+    return count
+
+
+def page_slots(page):
+    """Yield (slot number, record offset, record length) for live slots"""
+    count = PAGE_HEADER.unpack_from(page)[1]
+    for slot in range(count):
+        offset, length = SLOT.unpack_from(page, PAGE_HEADER.size + slot * SLOT.size)
+        if length:
+            yield slot, offset, length
+
+
+def page_delete(page, slot, base=0):
+    """
+    Turn a slot of the page at base into a tombstone; returns the length
+    of the record it held, 0 if it was empty already
+    """
+    count = PAGE_HEADER.unpack_from(page, base)[1]
+    if slot >= count:
+        return 0
+
+    pos = base + PAGE_HEADER.size + slot * SLOT.size
+    offset, length = SLOT.unpack_from(page, pos)
+    if length:
+        SLOT.pack_into(page, pos, offset, 0)
+    return length
+
+
+def slot_length(page, slot, base=0):
+    """Length of the record in a slot of the page at base, 0 if there is none"""
+    if slot >= PAGE_HEADER.unpack_from(page, base)[1]:
+        return 0
+    return SLOT.unpack_from(page, base + PAGE_HEADER.size + slot * SLOT.size)[1]
+
+
+def page_update(page, slot, record, base=0):
+    """
+    Write record over the record of a slot of the page at base when it
+    fits; returns the bytes this frees, None if it does not fit or the
+    slot is empty
+    """
+    count = PAGE_HEADER.unpack_from(page, base)[1]
+    if slot >= count:
+        return None
+
+    pos = base + PAGE_HEADER.size + slot * SLOT.size
+    offset, length = SLOT.unpack_from(page, pos)
+    if not length or len(record) > length:
+        return None
+
+    start = base + offset
+    page[start:start + len(record)] = record
+    SLOT.pack_into(page, pos, offset, len(record))
+    return length - len(record)
+
+
+def page_bytes(pages):
+    """(live, dead) record bytes of pages: dead bytes are tombstones and unused tails"""
+    live = used = 0
+    for page in pages:
+        live += sum(length for _, _, length in page_slots(page))
+        used += PAGE_SIZE - PAGE_HEADER.unpack_from(page)[2]
+    return live, used - live
+
+
+def page_offset(page_no):
+    return FILE_HEADER.size + page_no * PAGE_SIZE
+
+
+def place_records(records, page_no, page):
+    """
+    Insert records into page (number page_no) and new pages after it.
+    Returns the pages that changed as (page number, page) and the rids.
+    """
+    dirty = [(page_no, page)]
+    rids = []
+
+    for record in records:
+        slot = page_insert(page, record)
+        if slot is None:
+            page_no, page = page_no + 1, new_page()
+            dirty.append((page_no, page))
+            slot = page_insert(page, record)
+        rids.append((page_no, slot))
+
+    return dirty, rids
+
+
+def build_pages(records):
+    """Yield full pages holding the records, in order"""
+    page = new_page()
+    for record in records:
+        if page_insert(page, record) is None:
+            yield page
+            page = new_page()
+            page_insert(page, record)
+    if PAGE_HEADER.unpack_from(page)[1]:
+        yield page
+
+
+# ===================================
+# HEAP FILE
+# ===================================
+
+class HeapFile:
+
+    ENGINE = "HEAP"
+
+    def __init__(self, path, types, encoded=None, zonemap=None):
+        self.path = path
+        self.codec = RecordCodec(types, encoded)
+        self.zonemap = zonemap
+
+    @staticmethod
+    def create(path):
+        with open(path, "wb") as f:
+            f.write(FILE_HEADER.pack(MAGIC, FORMAT_VERSION, 0, 0))
+
+    def is_legacy(self):
+        """True for tables still stored as comma separated text"""
+        with open(self.path, "rb") as f:
+            head = f.read(FILE_HEADER.size)
+        return bool(head) and not head.startswith(MAGIC)
+
+    def is_outdated(self):
+        """True for binary files of an older format version"""
+        with open(self.path, "rb") as f:
+            head = f.read(V1_HEADER_SIZE)
+        return len(head) == V1_HEADER_SIZE and struct.unpack_from("<H", head, 8)[0] < FORMAT_VERSION
+
+    def upgrade(self):
+        """
+        Copy a version 1 file behind the current header, counting its live
+        and dead record bytes; pages, and so rids, stay as they are
+        """
+        with open(self.path, "rb") as f:
+            f.seek(V1_HEADER_SIZE)
+            pages = [page for page in iter(lambda: f.read(PAGE_SIZE), b"") if len(page) == PAGE_SIZE]
+
+        tmp = self.path + ".tmp"
+        live, dead = page_bytes(pages)
+        with open(tmp, "wb") as f:
+            f.write(FILE_HEADER.pack(MAGIC, FORMAT_VERSION, live, dead))
+            for page in pages:
+                f.write(page)
+        replace_files([(tmp, self.path)])
+
+    def page_count(self):
+        return max(0, (os.path.getsize(self.path) - FILE_HEADER.size) // PAGE_SIZE)
+
+    def _pages(self, f, first=0, last=None, zones=None):
+        f.seek(page_offset(first))
+        page_no = first
+        while last is None or page_no < last:
+            if zones is not None and (page_no == first or page_no % self.zonemap.zone_size == 0):
+                zone_no = page_no // self.zonemap.zone_size
+                if not zones(zone_no):
+                    page_no = (zone_no + 1) * self.zonemap.zone_size
+                    f.seek(page_offset(page_no))
+                    continue
+            page = f.read(PAGE_SIZE)
+            if len(page) < PAGE_SIZE:
+                return
+            yield page_no, page
+            page_no += 1
+
+    # ---------- READ ----------
+
+    def page_batches(self, pages, zones=None):
+        """
+        Yield the bytes of up to pages whole pages at a time, leaving out
+        the zones a zone filter rules out
+        """
+        if zones is not None:
+            batch = []
+            with open(self.path, "rb") as f:
+                for _, page in self._pages(f, zones=zones):
+                    batch.append(page)
+                    if len(batch) == pages:
+                        yield b"".join(batch)
+                        batch = []
+            if batch:
+                yield b"".join(batch)
+            return
+
+        with open(self.path, "rb") as f:
+            f.seek(FILE_HEADER.size)
+            while True:
+                data = f.read(PAGE_SIZE * pages)
+                if len(data) < PAGE_SIZE:
+                    return
+                yield data[:len(data) // PAGE_SIZE * PAGE_SIZE]
+
+    def scan(self, first=0, last=None, zones=None):
+        """
+        Yield (rid, values) for every row, or for pages first to last - 1,
+        skipping the zones a zone filter rules out
+        """
+        decode = self.codec.decode
+        with open(self.path, "rb") as f:
+            for page_no, page in self._pages(f, first, last, zones):
+                for slot, offset, _ in page_slots(page):
+                    yield (page_no, slot), decode(page, offset)
+
+    def scan_records(self):
+        """Yield (rid, encoded record) without decoding"""
+        with open(self.path, "rb") as f:
+            for page_no, page in self._pages(f):
+                for slot, offset, length in page_slots(page):
+                    yield (page_no, slot), page[offset:offset + length]
+
+    def fetch(self, rids):
+        """Yield (rid, values) for the given rids in storage order"""
+        page_no, page = None, None
+        with open(self.path, "rb") as f:
+            for rid in sorted(set(rids)):
+                if rid[0] != page_no:
+                    page_no = rid[0]
+                    f.seek(page_offset(page_no))
+                    page = f.read(PAGE_SIZE)
+                count = PAGE_HEADER.unpack_from(page)[1]
+                if rid[1] >= count:
+                    continue
+                offset, length = SLOT.unpack_from(page, PAGE_HEADER.size + rid[1] * SLOT.size)
+                if length:
+                    yield rid, self.codec.decode(page, offset)
+
+    def count(self):
+        with open(self.path, "rb") as f:
+            return sum(
+                sum(1 for _ in page_slots(page))
+                for _, page in self._pages(f)
+            )
+
+    # ---------- WRITE ----------
+
+    def append(self, rows):
+        """Append rows to the end of the heap; returns their rids"""
+        records = [self.codec.encode(vals) for vals in rows]
+        rids = []
+        if not records:
+            return rids
+
+        # New dictionary codes are on disk before any record using them
+        save_dictionary(self.codec.encoded)
+
+        page_no = self.page_count() - 1
+        if page_no >= 0:
+            with open(self.path, "rb") as f:
+                f.seek(page_offset(page_no))
+                page = bytearray(f.read(PAGE_SIZE))
+        else:
+            page_no, page = 0, new_page()
+
+        dirty, rids = place_records(records, page_no, page)
+
+        # The zones cover the new rows before the rows are written
+        if self.zonemap is not None:
+            for page_no, page in dirty:
+                self.zonemap.add_page(page_no, page, self.codec)
+            self.zonemap.save()
+
+        write_all([
+            (self.path, page_offset(dirty[0][0]), b"".join(p for _, p in dirty), False),
+            self._count_bytes(sum(len(record) for record in records), 0)
+        ])
+
+        return rids
+
+    def rewrite(self, records):
+        """
+        Replace the contents with the given encoded records. The new file is
+        written next to the old one and swapped in, so a failure part way
+        through leaves the table untouched.
+        """
+        if self.zonemap is not None:
+            self.zonemap.reset()
+
+        tmp = self.path + ".tmp"
+        live = 0
+        with open(tmp, "wb") as f:
+            f.write(FILE_HEADER.pack(MAGIC, FORMAT_VERSION, 0, 0))
+            for page_no, page in enumerate(build_pages(records)):
+                f.write(page)
+                live += page_bytes([page])[0]
+                if self.zonemap is not None:
+                    self.zonemap.add_page(page_no, page, self.codec)
+            f.seek(BYTE_COUNTS_OFFSET)
+            f.write(BYTE_COUNTS.pack(live, 0))
+        save_dictionary(self.codec.encoded)
+
+        # Ranges may shrink, so no zone is skipped until the new map is saved
+        if self.zonemap is not None:
+            self.zonemap.invalidate()
+        replace_files([(tmp, self.path)])
+        if self.zonemap is not None:
+            self.zonemap.save()
+
+    def delete(self, rids):
+        """
+        Leave tombstones for the rows at rids: one write of the slot array
+        of every page they are on. Returns the number of rows deleted.
+        """
+        writes = []
+        freed = 0
+        deleted = 0
+
+        with open(self.path, "rb") as f:
+            for page_no, group in groupby(sorted(set(rids)), key=lambda rid: rid[0]):
+                f.seek(page_offset(page_no))
+                page = bytearray(f.read(PAGE_SIZE))
+                if len(page) < PAGE_SIZE:
+                    continue
+
+                lengths = [page_delete(page, slot) for _, slot in group]
+                if not any(lengths):
+                    continue
+
+                freed += sum(lengths)
+                deleted += sum(1 for length in lengths if length)
+
+                end = PAGE_HEADER.size + PAGE_HEADER.unpack_from(page)[1] * SLOT.size
+                writes.append((self.path, page_offset(page_no) + PAGE_HEADER.size, page[PAGE_HEADER.size:end], False))
+
+        if writes:
+            write_all(writes + [self._count_bytes(-freed, freed)])
+
+        return deleted
+
+    def update(self, rows):
+        """
+        Write new values for (rid, values) rows in place: one write of
+        every page they are on. Rows whose record grew are appended first
+        and then get a tombstone, so a crash in between loses no row;
+        returns {old rid: new rid} for them.
+        """
+        values = dict(rows)
+        records = {rid: self.codec.encode(vals) for rid, vals in rows}
+        save_dictionary(self.codec.encoded)
+
+        pages = self._read_pages({rid[0] for rid in records})
+        moved = [
+            rid for rid in sorted(records)
+            if rid[0] in pages and 0 < slot_length(pages[rid[0]], rid[1]) < len(records[rid])
+        ]
+
+        relocated = {}
+        if moved:
+            last = self.page_count() - 1
+            relocated = dict(zip(moved, self.append([values[rid] for rid in moved])))
+
+            # The rows may have gone to the last of the pages
+            if last in pages:
+                pages.update(self._read_pages([last]))
+
+        writes = []
+        freed = 0
+
+        for page_no, group in groupby(sorted(records), key=lambda rid: rid[0]):
+            page = pages.get(page_no)
+            if page is None:
+                continue
+
+            for rid in group:
+                if rid in relocated:
+                    freed += page_delete(page, rid[1])
+                    continue
+
+                kept = page_update(page, rid[1], records[rid])
+                if kept is None:
+                    continue
+
+                freed += kept
+                if self.zonemap is not None:
+                    self.zonemap.add_rows(page_no // self.zonemap.zone_size, [values[rid]])
+
+            writes.append((self.path, page_offset(page_no), page, False))
+
+        if self.zonemap is not None:
+            self.zonemap.save()
+
+        if writes:
+            write_all(writes + [self._count_bytes(-freed, freed)])
+
+        return relocated
+
+    def _read_pages(self, page_numbers):
+        """{page number: page} for the given pages that exist"""
+        pages = {}
+        with open(self.path, "rb") as f:
+            for page_no in sorted(page_numbers):
+                f.seek(page_offset(page_no))
+                page = bytearray(f.read(PAGE_SIZE))
+                if len(page) == PAGE_SIZE:
+                    pages[page_no] = page
+        return pages
+
+    # ---------- DEAD SPACE ----------
+
+    def byte_counts(self):
+        """
+        (live, dead): bytes of the records in use, and of those deleted or
+        replaced since the file was last rewritten
+        """
+        with open(self.path, "rb") as f:
+            return BYTE_COUNTS.unpack_from(f.read(FILE_HEADER.size), BYTE_COUNTS_OFFSET)
+
+    def _count_bytes(self, live, dead):
+        """The write (for write_all) that adds to the byte counts in the file header"""
+        old_live, old_dead = self.byte_counts()
+        return self.path, BYTE_COUNTS_OFFSET, BYTE_COUNTS.pack(old_live + live, old_dead + dead), False
+
+    def dead_ratio(self):
+        """Share of the table's record bytes held by dead records"""
+        live, dead = self.byte_counts()
+        return dead / (live + dead) if dead else 0.0
+
+    def truncate(self):
+        HeapFile.create(self.path)
+        if self.zonemap is not None:
+            self.zonemap.reset()
+            self.zonemap.save()
+
+    def convert_legacy(self, parse):
+        """Rewrite a comma separated text table in the binary format"""
+        with open(self.path) as f:
+            lines = [line.strip() for line in f if line.strip()]
+
+        self.rewrite(
+            self.codec.encode([parse(value, i) for i, value in enumerate(line.split(","))])
+            for line in lines
+        )
@@ -0,0 +1,95 @@
+"""
+Storage operations for CREATE INDEX and DROP INDEX
+"""
+import os
+from visualizer import print_trace, print_result
+from utils import table_paths, index_path, META_DIR
+from .indexes import PK_INDEX, build_index, drop_index_file, secondary_indexes
+from .catalog import get_table, save_table
+
+
+def create_index(table, index_name, column, index_type="BTREE"):
+    """
+    Build a secondary index on one column and record it in the metadata
+    """
+    tbl, _ = table_paths(table)
+
+    info = get_table(table)
+    metadata = info.editable()
+
+    if column not in info.positions:
+        raise Exception(f"Column {column} does not exist")
+
+    if index_name.lower() == PK_INDEX:
+        raise Exception(f"Index name '{index_name}' is reserved")
+
+    indexes = secondary_indexes(metadata)
+
+    if index_name in indexes:
+        raise Exception(f"Index {index_name} already exists")
+
+    indexes[index_name] = {
+        "column": column,
+        "type": index_type
+    }
+    metadata["indexes"] = indexes
+
+    build_index(table, metadata, index_name)
+
+    save_table(table, metadata)
+
+    print_trace("STORAGE ENGINE", [
+        f"Index Type : {index_type}",
+        f"Indexed Column : {table}.{column}",
+        f"Built From : {tbl}"
+    ])
+
+    print_trace("FILE SYSTEM", [
+        f"Created {index_path(table, index_name)}"
+    ])
+
+    print_result(f"✅ Index {index_name} Created")
+
+
+def drop_index(index_name, table=None):
+    """
+    Remove a secondary index. Without a table name every table is searched.
+    """
+    if table is None:
+        owners = []
+        for f in sorted(os.listdir(META_DIR)):
+            if f.endswith(".meta"):
+                name = f[:-len(".meta")]
+                if index_name in secondary_indexes(get_table(name).metadata):
+                    owners.append(name)
+
+        if not owners:
+            raise Exception(f"Index {index_name} does not exist")
+        if len(owners) > 1:
+            raise Exception(
+                f"Index {index_name} exists on several tables ({', '.join(owners)}) - use DROP INDEX {index_name} ON table"
+            )
+        table = owners[0]
+
+    metadata = get_table(table).editable()
+    indexes = secondary_indexes(metadata)
+
+    if index_name not in indexes:
+        raise Exception(f"Index {index_name} does not exist on {table}")
+
+    del indexes[index_name]
+    metadata["indexes"] = indexes
+
+    save_table(table, metadata)
+
+    drop_index_file(table, index_name)
+
+    print_trace("STORAGE ENGINE", [
+        f"Dropped index {index_name} on {table}"
+    ])
+
+    print_trace("FILE SYSTEM", [
+        f"Deleted {index_path(table, index_name)}"
+    ])
+
+    print_result(f"✅ Index {index_name} Dropped")
@@ -0,0 +1,499 @@
+"""
+Index maintenance shared by the storage handlers
+
+Every table with a primary key has a B+tree index file
+(data/<table>.pk.idx) mapping the primary key tuple to the row's
+(page, slot) location in the heap file.
+
+Secondary indexes created with CREATE INDEX are listed under "indexes"
+in the table metadata and stored in data/<table>.<name>.idx:
+  - BTREE: ordered, entries are (key, rid) -> None
+  - HASH : equality only, entries are key -> rid
+
+The primary key also has a Bloom filter (data/<table>.pk.bloom, see
+bloom.py) that rules out most new keys without probing the B+tree.
+
+A missing index file is rebuilt from the table on first use.
+
+Open index structures and loaded Bloom filters are kept between
+statements, keyed by the absolute path of their file (DATA_DIR is
+relative to the working directory). An open index is only reused while
+its file is the one it was opened on; DROP, TRUNCATE and recovery close
+the ones of their table.
+"""
+import os
+import glob
+import config
+from .btree import BPlusTree
+from .hash_index import HashIndex
+from .bloom import BloomFilter, bloom_path
+from .table import open_table
+from utils import DATA_DIR, index_path, remove_quotes
+
+PK_INDEX = "pk"
+NUMERIC_TYPES = ["INT", "DOUBLE"]
+
+# Open index structures, keyed by absolute index file path:
+# path -> (index, identity of the file it was opened on)
+_open = {}
+
+# Loaded Bloom filters, keyed by absolute filter file path
+_blooms = {}
+
+
+# ===================================
+# KEYS
+# ===================================
+
+def key_part(value, datatype):
+    """
+    Turn a stored value into an index key component.
+
+    NULL sorts first, numbers compare numerically, anything else as text.
+    """
+    if value is None:
+        return (0,)
+
+    if isinstance(value, (int, float)):
+        return (1, value)
+
+    return (2, value)
+
+
+def primary_key_columns(metadata):
+    pk = metadata.get("primary_key")
+    if not pk:
+        return []
+    return [pk] if isinstance(pk, str) else list(pk)
+
+
+def pk_positions(metadata):
+    """Return [(column index, datatype)] for the primary key columns"""
+    names = [c[0] for c in metadata["columns"]]
+    return [
+        (names.index(col), metadata["columns"][names.index(col)][1])
+        for col in primary_key_columns(metadata)
+    ]
+
+
+def pk_key(vals, positions):
+    return tuple(key_part(vals[i], dtype) for i, dtype in positions)
+
+
+def column_position(metadata, column):
+    """Return (column index, datatype) of a column"""
+    for i, (name, dtype) in enumerate(metadata["columns"]):
+        if name == column:
+            return i, dtype
+    raise Exception(f"Column {column} not found")
+
+
+def secondary_indexes(metadata):
+    return metadata.get("indexes") or {}
+
+
+def indexed_positions(metadata):
+    """Indexes of the columns that are part of a key of a secondary index"""
+    return {
+        column_position(metadata, info["column"])[0]
+        for info in secondary_indexes(metadata).values()
+    }
+
+
+# ===================================
+# INDEX FILES
+# ===================================
+
+def _identity(path):
+    """(device, inode) of a file, None if there is none"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+def open_index(table, name, index_type="BTREE"):
+    path = os.path.abspath(index_path(table, name))
+    entry = _open.get(path)
+
+    # A file removed or replaced since is not the one the handle reads
+    if entry is not None and entry[1] != _identity(path):
+        _close(path)
+        entry = None
+
+    if entry is None:
+        index = HashIndex(path) if index_type == "HASH" else BPlusTree(path)
+        entry = _open[path] = (index, _identity(path))
+    return entry[0]
+
+
+def _close(path):
+    entry = _open.pop(os.path.abspath(path), None)
+    if entry is not None:
+        entry[0].pages.close()
+
+
+def close_indexes(table):
+    """Close the open indexes and forget the Bloom filter of a table"""
+    prefix = os.path.abspath(os.path.join(DATA_DIR, table)) + "."
+    for path in [path for path in _open if path.startswith(prefix) and path.endswith(".idx")]:
+        _close(path)
+    _blooms.pop(os.path.abspath(bloom_path(table)), None)
+
+
+def _drop_bloom(table):
+    _blooms.pop(os.path.abspath(bloom_path(table)), None)
+    if os.path.exists(bloom_path(table)):
+        os.remove(bloom_path(table))
+
+
+def _index_files(table):
+    return glob.glob(os.path.join(DATA_DIR, glob.escape(table) + ".*.idx"))
+
+
+def build_primary_index(table, metadata):
+    """(Re)build the primary key index from the table file"""
+    positions = pk_positions(metadata)
+
+    entries = sorted(
+        (pk_key(vals, positions), rid)
+        for rid, vals in open_table(table, metadata).scan()
+    )
+
+    tree = open_index(table, PK_INDEX)
+    tree.bulk_load(entries)
+
+    build_primary_bloom(table, metadata, [key for key, _ in entries])
+    return tree
+
+
+def build_primary_bloom(table, metadata, keys):
+    """(Re)build the primary key Bloom filter from a list of keys"""
+    rate = metadata.get("bloom_fp_rate") or config.get_bloom_fp_rate()
+
+    # Room for the table to double before the filter is rebuilt
+    bloom = BloomFilter.create(bloom_path(table), rate, 2 * len(keys))
+    for key in keys:
+        bloom.add(key)
+    bloom.save()
+
+    _blooms[os.path.abspath(bloom_path(table))] = bloom
+    return bloom
+
+
+def build_index(table, metadata, name):
+    """(Re)build a secondary index from the table file"""
+    info = secondary_indexes(metadata)[name]
+    ci, dtype = column_position(metadata, info["column"])
+
+    keys = [
+        ((key_part(vals[ci], dtype),), rid)
+        for rid, vals in open_table(table, metadata).scan()
+    ]
+
+    index = open_index(table, name, info["type"])
+    if info["type"] == "HASH":
+        index.bulk_load(keys)
+    else:
+        index.bulk_load(sorted((key + (rid,), None) for key, rid in keys))
+    return index
+
+
+def primary_index(table, metadata):
+    """Return the primary key index of a table, or None if it has no key"""
+    if not primary_key_columns(metadata):
+        return None
+
+    if not os.path.exists(index_path(table, PK_INDEX)):
+        return build_primary_index(table, metadata)
+
+    return open_index(table, PK_INDEX)
+
+
+def primary_bloom(table, metadata):
+    """Return the primary key Bloom filter of a table, or None if it has no key"""
+    if not primary_key_columns(metadata):
+        return None
+
+    path = os.path.abspath(bloom_path(table))
+    bloom = _blooms.get(path)
+    if bloom is not None:
+        return bloom
+
+    if not os.path.exists(path):
+        tree = primary_index(table, metadata)
+        return build_primary_bloom(table, metadata, [key for key, _ in tree.range()])
+
+    bloom = _blooms[path] = BloomFilter.load(path)
+    return bloom
+
+
+def secondary_index(table, metadata, name):
+    if not os.path.exists(index_path(table, name)):
+        return build_index(table, metadata, name)
+
+    return open_index(table, name, secondary_indexes(metadata)[name]["type"])
+
+
+def pk_lookup(table, metadata, key):
+    """Return the rid of the row with the given key, or None"""
+    tree = primary_index(table, metadata)
+    if tree is None or key not in primary_bloom(table, metadata):
+        return None
+    return tree.search(key)
+
+
+def add_to_indexes(table, metadata, rows, primary=True, new_keys=True):
+    """
+    Record newly appended (rid, values) rows in every index of the table
+    (only the secondary ones if not primary). Rows that only moved keep
+    their primary keys, which are then not added to the Bloom filter
+    again (new_keys=False).
+
+    Callers check the primary keys before writing the rows (through the
+    Bloom filter, then a B+tree lookup for the keys it cannot rule out),
+    so the keys go into the tree without a second duplicate check.
+    """
+    if primary and primary_key_columns(metadata):
+        positions = pk_positions(metadata)
+        tree = primary_index(table, metadata)
+        bloom = primary_bloom(table, metadata)
+        for rid, vals in rows:
+            key = pk_key(vals, positions)
+            tree.insert(key, rid, check=False)
+            if new_keys:
+                bloom.add(key)
+        tree.flush()
+
+        if bloom.full():
+            build_primary_bloom(table, metadata, [key for key, _ in tree.range()])
+        else:
+            bloom.flush()
+
+    for name, info in secondary_indexes(metadata).items():
+        ci, dtype = column_position(metadata, info["column"])
+        index = secondary_index(table, metadata, name)
+        for rid, vals in rows:
+            key = (key_part(vals[ci], dtype),)
+            if info["type"] == "HASH":
+                index.insert(key, rid)
+            else:
+                index.insert(key + (rid,), None)
+        index.flush()
+
+
+def remove_from_indexes(table, metadata, rows, primary=True):
+    """
+    Take deleted (rid, values) rows out of every index of the table (only
+    the secondary ones if not primary). Their keys stay in the Bloom
+    filter until it is rebuilt.
+    """
+    if primary and primary_key_columns(metadata):
+        positions = pk_positions(metadata)
+        tree = primary_index(table, metadata)
+        for _, vals in rows:
+            tree.delete(pk_key(vals, positions))
+        tree.flush()
+
+    for name, info in secondary_indexes(metadata).items():
+        ci, dtype = column_position(metadata, info["column"])
+        index = secondary_index(table, metadata, name)
+        for rid, vals in rows:
+            key = (key_part(vals[ci], dtype),)
+            if info["type"] == "HASH":
+                index.delete(key, rid)
+            else:
+                index.delete(key + (rid,))
+        index.flush()
+
+
+def rebuild_indexes(table, metadata):
+    """Rebuild every index after the table file was rewritten"""
+    if primary_key_columns(metadata):
+        build_primary_index(table, metadata)
+    else:
+        drop_index_file(table, PK_INDEX)
+
+    for name in secondary_indexes(metadata):
+        build_index(table, metadata, name)
+
+
+def clear_indexes(table, metadata):
+    close_indexes(table)
+
+    if primary_key_columns(metadata):
+        open_index(table, PK_INDEX).clear()
+        build_primary_bloom(table, metadata, [])
+
+    for name, info in secondary_indexes(metadata).items():
+        open_index(table, name, info["type"]).clear()
+
+
+def drop_index_file(table, name):
+    path = index_path(table, name)
+    _close(path)
+    if os.path.exists(path):
+        os.remove(path)
+    if name == PK_INDEX:
+        _drop_bloom(table)
+
+
+def drop_indexes(table):
+    close_indexes(table)
+    for path in _index_files(table):
+        os.remove(path)
+    _drop_bloom(table)
+
+
+def rename_indexes(table, new_table):
+    for path in _index_files(table):
+        name = os.path.basename(path)[len(table) + 1:-len(".idx")]
+        _close(path)
+        os.rename(path, index_path(new_table, name))
+
+    _blooms.pop(os.path.abspath(bloom_path(table)), None)
+    if os.path.exists(bloom_path(table)):
+        os.rename(bloom_path(table), bloom_path(new_table))
+
+
+# ===================================
+# INDEX LOOKUP
+# ===================================
+
+def _tree_range(tree, op, part):
+    """Walk the entries of an ordered index that satisfy `key op part`"""
+    if op == "=":
+        return tree.range((part,), (part,))
+    if op in (">", ">="):
+        # stop before text values, which never compare as numbers
+        return tree.range((part,), ((2,),), lo_inclusive=(op == ">="), hi_inclusive=False)
+    # "<" / "<=": start after NULLs
+    return tree.range(((1,),), (part,), hi_inclusive=(op == "<="))
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def index_scan(table, metadata, condition):
+    """
+    Find candidate rows for a WHERE condition using an index.
+
+    Returns (rids, index description, residual). residual is the part of
+    the condition the candidate rows still have to be checked against, or
+    None if the index answered all of it. When no index helps, rids is
+    None and the caller scans the table with the whole condition.
+
+    For an AND one indexed comparison picks the candidates; an OR is
+    answered from indexes only if every branch of it can be.
+    """
+    if isinstance(condition, tuple):
+        rids, used = _comparison_scan(table, metadata, condition)
+        return rids, used, (condition if rids is None else None)
+
+    if condition["type"] == "AND":
+        conditions = condition["conditions"]
+
+        # equality lookups first, they usually return the fewest rows
+        order = sorted(
+            range(len(conditions)),
+            key=lambda i: not (isinstance(conditions[i], tuple) and conditions[i][1] == "=")
+        )
+
+        for i in order:
+            rids, used, residual = index_scan(table, metadata, conditions[i])
+            if rids is None:
+                continue
+
+            rest = conditions[:i] + conditions[i + 1:]
+            if residual is not None:
+                rest.append(residual)
+
+            if not rest:
+                rest = None
+            elif len(rest) == 1:
+                rest = rest[0]
+            else:
+                rest = {"type": "AND", "conditions": rest}
+
+            return rids, used, rest
+
+    elif condition["type"] == "OR":
+        found = set()
+        used = []
+        exact = True
+
+        for c in condition["conditions"]:
+            rids, name, residual = index_scan(table, metadata, c)
+            if rids is None:
+                return None, None, condition
+            found.update(rids)
+            used.append(name)
+            exact = exact and residual is None
+
+        return sorted(found), " + ".join(used), (None if exact else condition)
+
+    return None, None, condition
+
+
+def _comparison_scan(table, metadata, condition):
+    """Index lookup for one (column, op, value) comparison"""
+    col, op, val = condition
+    if op not in ("=", "<", ">", "<=", ">="):
+        return None, None
+
+    _, dtype = column_position(metadata, col)
+    literal = remove_quotes(val)
+    numeric = dtype.upper() in NUMERIC_TYPES
+
+    # compare() treats numeric looking text as numbers, which text keys can't match
+    if not numeric and _is_number(literal):
+        return None, None
+    if op != "=" and not numeric:
+        return None, None
+    # "= NULL" on text also matches the string 'NULL'
+    if not numeric and literal == "NULL":
+        return None, None
+
+    part = key_part(None if literal == "NULL" else _literal_value(literal, dtype), dtype)
+
+    # NaN does not order, so the trees can't look it up
+    if part[0] == 1 and part[1] != part[1]:
+        return None, None
+
+    if op == "=":
+        for name, info in secondary_indexes(metadata).items():
+            if info["column"] == col and info["type"] == "HASH":
+                index = secondary_index(table, metadata, name)
+                return index.search((part,)), f"{name} (hash)"
+
+    if op != "=" and part[0] != 1:
+        return [], f"{col} (no numeric match)"
+
+    pk = primary_key_columns(metadata)
+    if pk and pk[0] == col:
+        tree = primary_index(table, metadata)
+        return [rid for _, rid in _tree_range(tree, op, part)], f"{PK_INDEX} (B+tree)"
+
+    for name, info in secondary_indexes(metadata).items():
+        if info["column"] == col and info["type"] == "BTREE":
+            tree = secondary_index(table, metadata, name)
+            return [key[-1] for key, _ in _tree_range(tree, op, part)], f"{name} (B+tree)"
+
+    return None, None
+
+
+def _literal_value(literal, dtype):
+    """Typed value of a WHERE literal; text that isn't a number stays text"""
+    if dtype.upper() in NUMERIC_TYPES:
+        for convert in (int, float):
+            try:
+                return convert(literal)
+            except ValueError:
+                pass
+    return literal
@@ -1,122 +1,197 @@
 """
 Storage operations for INSERT
 """
-import json
 from visualizer import print_trace, print_result
 from utils import (
     table_paths,
-    check_table_exists,
-    remove_quotes,
+    parse_value,
+    format_value,
     validate_value
 )
+from .indexes import pk_key, primary_index, primary_bloom, add_to_indexes, secondary_indexes
+from .table import open_table
+from .catalog import get_table
+from .transaction import in_transaction, queue
 
 
 def insert_row(table, values, insert_columns=None):
     """
     Insert a row into a table
     """
-    tbl, meta = table_paths(table)
-    check_table_exists(tbl, meta)
+    insert_rows(table, [values], insert_columns)
 
-    metadata = json.load(open(meta))
-    column_defs = metadata["columns"]
-    columns = [c[0] for c in column_defs]
-    pk = metadata.get("primary_key")
+
+def insert_rows(table, value_sets, insert_columns=None):
+    """
+    Insert several rows into a table in one batch.
+
+    Every row is validated and checked against the primary key before
+    anything is written, so a bad row leaves the table unchanged. The rows
+    are then appended in one write and added to the indexes together.
+    Inside a transaction the rows are queued until COMMIT instead.
+    """
+    tbl, _ = table_paths(table)
+
+    info = get_table(table)
+    metadata = info.metadata
+    pk = info.primary_key
+
+    rows = build_rows(info, value_sets, insert_columns)
+
+    if in_transaction():
+        pending = queue(table, ("INSERT", rows))
+
+        print_trace("STORAGE ENGINE", [
+            f"Rows Validated : {len(rows)}",
+            f"Queued in transaction : {pending} change(s) pending for {table}"
+        ])
+
+        print_result(f"✅ {len(rows)} Row(s) Queued until COMMIT")
+        return
+
+    probes = check_primary_key(table, info, rows)
 
     # =====================================
-    # BUILD FINAL ROW (NULL DEFAULT)
+    # WRITE FILE
     # =====================================
 
-    final_values = ["NULL"] * len(columns)
+    heap = open_table(table, metadata)
+    rids = heap.append(rows)
+
+    add_to_indexes(table, metadata, list(zip(rids, rows)))
+
+    trace = [
+        f"Open File : {tbl}",
+        "Mode : Append"
+    ]
+
+    if len(rows) == 1:
+        trace.append(f"Data Written : {', '.join(format_value(v) for v in rows[0])}")
+        trace.append(f"Location : page {rids[0][0]}, slot {rids[0][1]}")
+    elif rows:
+        trace.append(f"Rows Written : {len(rows)}")
+        trace.append(f"Location : pages {rids[0][0]} - {rids[-1][0]}")
+
+    if pk:
+        trace.append(f"Bloom Filter : {len(rows) - probes} of {len(rows)} key(s) skipped the duplicate check")
+
+    if pk or secondary_indexes(metadata):
+        trace.append("Indexes Updated")
+
+    print_trace("STORAGE ENGINE", trace)
+
+    print_trace("FILE SYSTEM", [
+        f"{table}.tbl updated"
+    ])
+
+    if len(rows) == 1:
+        print_result("✅ Row Inserted Successfully")
+    else:
+        print_result(f"✅ {len(rows)} Rows Inserted Successfully")
+
+
+def build_rows(info, value_sets, insert_columns=None):
+    """Validate value sets and turn them into full rows of typed values"""
+    columns = info.columns
+
+    # =====================================
+    # COLUMN MAPPING
+    # =====================================
 
     # ---------- OLD INSERT ----------
 
     if insert_columns is None:
-        if len(values) != len(columns):
-            raise Exception(
-                "Column count mismatch"
-            )
         insert_columns = columns
 
     # ---------- COLUMN INSERT ----------
 
-    if len(insert_columns) != len(values):
-        raise Exception(
-            "Column count mismatch"
-        )
+    targets = [
+        (info.position(col), info.types[info.position(col)])
+        for col in insert_columns
+    ]
+
+    # =====================================
+    # BUILD FINAL ROWS (NULL DEFAULT)
+    # =====================================
 
-    # fill values
+    rows = []
 
-    for col, value in zip(insert_columns, values):
-        if col not in columns:
+    for values in value_sets:
+        if len(values) != len(targets):
             raise Exception(
-                f"Column {col} not found"
+                "Column count mismatch"
             )
 
-        idx = columns.index(col)
-        datatype = column_defs[idx][1]
+        final_values = [None] * len(columns)
 
-        validate_value(
-            value,
-            datatype
-        )
+        for (idx, datatype), value in zip(targets, values):
+            validate_value(
+                value,
+                datatype
+            )
 
-        if datatype.upper() in ["CHAR", "VARCHAR"]:
-            value = remove_quotes(value)
+            final_values[idx] = parse_value(value, datatype)
 
-        final_values[idx] = value
+        rows.append(final_values)
 
-    # =====================================
-    # PRIMARY KEY CHECK
-    # =====================================
+    return rows
 
-    if pk:
-        # Support both single and composite primary keys
-        if isinstance(pk, str):
-            pk = [pk]  # Convert to list for uniform handling
-        
-        # Get indices for all primary key columns
-        pk_indices = [columns.index(pk_col) for pk_col in pk]
-        
+
+def check_primary_key(table, info, rows):
+    """
+    Raise if new rows have a NULL primary key column or a key that is
+    already taken, by the table or by another of the rows. Returns the
+    number of keys probed in the B+tree.
+    """
+    pk = info.primary_key
+    if not pk:
+        return 0
+
+    # Get indices for all primary key columns
+    pk_indices = [i for i, _ in info.pk_positions]
+
+    # Keys of this batch; existing keys are probed in the B+tree
+    # unless the Bloom filter rules them out
+    batch_keys = set()
+    tree = primary_index(table, info.metadata)
+    bloom = primary_bloom(table, info.metadata)
+    probes = 0
+
+    for final_values in rows:
         # Check that none of the PK columns are NULL
         for i, pk_col in zip(pk_indices, pk):
-            if final_values[i] == "NULL":
+            if final_values[i] is None:
                 raise Exception(
                     f"Primary Key column '{pk_col}' cannot be NULL"
                 )
-        
-        # Duplicate check - compare composite key
-        with open(tbl) as f:
-            for row in f:
-                existing = row.strip().split(",")
-                
-                # Check if all PK columns match (composite key duplicate check)
-                if all(existing[i] == final_values[i] for i in pk_indices):
-                    if len(pk) == 1:
-                        raise Exception(
-                            f"Primary Key violation: {pk[0]} = {final_values[pk_indices[0]]}"
-                        )
-                    else:
-                        pk_values = ", ".join([f"{pk[i]}={final_values[pk_indices[i]]}" for i in range(len(pk))])
-                        raise Exception(
-                            f"Composite Primary Key violation: ({pk_values})"
-                        )
 
-    # =====================================
-    # WRITE FILE
-    # =====================================
+        key = pk_key(final_values, info.pk_positions)
 
-    line = ",".join(final_values)
-    open(tbl, "a").write(line + "\n")
+        if key in bloom:
+            probes += 1
+            found = tree.search(key) is not None
+        else:
+            found = False
 
-    print_trace("STORAGE ENGINE", [
-        f"Open File : {tbl}",
-        "Mode : Append",
-        f"Data Written : {line}"
-    ])
+        if key in batch_keys or found:
+            raise pk_violation(info, final_values)
 
-    print_trace("FILE SYSTEM", [
-        f"{table}.tbl updated"
-    ])
+        batch_keys.add(key)
+
+    return probes
+
+
+def pk_violation(info, vals):
+    """The error for a row whose primary key is taken"""
+    pk = info.primary_key
+    pk_indices = [i for i, _ in info.pk_positions]
+
+    if len(pk) == 1:
+        return Exception(
+            f"Primary Key violation: {pk[0]} = {format_value(vals[pk_indices[0]])}"
+        )
 
-    print_result("✅ Row Inserted Successfully")
+    pk_values = ", ".join([f"{pk[i]}={format_value(vals[pk_indices[i]])}" for i in range(len(pk))])
+    return Exception(
+        f"Composite Primary Key violation: ({pk_values})"
+    )
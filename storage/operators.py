@@ -0,0 +1,186 @@
+"""
+Row operators used to execute SELECT
+
+A query is evaluated as a pipeline of generators. Each operator pulls
+rows from the one below it and yields rows upwards, so rows are
+streamed from the heap file to the output one at a time and an operator
+like LIMIT stops the scan as soon as it has what it needs.
+
+Rows are lists of typed values, in table column order.
+"""
+import heapq
+from itertools import islice
+from operator import itemgetter
+from utils import format_value
+from .external_sort import external_sort
+from .external_aggregate import external_aggregate
+
+
+class ScanStats:
+    """Counts the rows a scan read, for the execution trace"""
+
+    def __init__(self):
+        self.rows_read = 0
+
+
+# ===================================
+# SOURCES
+# ===================================
+
+def scan_rows(heap, rids=None, stats=None, zones=None):
+    """
+    Yield the rows of a heap file - every row, or only the rows at the
+    given locations when an index narrowed the search down. A full scan
+    skips the zones a zone filter rules out.
+    """
+    source = heap.scan(zones=zones) if rids is None else heap.fetch(rids)
+
+    for _, vals in source:
+        if stats is not None:
+            stats.rows_read += 1
+        yield vals
+
+
+def scan_columns(table_file, positions, predicate=None, filter_positions=(), stats=None, zones=None):
+    """
+    Yield the rows of a column store that match predicate, reading only
+    the columns at positions (the others are None). The columns the
+    predicate reads are given as filter_positions.
+    """
+    source = table_file.scan_columns(positions, predicate, filter_positions, stats, zones=zones)
+
+    for _, vals in source:
+        yield vals
+
+
+# ===================================
+# STREAMING OPERATORS
+# ===================================
+
+def filter_rows(rows, predicate):
+    return (vals for vals in rows if predicate(vals))
+
+
+def limit_rows(rows, limit):
+    return islice(rows, limit)
+
+
+def project_rows(rows, positions):
+    return ([vals[i] for i in positions] for vals in rows)
+
+
+# ===================================
+# BLOCKING OPERATORS
+# ===================================
+
+def _numeric_key(value):
+    return float(value) if value is not None else float('-inf')
+
+
+def sort_rows(rows, position, descending=False, stats=None):
+    """
+    Sort rows on one column. Values are compared as numbers (NULL first)
+    and, when a column holds text, as strings instead.
+
+    Large inputs are sorted externally, so the result may be a generator.
+    """
+    return external_sort(
+        rows,
+        key=lambda row: _numeric_key(row[position]),
+        reverse=descending,
+        fallback=lambda row: format_value(row[position]),
+        stats=stats
+    )
+
+
+def hash_aggregate(rows, positions, aggregates, stats=None):
+    """
+    Group rows on the columns at positions, keeping only the accumulator
+    state of each group, never its rows.
+
+    Yields (group key, state) pairs in the order the groups were first
+    seen; a key is the tuple of the group's column values. Past the
+    aggregate memory budget rows are partitioned to disk.
+    """
+    if len(positions) == 1:
+        i = positions[0]
+        group_key = lambda row: (row[i],)
+    else:
+        group_key = itemgetter(*positions)
+
+    return external_aggregate(rows, group_key, aggregates, stats=stats)
+
+
+class _Largest:
+    """Heap entry that orders the largest (key, seq) first"""
+
+    __slots__ = ("key", "row")
+
+    def __init__(self, key, row):
+        self.key = key
+        self.row = row
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+
+class _TopK:
+    """
+    Keeps the first k rows of a stable sort on some key, with a heap whose
+    root is the row that would be dropped next.
+    """
+
+    def __init__(self, k, descending):
+        self.k = k
+        self.descending = descending
+        self.heap = []
+
+    def push(self, key, seq, row):
+        if self.descending:
+            # reverse=True keeps equal keys in input order: drop the
+            # smallest key, and the latest row among equals
+            entry = ((key, -seq), row)
+            if len(self.heap) < self.k:
+                heapq.heappush(self.heap, entry)
+            elif entry[0] > self.heap[0][0]:
+                heapq.heapreplace(self.heap, entry)
+        else:
+            entry = _Largest((key, seq), row)
+            if len(self.heap) < self.k:
+                heapq.heappush(self.heap, entry)
+            elif entry.key < self.heap[0].key:
+                heapq.heapreplace(self.heap, entry)
+
+    def rows(self):
+        if self.descending:
+            ordered = sorted(self.heap, key=lambda e: e[0], reverse=True)
+            return [row for _, row in ordered]
+        return [e.row for e in sorted(self.heap, key=lambda e: e.key)]
+
+
+def top_k_rows(rows, position, k, descending=False, numeric=False):
+    """
+    Same result as sort_rows(rows, position, descending)[:k], keeping only
+    k rows in memory.
+
+    sort_rows compares text as strings once any value is not a number, which
+    is only known at the end of the input, so for text columns both orderings
+    are tracked until a value fails to convert. numeric=True skips that for
+    INT and DOUBLE columns.
+    """
+    by_number = _TopK(k, descending)
+    by_text = None if numeric else _TopK(k, descending)
+
+    for seq, row in enumerate(rows):
+        value = row[position]
+
+        if by_number is not None:
+            try:
+                by_number.push(_numeric_key(value), seq, row)
+            except ValueError:
+                by_number = None
+
+        if by_text is not None:
+            by_text.push(format_value(value), seq, row)
+
+    return (by_number or by_text).rows()
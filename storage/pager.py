@@ -0,0 +1,93 @@
+"""
+Fixed-size page file shared by the index structures
+
+Each page holds one pickled object behind a 4 byte length prefix.
+Page 0 is reserved for the owner's header.
+"""
+import os
+import pickle
+
+PAGE_SIZE = 4096
+LEN_BYTES = 4
+
+# LONG_BINGET (opcode + 4 byte index) over BINGET (opcode + 1 byte index)
+LONG_GET_GROWTH = 3
+
+
+class PageFile:
+
+    def __init__(self, path):
+        self.path = path
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self.file = open(path, "r+b" if exists else "w+b")
+        self.is_new = not exists
+
+        # Upper bounds on the pickled size of pages being filled
+        self.sizes = {}
+
+    def read(self, page_no):
+        self.file.seek(page_no * PAGE_SIZE)
+        raw = self.file.read(PAGE_SIZE)
+        size = int.from_bytes(raw[:LEN_BYTES], "little")
+        return pickle.loads(raw[LEN_BYTES:LEN_BYTES + size])
+
+    def write(self, page_no, obj):
+        data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+        if len(data) + LEN_BYTES > PAGE_SIZE:
+            raise Exception("Index entry too large for an index page")
+        self.file.seek(page_no * PAGE_SIZE)
+        self.file.write(
+            len(data).to_bytes(LEN_BYTES, "little")
+            + data
+            + b"\0" * (PAGE_SIZE - LEN_BYTES - len(data))
+        )
+
+    @staticmethod
+    def fits(obj):
+        return len(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)) + LEN_BYTES <= PAGE_SIZE
+
+    @staticmethod
+    def entry_size(obj):
+        return len(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+
+    def fits_after(self, page_no, obj, entry):
+        """
+        Same as fits(obj), where obj is page page_no that just had entry
+        added. The page's size is tracked by adding the size of each entry
+        on its own (which over-counts), so the whole page is only pickled
+        again when it gets close to full.
+        """
+        size = self.sizes.get(page_no)
+        if size is not None:
+            size += self.entry_size(entry)
+            if size + LEN_BYTES <= PAGE_SIZE:
+                self.sizes[page_no] = size
+                return True
+
+        size = self.page_size(obj)
+        self.sizes[page_no] = size
+        return size + LEN_BYTES <= PAGE_SIZE
+
+    @staticmethod
+    def page_size(obj):
+        """
+        Pickled size of a page, counting every back reference (BINGET) at
+        the size of a LONG_BINGET: references become that wide once the
+        page holds 256 shared objects, which a single added entry can do
+        """
+        data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+        return len(data) + LONG_GET_GROWTH * data.count(pickle.BINGET)
+
+    def forget_size(self, page_no):
+        """Call when a page shrinks or is rebuilt"""
+        self.sizes.pop(page_no, None)
+
+    def truncate(self):
+        self.file.truncate(0)
+        self.sizes = {}
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
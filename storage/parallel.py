@@ -0,0 +1,238 @@
+"""
+Parallel table scans
+
+A full scan can be split across a pool of worker processes. The table
+file is cut into chunks of at most PARALLEL_CHUNK_PAGES whole pages
+(blocks of a column store), every worker reads and filters one chunk at
+a time, and the parent merges what comes back, in page order:
+
+  - the matching rows, for SELECT without aggregates
+  - the locations of the matching rows, for UPDATE and DELETE
+  - partially aggregated state, for aggregates with or without GROUP BY,
+    so only one state per group of a chunk crosses the process boundary
+
+At most two chunks per worker are in flight, so what the parent holds
+does not grow with the table: rows are passed on chunk by chunk, and
+the partial states of GROUP BY are merged through the spilling hash
+aggregation (external_aggregate.py), within the aggregate memory budget.
+
+The degree of parallelism is config.PARALLEL_WORKERS; 1 (the default)
+keeps every scan in-process, and so do tables of fewer than
+PARALLEL_MIN_PAGES pages, where starting the work costs more than it
+saves. Partial SUM / AVG totals are added chunk by chunk, so a DOUBLE
+result may differ from a serial scan in the last digits.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+import config
+from .table import table_file, table_dictionary
+from .catalog import TableInfo
+from .predicates import compile_condition
+from .zonemap import zone_filter
+from .aggregates import build_aggregates, new_state, update_state, merge_state
+from .external_aggregate import external_aggregate
+
+PARALLEL_MIN_PAGES = 64
+PARALLEL_CHUNK_PAGES = 64
+
+_pool = None
+_pool_workers = 0
+
+
+def _get_pool(workers):
+    """The worker pool, kept between statements"""
+    global _pool, _pool_workers
+
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+
+    return _pool
+
+
+def parallel_degree(heap):
+    """Number of workers to scan a heap file with; 1 means in-process"""
+    workers = config.get_parallel_workers()
+
+    if workers <= 1 or heap.page_count() < PARALLEL_MIN_PAGES:
+        return 1
+
+    return workers
+
+
+def page_ranges(page_count, parts):
+    """Split pages 0 .. page_count - 1 into parts contiguous (first, last) ranges"""
+    step, extra = divmod(page_count, parts)
+    ranges = []
+    first = 0
+
+    for i in range(parts):
+        last = first + step + (1 if i < extra else 0)
+        if last > first:
+            ranges.append((first, last))
+        first = last
+
+    return ranges
+
+
+# ===================================
+# WORKERS
+# ===================================
+#
+# Run in the pool processes. A task carries the table metadata and the
+# condition rather than a compiled predicate, which cannot be pickled.
+
+def _chunk(task):
+    path, table, metadata, condition, first, last = task[:6]
+
+    info = TableInfo(table, metadata, None, 0)
+    heap = table_file(path, metadata, table_dictionary(table, metadata))
+    matches = compile_condition(info, condition) if condition else None
+
+    # Each worker skips the zones of its range that cannot match
+    zones = zone_filter(heap, info, condition)
+
+    return info, heap.scan(first, last, zones), matches
+
+
+def _rows_task(task):
+    info, rows, matches = _chunk(task)
+    found = []
+    read = 0
+
+    for _, vals in rows:
+        read += 1
+        if matches is None or matches(vals):
+            found.append(vals)
+
+    return read, found
+
+
+def _rids_task(task):
+    info, rows, matches = _chunk(task)
+    found = []
+    read = 0
+
+    for rid, vals in rows:
+        read += 1
+        if matches is None or matches(vals):
+            found.append(rid)
+
+    return read, found
+
+
+def _aggregate_task(task):
+    info, rows, matches = _chunk(task)
+    items, positions = task[6:]
+
+    aggs = build_aggregates(info, items)
+    read = 0
+
+    # ---------- no GROUP BY: one state ----------
+
+    if positions is None:
+        state = new_state(aggs)
+        for _, vals in rows:
+            read += 1
+            if matches is None or matches(vals):
+                update_state(state, aggs, vals)
+        return read, state
+
+    # ---------- GROUP BY: key -> state ----------
+
+    groups = {}
+    for _, vals in rows:
+        read += 1
+        if matches is None or matches(vals):
+            key = tuple(vals[i] for i in positions)
+            state = groups.get(key)
+            if state is None:
+                state = groups[key] = new_state(aggs)
+            update_state(state, aggs, vals)
+
+    return read, list(groups.items())
+
+
+# ===================================
+# PARENT SIDE
+# ===================================
+
+def _run(function, heap, info, condition, workers, stats, extra=()):
+    """Run function over the chunks of the table; yields results in page order"""
+    pool = _get_pool(workers)
+    page_count = heap.page_count()
+    chunks = max(workers, -(-page_count // PARALLEL_CHUNK_PAGES))
+    pending = deque()
+
+    def collect(future):
+        read, result = future.result()
+        if stats is not None:
+            stats.rows_read += read
+        return result
+
+    try:
+        for first, last in page_ranges(page_count, chunks):
+            task = (heap.path, info.table, info.metadata, condition, first, last) + tuple(extra)
+            pending.append(pool.submit(function, task))
+
+            if len(pending) >= 2 * workers:
+                yield collect(pending.popleft())
+
+        while pending:
+            yield collect(pending.popleft())
+
+    finally:
+        # A scan stopped early (LIMIT) does not start the remaining chunks
+        for future in pending:
+            future.cancel()
+
+
+def parallel_rows(heap, info, condition, workers, stats=None):
+    """Yield the rows matching condition, in storage order"""
+    for rows in _run(_rows_task, heap, info, condition, workers, stats):
+        yield from rows
+
+
+def parallel_rids(heap, info, condition, workers, stats=None):
+    """Locations of the rows matching condition"""
+    rids = set()
+
+    for found in _run(_rids_task, heap, info, condition, workers, stats):
+        rids.update(found)
+
+    return rids
+
+
+def parallel_aggregate(heap, info, condition, aggs, workers, stats=None):
+    """Aggregate state of the rows matching condition"""
+    items = [(a.func, a.column) for a in aggs]
+    state = new_state(aggs)
+
+    for part in _run(_aggregate_task, heap, info, condition, workers, stats, (items, None)):
+        merge_state(state, part, aggs)
+
+    return state
+
+
+def parallel_group(heap, info, condition, aggs, positions, workers, stats=None, agg_stats=None):
+    """
+    Yield (group key, state) pairs of the rows matching condition, grouped
+    on the columns at positions, in the order the groups were first seen.
+    The partial states are merged within the aggregate memory budget,
+    spilling to disk past it (counted in agg_stats)
+    """
+    items = [(a.func, a.column) for a in aggs]
+
+    # Chunks come back in page order, so each group is first seen with
+    # its first row, as in a serial scan
+    parts = (
+        pair
+        for part in _run(_aggregate_task, heap, info, condition, workers, stats, (items, positions))
+        for pair in part
+    )
+
+    for key, state in external_aggregate(parts, itemgetter(0), aggs, stats=agg_stats, merge=True):
+        yield key, state
@@ -0,0 +1,278 @@
+"""
+WHERE conditions compiled into row predicates
+
+A condition is turned once per statement into a function of a row that
+returns True when the row matches. For a comparison (column, operator,
+literal) the column's declared type and the literal are looked at up
+front, so the per-row work is a single comparison on the stored value.
+
+Comparisons follow utils.compare:
+  - numbers compare numerically, also when a text value looks like one
+  - other text only supports '=' and '!=', as a string comparison
+  - NULL never matches, except "= NULL" (and "!= NULL" matches the rest)
+
+AND / OR / NOT trees (see parser/where_parser.py) short-circuit, with the
+parts that are cheapest and most likely to decide the result tried first.
+
+On a dictionary encoded column a comparison is evaluated once for every
+distinct value in the dictionary; a row then matches when its value is
+one of those, and a literal that is not in the dictionary matches
+nothing without looking at any row. Rows queued by an open transaction
+may hold values the dictionary does not have yet; their predicates are
+compiled with dictionary=False and compare the values themselves.
+"""
+import operator
+from utils import remove_quotes
+from .indexes import NUMERIC_TYPES
+from .dictionary import encoded_columns
+from .catalog import TableInfo, get_dictionary
+
+OPERATORS = {
+    "=": operator.eq,
+    "<": operator.lt,
+    ">": operator.gt,
+    "<=": operator.le,
+    ">=": operator.ge
+}
+
+# Rough share of rows a comparison lets through, for ordering AND / OR
+SELECTIVITY = {
+    "=": 0.05,
+    "!=": 0.95,
+    "<": 0.33,
+    ">": 0.33,
+    "<=": 0.33,
+    ">=": 0.33
+}
+
+_WORD_NUMBERS = ("inf", "infinity", "nan")
+
+# A one column text row, to test dictionary values with
+_TEXT_VALUE = TableInfo(None, {"columns": [["value", "VARCHAR"]]}, None, 0)
+
+
+def _never(vals):
+    return False
+
+
+def _literal_number(literal):
+    """The literal as a number, or None if it is not one"""
+    try:
+        value = float(literal)
+    except ValueError:
+        return None
+
+    # Keep integers exact when comparing with INT columns
+    try:
+        return int(literal)
+    except ValueError:
+        return value
+
+
+def compile_condition(info, condition, dictionary=True):
+    """
+    Return a predicate for a WHERE condition on the table described by
+    info (a catalog TableInfo). With dictionary=False encoded columns are
+    compared like any text column, for rows not all of whose values are
+    in the table's dictionary.
+    """
+    if isinstance(condition, tuple):
+        return _compile_comparison(info, condition, dictionary)
+
+    kind = condition["type"]
+
+    if kind == "NOT":
+        inner = compile_condition(info, condition["condition"], dictionary)
+
+        def match_not(vals):
+            return not inner(vals)
+        return match_not
+
+    parts = [
+        compile_condition(info, c, dictionary)
+        for c in order_conditions(info, condition)
+    ]
+
+    if kind == "AND":
+        def match_all(vals):
+            for part in parts:
+                if not part(vals):
+                    return False
+            return True
+        return match_all
+
+    def match_any(vals):
+        for part in parts:
+            if part(vals):
+                return True
+        return False
+    return match_any
+
+
+# ===================================
+# EVALUATION ORDER
+# ===================================
+
+def estimate(info, condition):
+    """Return (selectivity, cost) estimates for a condition"""
+    if isinstance(condition, tuple):
+        column, op, literal = condition
+        selectivity = SELECTIVITY.get(op, 0.5)
+
+        # an equality on the whole primary key matches at most one row
+        if op == "=" and info.primary_key == [column]:
+            selectivity = 0.001
+
+        # text compared with a number goes through float(), except for
+        # dictionary encoded columns
+        numeric = info.types[info.position(column)].upper() in NUMERIC_TYPES
+        literal = remove_quotes(literal)
+        cheap = numeric or column in encoded_columns(info.metadata)
+        cost = 1.0 if cheap or _literal_number(literal) is None else 3.0
+
+        return selectivity, cost
+
+    if condition["type"] == "NOT":
+        selectivity, cost = estimate(info, condition["condition"])
+        return 1 - selectivity, cost
+
+    estimates = [estimate(info, c) for c in condition["conditions"]]
+    cost = sum(c for _, c in estimates)
+
+    if condition["type"] == "AND":
+        selectivity = 1.0
+        for s, _ in estimates:
+            selectivity *= s
+    else:
+        miss = 1.0
+        for s, _ in estimates:
+            miss *= 1 - s
+        selectivity = 1 - miss
+
+    return selectivity, cost
+
+
+def order_conditions(info, condition):
+    """
+    Order the parts of an AND / OR so evaluation stops as early as
+    possible: for AND the parts most likely to reject a row per unit of
+    cost go first, for OR the ones most likely to accept it.
+    """
+    conditions = condition["conditions"]
+    estimates = {id(c): estimate(info, c) for c in conditions}
+
+    if condition["type"] == "AND":
+        rank = lambda c: -(1 - estimates[id(c)][0]) / estimates[id(c)][1]
+    else:
+        rank = lambda c: -estimates[id(c)][0] / estimates[id(c)][1]
+
+    return sorted(conditions, key=rank)
+
+
+# ===================================
+# COMPARISONS
+# ===================================
+
+def _compile_comparison(info, condition, dictionary=True):
+    column, op, literal = condition
+
+    if op == "!=":
+        i = info.position(column)
+        equal = _compile_comparison(info, (column, "=", literal), dictionary)
+
+        def match_not_equal(vals):
+            return vals[i] is not None and not equal(vals)
+        return match_not_equal
+
+    if op not in OPERATORS:
+        raise Exception(f"Unsupported operator {op}")
+
+    i = info.position(column)
+    datatype = info.types[i].upper()
+    cmp = OPERATORS[op]
+
+    literal = remove_quotes(literal)
+    number = _literal_number(literal)
+
+    # ---------- "= NULL" ----------
+
+    if literal == "NULL" and op == "=":
+        if datatype in NUMERIC_TYPES:
+            def match_null(vals):
+                return vals[i] is None
+        else:
+            # a text value 'NULL' is indistinguishable from NULL in SQL text
+            def match_null(vals):
+                v = vals[i]
+                return v is None or v == "NULL"
+        return match_null
+
+    # ---------- INT / DOUBLE columns ----------
+
+    if datatype in NUMERIC_TYPES:
+        if number is None:
+            return _never
+
+        def match_number(vals):
+            v = vals[i]
+            return v is not None and cmp(v, number)
+        return match_number
+
+    # ---------- dictionary encoded CHAR / VARCHAR columns ----------
+
+    matching = dictionary_matches(info, column, op, literal) if dictionary else None
+
+    if matching is not None:
+        if not matching:
+            return _never
+
+        def match_dictionary(vals):
+            return vals[i] in matching
+        return match_dictionary
+
+    # ---------- CHAR / VARCHAR columns ----------
+
+    if number is None:
+        # Only equality can hold between text values
+        if op != "=":
+            return _never
+
+        def match_text(vals):
+            return vals[i] == literal
+        return match_text
+
+    # A numeric literal matches text that reads as a number
+    number = float(literal)
+
+    def match_numeric_text(vals):
+        v = vals[i]
+        if v is None:
+            return False
+        # Skip the exception for text that cannot be a number; the only
+        # numbers that start with a letter are inf, infinity and nan
+        if v[:1].isalpha() and v.rstrip().lower() not in _WORD_NUMBERS:
+            return False
+        try:
+            return cmp(float(v), number)
+        except ValueError:
+            return False
+    return match_numeric_text
+
+
+def dictionary_matches(info, column, op, literal):
+    """
+    The set of values of a dictionary encoded column for which
+    `column op literal` holds (op is one of OPERATORS, literal is unquoted
+    and not NULL), or None if the column is not dictionary encoded.
+    """
+    if column not in encoded_columns(info.metadata):
+        return None
+
+    entries = get_dictionary(info.table).column(column)
+
+    if _literal_number(literal) is None:
+        return {literal} if op == "=" and literal in entries.codes else set()
+
+    # Text against a number: the usual row predicate, run on each value
+    test = _compile_comparison(_TEXT_VALUE, ("value", op, literal))
+    return {v for v in entries.values if test([v])}
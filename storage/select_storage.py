@@ -1,12 +1,52 @@
 """
 Storage operations for SELECT
 """
-import json
 from visualizer import print_trace, print_result
 from utils import (
     table_paths,
-    check_table_exists,
-    compare
+    format_value
+)
+from .indexes import NUMERIC_TYPES, index_scan
+from .external_sort import SortStats, external_sort
+from .external_aggregate import AggregateStats
+from .aggregates import (
+    build_aggregates,
+    new_state,
+    update_state,
+    final_values,
+    parse_label,
+    condition_aggregates,
+    result_info
+)
+from .table import open_table
+from .operators import (
+    ScanStats,
+    scan_rows,
+    scan_columns,
+    filter_rows,
+    sort_rows,
+    top_k_rows,
+    hash_aggregate,
+    limit_rows,
+    project_rows
+)
+from .catalog import get_table
+from .predicates import compile_condition
+from .zonemap import zone_filter
+from .transaction import queued_changes, PendingTable
+from .vectorized import (
+    vector_enabled,
+    vector_supported,
+    condition_columns,
+    vector_rows,
+    vector_aggregate,
+    vector_group
+)
+from .parallel import (
+    parallel_degree,
+    parallel_rows,
+    parallel_aggregate,
+    parallel_group
 )
 
 
@@ -18,138 +58,257 @@ def select_rows(
         agg_column=None,
         group_by=None,
         order_by=None,
-        limit=None
+        limit=None,
+        aggregates=None,
+        having=None
 ):
     """
     Query data from a table with various filtering and aggregation options
+
+    aggregates lists every (function, column) of the select list; when it
+    is not given, aggregate / agg_column describe the only one. group_by is
+    a list of columns, and having a condition on the grouped rows.
     """
-    tbl, meta = table_paths(table)
-    check_table_exists(tbl, meta)
+    tbl, _ = table_paths(table)
 
-    metadata = json.load(open(meta))
-    columns = [c[0] for c in metadata["columns"]]
+    if isinstance(group_by, str):
+        group_by = [group_by]
 
-    rows = open(tbl).readlines()
+    info = get_table(table)
+    metadata = info.metadata
+    columns = info.columns
 
-    print_trace("STORAGE ENGINE", [
-        f"Open File : {tbl}",
-        f"Rows Scanned : {len(rows)}"
-    ])
+    # ===========================
+    # SCAN (INDEX LOOKUP OR FULL SCAN)
+    # ===========================
 
-    filtered = []
+    heap = open_table(table, metadata)
+
+    # Inside a transaction a table with queued changes is read from memory,
+    # with the changes applied; its indexes do not know them
+    queued = queued_changes(table)
+    if queued:
+        heap = PendingTable(heap, queued)
+
+    if condition and not queued:
+        rids, index_used, residual = index_scan(table, metadata, condition)
+    else:
+        rids, index_used, residual = None, None, condition
+
+    # A column store reads only the columns the query references
+    column_scan = rids is None and heap.ENGINE == "COLUMNAR"
+
+    # A vectorized scan (SET EXECUTION VECTOR) filters whole batches of
+    # INT / DOUBLE columns at once
+    vector = (
+        rids is None
+        and vector_enabled(heap)
+        and vector_supported(info, condition_columns(residual), codes=True)
+    )
+
+    # Otherwise a full scan may be split across worker processes. LIMIT
+    # lets a serial scan stop early, so it stays in-process unless rows
+    # are sorted
+    workers = 1
+    if rids is None and not vector and not column_scan and (not limit or (order_by and not (aggregate or having))):
+        workers = parallel_degree(heap)
+
+    # Aggregates are computed on the batches unless LIMIT cuts the input
+    vector_aggregates = vector and not limit
+
+    stats = ScanStats()
+
+    # Zones whose min / max ranges cannot satisfy the condition are not read
+    zones = zone_filter(heap, info, residual) if rids is None else None
+
+    if column_scan:
+        needed = _referenced_columns(
+            info, selected_columns, aggregate, agg_column, aggregates,
+            group_by, order_by, having, residual
+        )
+        positions = [info.position(col) for col in needed]
+        filter_positions = [info.position(col) for col in condition_columns(residual)]
+        predicate = compile_condition(info, residual) if residual else None
+        rows = scan_columns(heap, positions, predicate, filter_positions, stats, zones)
+    else:
+        rows = scan_rows(heap, rids, stats, zones)
+
+    if rids is not None:
+        access = f"Index Lookup : {index_used}"
+    elif column_scan:
+        access = f"Access : Column Scan ({len(positions)} of {len(columns)} columns)"
+    elif vector:
+        access = "Access : Vectorized Scan (NumPy batches)"
+    elif workers > 1:
+        access = f"Access : Parallel Scan ({workers} workers)"
+    elif queued:
+        access = f"Access : Full Scan (with {len(queued)} change(s) queued in the transaction)"
+    else:
+        access = "Access : Full Scan"
+
+    trace = [
+        f"Open File : {tbl}",
+        access
+    ]
 
-    for row in rows:
-        vals = row.strip().split(",")
+    # ===========================
+    # WHERE
+    # ===========================
 
-        if condition:
-            col, op, val = condition
-            idx = columns.index(col)
+    if vector:
+        # Only rows that pass the batch mask are decoded
+        rows = vector_rows(heap, info, residual, stats, zones)
 
-            if not compare(vals[idx], op, val):
-                continue
+    elif workers > 1:
+        # Every worker filters its own pages
+        rows = parallel_rows(heap, info, residual, workers, stats)
 
-        filtered.append(vals)
+    # Whatever the index lookup did not already guarantee (a column scan
+    # applies it before building rows)
+    elif residual and not column_scan:
+        rows = filter_rows(rows, compile_condition(info, residual, dictionary=not queued))
 
     # ===========================
     # ORDER BY (for non-aggregated queries)
     # ===========================
 
     # Skip ORDER BY here if we have GROUP BY - it will be handled in the GROUP BY section
-    if order_by and not (aggregate and group_by):
+    if order_by and not ((aggregate or having) and group_by):
         sort_col, sort_order = order_by
         
         # Check if column exists in the table
-        if sort_col in columns:
-            sort_idx = columns.index(sort_col)
-            
-            # Try to sort numerically, fall back to string sort
-            try:
-                filtered.sort(
-                    key=lambda row: float(row[sort_idx]) if row[sort_idx] != "NULL" else float('-inf'),
-                    reverse=(sort_order == "DESC")
-                )
-            except (ValueError, IndexError):
-                filtered.sort(
-                    key=lambda row: row[sort_idx],
-                    reverse=(sort_order == "DESC")
+        if sort_col in info.positions:
+            sort_idx = info.positions[sort_col]
+
+            if limit:
+                # Only the first LIMIT rows are kept while scanning
+                trace.append(f"Sort : top-{limit} heap on {sort_col}")
+                rows = top_k_rows(
+                    rows,
+                    sort_idx,
+                    limit,
+                    sort_order == "DESC",
+                    info.types[sort_idx].upper() in NUMERIC_TYPES
                 )
+            else:
+                # Spills sorted runs to disk past the sort memory budget
+                sort_stats = SortStats()
+                rows = sort_rows(rows, sort_idx, sort_order == "DESC", sort_stats)
+
+                if sort_stats.runs:
+                    trace.append(f"Sort : external merge of {sort_stats.runs} runs on {sort_col}")
+                else:
+                    trace.append(f"Sort : in memory on {sort_col}")
 
     # ===========================
     # LIMIT
     # ===========================
 
+    # Without ORDER BY this stops the scan once enough rows matched
     if limit:
-        filtered = filtered[:limit]
+        rows = limit_rows(rows, limit)
+
+    trace.append("Rows streamed through the query pipeline")
+
+    print_trace("STORAGE ENGINE", trace)
 
     # ===========================
     # AGGREGATE PART
     # ===========================
 
-    if aggregate:
+    if aggregate or having:
+
+        # Every aggregate of the select list is computed in the same pass
+        if not aggregates:
+            aggregates = [(aggregate, agg_column)] if aggregate else []
+
+        aggs = build_aggregates(info, aggregates)
 
         # ===========================
         # GROUP BY
         # ===========================
 
         if group_by:
-            grp_idx = columns.index(group_by)
-            groups = {}
-            
-            for row in filtered:
-                grp_val = row[grp_idx]
-                if grp_val not in groups:
-                    groups[grp_val] = []
-                groups[grp_val].append(row)
-            
-            # Determine aggregate column name for display
-            agg_display = f"{aggregate}({agg_column if agg_column else '*'})"
-            
-            # Calculate aggregate results for each group
+            group_positions = [info.position(col) for col in group_by]
+
+            # Aggregates named only by HAVING or ORDER BY are computed too,
+            # but not shown
+            shown = len(aggs)
+            extra = condition_aggregates(having) if having else []
+
+            if order_by and parse_label(order_by[0]):
+                extra.append(parse_label(order_by[0]))
+
+            labels = {a.label for a in aggs}
+            for agg in build_aggregates(info, extra):
+                if agg.label not in labels:
+                    aggs.append(agg)
+                    labels.add(agg.label)
+
+            having_match = compile_condition(result_info(info, group_by, aggs), having) if having else None
+
+            # Hash aggregation: one accumulator state per group, spilling
+            # to partition files past the aggregate memory budget
+            agg_stats = AggregateStats()
+
+            if (
+                vector_aggregates
+                and vector_supported(info, group_by, codes=True)
+                and vector_supported(info, _aggregate_columns(aggs))
+            ):
+                # Groups and aggregates reduced per batch with NumPy, the
+                # batches merged within the aggregate memory budget
+                groups = vector_group(heap, info, residual, aggs, group_positions, stats, zones, agg_stats)
+            elif workers > 1:
+                # Workers send back one partial state per group of a chunk,
+                # merged here within the aggregate memory budget
+                groups = parallel_group(heap, info, residual, aggs, group_positions, workers, stats, agg_stats)
+            else:
+                groups = hash_aggregate(rows, group_positions, aggs, agg_stats)
+
             results = []
-            for grp_val, grp_rows in groups.items():
-                if aggregate == "COUNT":
-                    result = len(grp_rows)
-                else:
-                    idx = columns.index(agg_column)
-                    nums = [float(r[idx]) for r in grp_rows if r[idx] != "NULL"]
-                    
-                    if not nums:
-                        result = "NULL"
-                    elif aggregate == "SUM":
-                        result = sum(nums)
-                    elif aggregate == "AVG":
-                        result = sum(nums) / len(nums)
-                    elif aggregate == "MIN":
-                        result = min(nums)
-                    elif aggregate == "MAX":
-                        result = max(nums)
-                
-                results.append((grp_val, result))
+            
+            for key, state in groups:
+                values = final_values(state, aggs)
+                if having_match is None or having_match(list(key) + values):
+                    results.append((key, values))
             
             # Handle ORDER BY
             if order_by:
                 order_column, order_direction = order_by
+                j = _order_aggregate(aggs, order_column)
                 
                 # Check if ordering by aggregate function
-                if order_column.upper().startswith(aggregate.upper()):
-                    # Order by aggregate result (second element in tuple)
-                    results.sort(key=lambda x: x[1] if x[1] != "NULL" else float('-inf'), 
+                if j is not None:
+                    # Order by that aggregate's result
+                    results = external_sort(results, key=lambda x: x[1][j] if x[1][j] is not None else float('-inf'), 
                                 reverse=(order_direction == "DESC"))
                 else:
-                    # Order by group column (first element in tuple)
-                    results.sort(key=lambda x: x[0], 
+                    # Order by a group column, the first one by default
+                    g = group_by.index(order_column) if order_column in group_by else 0
+                    results = external_sort(results, key=lambda x: (x[0][g] is not None, x[0][g]), 
                                 reverse=(order_direction == "DESC"))
             
             # Print results
-            print(f"\n{group_by} | {agg_display}")
+            print("\n" + " | ".join(group_by + [a.label for a in aggs[:shown]]))
             print("-" * 40)
             
-            for grp_val, result in results:
-                print(f"{grp_val} | {result}")
+            for key, values in results:
+                print(" | ".join(format_value(v) for v in list(key) + values[:shown]))
             
-            print_trace("FILE SYSTEM", [
-                "Grouped aggregate computed"
-            ])
+            fs_trace = [
+                "Grouped aggregate computed",
+                f"Hash aggregate : {agg_stats.groups} group(s)"
+                + (f", {len(results)} after HAVING" if having else "")
+            ]
+
+            if agg_stats.partitions:
+                fs_trace.append(f"Spilled : {agg_stats.partitions} partition(s) aggregated from disk")
+
+            fs_trace.append(f"{stats.rows_read} row(s) read")
+            fs_trace += _zone_trace(zones)
+
+            print_trace("FILE SYSTEM", fs_trace)
             
             print_result("✅ Aggregate Operation Completed")
             return
@@ -158,35 +317,40 @@ def select_rows(
         # SIMPLE AGGREGATE (NO GROUP BY)
         # ===========================
 
-        if aggregate == "COUNT":
-            result = len(filtered)
-            print(f"\nCOUNT = {result}")
-
+        if vector_aggregates and vector_supported(info, _aggregate_columns(aggs)):
+            state = vector_aggregate(heap, info, residual, aggs, stats, zones)
+        elif workers > 1:
+            state = parallel_aggregate(heap, info, residual, aggs, workers, stats)
         else:
-            idx = columns.index(agg_column)
-            nums = [float(r[idx]) for r in filtered]
+            state = new_state(aggs)
 
-            if not nums:
-                print("No rows")
-                return
+            for row in rows:
+                update_state(state, aggs, row)
 
-            if aggregate == "SUM":
-                result = sum(nums)
+        values = final_values(state, aggs)
 
-            elif aggregate == "AVG":
-                result = sum(nums) / len(nums)
+        if len(aggs) == 1:
+            agg, result = aggs[0], values[0]
 
-            elif aggregate == "MIN":
-                result = min(nums)
+            if agg.func == "COUNT":
+                print(f"\nCOUNT = {result}")
 
-            elif aggregate == "MAX":
-                result = max(nums)
+            elif result is None:
+                print("No rows")
+                return
+
+            else:
+                print(f"\n{agg.func}({agg.column}) = {result}")
 
-            print(f"\n{aggregate}({agg_column}) = {result}")
+        else:
+            print()
+            for agg, result in zip(aggs, values):
+                print(f"{agg.label} = {format_value(result)}")
 
         print_trace("FILE SYSTEM", [
-            "Aggregate computed"
-        ])
+            "Aggregate computed",
+            f"{stats.rows_read} row(s) read"
+        ] + _zone_trace(zones))
 
         print_result("✅ Aggregate Operation Completed")
         return
@@ -198,16 +362,71 @@ def select_rows(
     if selected_columns == ["*"]:
         selected_columns = columns
 
-    indexes = [columns.index(c) for c in selected_columns]
+    indexes = [info.position(c) for c in selected_columns]
 
     print("\nResult:")
     print(" | ".join(selected_columns))
 
-    for r in filtered:
-        print(" | ".join([r[i] for i in indexes]))
+    # Rows are printed as the pipeline produces them
+    returned = 0
+
+    for r in project_rows(rows, indexes):
+        print(" | ".join([format_value(v) for v in r]))
+        returned += 1
 
     print_trace("FILE SYSTEM", [
-        f"{len(filtered)} row(s) returned"
-    ])
+        f"{returned} row(s) returned",
+        f"{stats.rows_read} row(s) read"
+    ] + _zone_trace(zones))
 
     print_result("✅ SELECT Operation Completed")
+
+
+def _zone_trace(zones):
+    """Trace line of the zones a zone filter skipped (in this process)"""
+    if zones is None or not zones.skipped:
+        return []
+    return [f"Zone Map : {zones.skipped} of {len(zones.zones)} zone(s) skipped"]
+
+
+def _order_aggregate(aggs, order_column):
+    """Index of the aggregate an ORDER BY refers to, or None"""
+    for j, agg in enumerate(aggs):
+        if order_column.upper() == agg.label.upper():
+            return j
+
+    for j, agg in enumerate(aggs):
+        if order_column.upper().startswith(agg.func):
+            return j
+
+    return None
+
+
+def _aggregate_columns(aggs):
+    """Columns the aggregates read (COUNT reads none)"""
+    return [a.column for a in aggs if a.func != "COUNT"]
+
+
+def _referenced_columns(info, selected_columns, aggregate, agg_column, aggregates,
+                        group_by, order_by, having, condition):
+    """Table columns a query reads, in table order"""
+    needed = set(condition_columns(condition))
+
+    if aggregate or having:
+        items = list(aggregates or [(aggregate, agg_column)])
+        items += condition_aggregates(having) if having else []
+        if order_by and parse_label(order_by[0]):
+            items.append(parse_label(order_by[0]))
+
+        needed.update(column for func, column in items if func and func != "COUNT")
+        needed.update(group_by or [])
+    else:
+        if selected_columns == ["*"]:
+            needed.update(info.columns)
+        else:
+            needed.update(selected_columns)
+
+    if order_by and order_by[0] in info.positions:
+        needed.add(order_by[0])
+
+    return [col for col in info.columns if col in needed]
@@ -0,0 +1,77 @@
+"""
+Access to table data files
+
+A table is stored by one of the ENGINES, recorded in its metadata:
+HEAP (row-wise slotted pages, the default) or COLUMNAR (one file per
+column), either of them optionally compressed in blocks (COMPRESSION).
+Every file keeps a zone map of its numeric columns next to it.
+All file types offer the same methods, so the handlers do not need to
+know which one they are working with.
+"""
+from .heapfile import HeapFile
+from .columnfile import ColumnFile
+from .compression import CompressedHeapFile
+from .dictionary import encoded_columns
+from .zonemap import ZoneMap, ZONE_PAGES, zone_path
+from .catalog import get_dictionary
+from utils import table_paths, cast_value
+
+ENGINES = ["HEAP", "COLUMNAR"]
+
+
+def column_types(metadata):
+    return [c[1] for c in metadata["columns"]]
+
+
+def table_engine(metadata):
+    return (metadata.get("engine") or "HEAP").upper()
+
+
+def table_file(path, metadata, dictionary=None):
+    """
+    The HeapFile or ColumnFile at path; dictionary is the table's value
+    dictionary when it has dictionary encoded columns
+    """
+    encoded = dictionary.encoding(metadata) if dictionary is not None else None
+    compression = metadata.get("compression")
+    types = column_types(metadata)
+
+    # A zone is one block of a column store, ZONE_PAGES pages of a heap
+    if table_engine(metadata) == "COLUMNAR":
+        zonemap = ZoneMap(zone_path(path), types, 1)
+        return ColumnFile(path, types, encoded, compression, zonemap)
+
+    zonemap = ZoneMap(zone_path(path), types, ZONE_PAGES)
+    if compression:
+        return CompressedHeapFile(path, types, encoded, compression, zonemap)
+    return HeapFile(path, types, encoded, zonemap)
+
+
+def table_dictionary(table, metadata):
+    """The value dictionary of a table, or None if it encodes no column"""
+    return get_dictionary(table) if encoded_columns(metadata) else None
+
+
+def open_table(table, metadata):
+    """
+    Return the heap file of a table. Tables still stored as comma
+    separated text are converted on first access, and files of an older
+    format version upgraded.
+    """
+    tbl, _ = table_paths(table)
+    heap = table_file(tbl, metadata, table_dictionary(table, metadata))
+
+    if heap.is_legacy():
+        types = column_types(metadata)
+        heap.convert_legacy(
+            lambda value, i: None if value == "NULL" else cast_value(value, types[i])
+        )
+
+        # Old index files point at text offsets
+        from .indexes import drop_indexes
+        drop_indexes(table)
+
+    elif heap.is_outdated():
+        heap.upgrade()
+
+    return heap
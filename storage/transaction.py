@@ -0,0 +1,113 @@
+"""
+The open transaction of the session (BEGIN ... COMMIT / ROLLBACK)
+
+While a transaction is open, INSERT, UPDATE and DELETE are validated and
+queued per table instead of being written:
+
+  - ("INSERT", rows)            rows of typed values
+  - ("UPDATE", assign, matches) assign(vals) changes a matching row in place
+  - ("DELETE", matches)
+
+matches is a compiled WHERE condition, or None for every row. COMMIT
+applies the queue of every table in one pass (transaction_storage.py);
+ROLLBACK drops the queues, as nothing was written.
+
+Statements inside the transaction see its own changes: a table with
+queued changes is read from memory, as its rows with the queue applied
+(PendingTable), instead of through its files and indexes.
+"""
+
+_current = None
+
+
+class Transaction:
+
+    def __init__(self):
+        self.tables = {}    # table -> [queued change], in statement order
+        self.statements = 0
+
+
+def in_transaction():
+    return _current is not None
+
+
+def begin():
+    global _current
+    if _current is not None:
+        raise Exception("A transaction is already open")
+    _current = Transaction()
+
+
+def end():
+    """Close the open transaction and return it"""
+    global _current
+    if _current is None:
+        raise Exception("No transaction is open")
+    txn, _current = _current, None
+    return txn
+
+
+def queue(table, change):
+    """Add a change to the open transaction; returns the table's queue length"""
+    changes = _current.tables.setdefault(table, [])
+    changes.append(change)
+    _current.statements += 1
+    return len(changes)
+
+
+def queued_changes(table):
+    """The changes queued for a table by the open transaction ([] if none)"""
+    if _current is None:
+        return []
+    return _current.tables.get(table, [])
+
+
+def apply_changes(rows, changes):
+    """Apply queued changes to a list of rows in order; returns the new list"""
+    for change in changes:
+        kind = change[0]
+
+        if kind == "INSERT":
+            rows.extend(list(vals) for vals in change[1])
+
+        elif kind == "UPDATE":
+            _, assign, matches = change
+            for vals in rows:
+                if matches is None or matches(vals):
+                    assign(vals)
+
+        elif kind == "DELETE":
+            matches = change[1]
+            rows = [vals for vals in rows if matches is not None and not matches(vals)]
+
+    return rows
+
+
+class PendingTable:
+    """
+    A table as its open transaction sees it: the stored rows with the
+    queued changes applied, held in memory. Offers the scan methods of a
+    table file; rids are (0, row number).
+    """
+
+    ENGINE = "PENDING"
+
+    def __init__(self, table_file, changes):
+        self.path = table_file.path
+        self.codec = table_file.codec
+        self.rows = apply_changes([vals for _, vals in table_file.scan()], changes)
+
+    def page_count(self):
+        return 0
+
+    def count(self):
+        return len(self.rows)
+
+    def scan(self, first=0, last=None, zones=None):
+        for i, vals in enumerate(self.rows[first:last], first):
+            yield (0, i), list(vals)
+
+    def fetch(self, rids):
+        for rid in sorted(set(rids)):
+            if rid[1] < len(self.rows):
+                yield rid, list(self.rows[rid[1]])
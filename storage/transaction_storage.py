@@ -0,0 +1,165 @@
+"""
+Storage operations for BEGIN, COMMIT and ROLLBACK
+
+Changes queued by a transaction (see transaction.py) are written at
+COMMIT with one pass per table:
+
+  - a table that only received INSERTs gets all their rows appended in
+    one write, as one multi-row INSERT would
+  - any other table is read once and has its queue applied in memory in
+    statement order, keeping track of which stored row each result comes
+    from; the net changes then go through the same paths as DELETE,
+    UPDATE and INSERT: rows gone are marked dead, changed rows are
+    overwritten in place (or relocated) and new rows appended, with
+    their index entries moved one by one
+
+Every table is planned and checked (primary keys) before the first one is
+written. COMMIT is one statement for the write-ahead log (wal.py): the
+writes to all its tables end with one COMMIT record, so a COMMIT that
+fails or is cut short by a crash is undone on every table. The
+transaction is closed either way.
+"""
+from visualizer import print_trace, print_result
+from .indexes import pk_key, add_to_indexes, remove_from_indexes
+from .insert_storage import check_primary_key, pk_violation
+from .update_storage import write_updates
+from .vacuum_storage import autovacuum
+from .table import open_table
+from .catalog import get_table
+from .transaction import begin, end, apply_changes
+
+
+def begin_transaction():
+    begin()
+
+    print_trace("STORAGE ENGINE", [
+        "Transaction opened",
+        "INSERT / UPDATE / DELETE are queued per table until COMMIT"
+    ])
+
+    print_result("✅ Transaction Started")
+
+
+def rollback_transaction():
+    txn = end()
+
+    # Nothing was written, so there is nothing to undo
+    print_trace("STORAGE ENGINE", [
+        f"Discarded : {txn.statements} queued statement(s) on {len(txn.tables)} table(s)",
+        "No file touched"
+    ])
+
+    print_result("✅ Transaction Rolled Back")
+
+
+def commit_transaction():
+    txn = end()
+
+    try:
+        plans = [_plan(table, changes) for table, changes in txn.tables.items()]
+    except Exception as e:
+        raise Exception(f"{e} (transaction rolled back)")
+
+    trace = []
+    written = []
+
+    for table, heap, info, deleted, updated, inserted in plans:
+        metadata = info.metadata
+
+        # Deletes first and inserts last, so a key freed by the queue can
+        # be taken again within it
+        if deleted:
+            heap.delete([rid for rid, _ in deleted])
+            remove_from_indexes(table, metadata, deleted)
+
+        moved = write_updates(table, info, heap, updated) if updated else {}
+
+        if inserted:
+            rids = heap.append(inserted)
+            add_to_indexes(table, metadata, list(zip(rids, inserted)))
+
+        if not deleted and not updated:
+            trace.append(f"{table} : {len(inserted)} row(s) appended in one write")
+        else:
+            trace.append(
+                f"{table} : {len(deleted)} deleted, {len(updated)} updated "
+                f"({len(moved)} relocated), {len(inserted)} appended"
+            )
+            if autovacuum(table, heap):
+                trace.append(f"{table} : queued for background compaction")
+
+        written.append(
+            f"{table}.tbl : {len(deleted)} row(s) marked dead, "
+            f"{len(updated) - len(moved)} overwritten in place, "
+            f"{len(moved) + len(inserted)} appended"
+        )
+
+    print_trace("STORAGE ENGINE", [
+        f"Applying {txn.statements} queued statement(s) on {len(plans)} table(s)"
+    ] + trace)
+
+    if written:
+        print_trace("FILE SYSTEM", written)
+
+    print_result("✅ Transaction Committed")
+
+
+def _plan(table, changes):
+    """
+    (table, table file, info, deleted, updated, inserted) for one table's
+    queue: the (rid, values) rows it removes, the (rid, old values, new
+    values) rows it changes and the new rows it adds
+    """
+    info = get_table(table)
+    heap = open_table(table, info.metadata)
+
+    if all(change[0] == "INSERT" for change in changes):
+        rows = [vals for change in changes for vals in change[1]]
+        check_primary_key(table, info, rows)
+        return table, heap, info, [], [], rows
+
+    # The queue works on copies of the stored rows; a copy's identity
+    # leads back to its record. stored keeps every copy alive, so no
+    # identity is reused by a row the queue creates
+    stored = {}
+    for rid, vals in heap.scan():
+        row = list(vals)
+        stored[id(row)] = (rid, vals, row)
+
+    rows = apply_changes([row for _, _, row in stored.values()], changes)
+    _check_keys(info, rows)
+
+    kept = {id(row) for row in rows}
+    deleted = [(rid, vals) for key, (rid, vals, _) in stored.items() if key not in kept]
+    updated = []
+    inserted = []
+
+    for row in rows:
+        if id(row) not in stored:
+            inserted.append(row)
+        else:
+            rid, vals, _ = stored[id(row)]
+            if row != list(vals):
+                updated.append((rid, vals, row))
+
+    return table, heap, info, deleted, updated, inserted
+
+
+def _check_keys(info, rows):
+    """Raise unless the primary key of every row is set and unique"""
+    if not info.primary_key:
+        return
+
+    seen = set()
+
+    for vals in rows:
+        for (i, _), pk_col in zip(info.pk_positions, info.primary_key):
+            if vals[i] is None:
+                raise Exception(
+                    f"Primary Key column '{pk_col}' cannot be NULL"
+                )
+
+        key = pk_key(vals, info.pk_positions)
+        if key in seen:
+            raise pk_violation(info, vals)
+        seen.add(key)
@@ -2,22 +2,30 @@
 Storage operations for TRUNCATE TABLE
 """
 from visualizer import print_trace, print_result
-from utils import table_paths, check_table_exists
+from .indexes import clear_indexes
+from .table import open_table
+from .dictionary import encoded_columns
+from .catalog import get_table, get_dictionary
 
 
 def truncate_table(command):
     """Delete all rows from a table while keeping the structure"""
     
     table = command["table"]
-    tbl, meta = table_paths(table)
-    check_table_exists(tbl, meta)
+    metadata = get_table(table).metadata
     
     # Count existing rows before truncation
-    rows = open(tbl).readlines()
-    row_count = len(rows)
+    heap = open_table(table, metadata)
+    row_count = heap.count()
     
-    # Clear the table data
-    open(tbl, "w").write("")
+    # Clear the table data; dictionary codes start over
+    heap.truncate()
+    clear_indexes(table, metadata)
+
+    if encoded_columns(metadata):
+        dictionary = get_dictionary(table)
+        dictionary.clear()
+        dictionary.save()
     
     print_trace("STORAGE ENGINE", [
         f"Truncating table: {table}",
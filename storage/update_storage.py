@@ -1,69 +1,322 @@
 """
 Storage operations for UPDATE
+
+Matching rows are found the way DELETE finds them and written back in
+place (see the update method of each table file): only the pages or
+blocks they are on are written. A row whose new record does not fit its
+old slot moves to the end of the table, leaving a tombstone, and its
+index entries follow it.
+
+All assignments of a SET are compiled into one function of the row
+(compile_set), so any number of columns is changed in the same scan and
+the same write.
 """
-import json
+import operator
 from visualizer import print_trace, print_result
 from utils import (
     table_paths,
-    check_table_exists,
-    remove_quotes,
-    compare,
+    parse_value,
+    format_condition,
+    format_expression,
     validate_value
 )
+from .indexes import (
+    NUMERIC_TYPES,
+    index_scan,
+    indexed_positions,
+    pk_key,
+    pk_lookup,
+    add_to_indexes,
+    remove_from_indexes
+)
+from .table import open_table
+from .catalog import get_table
+from .predicates import compile_condition
+from .zonemap import zone_filter
+from .parallel import parallel_degree, parallel_rids
+from .insert_storage import pk_violation
+from .transaction import in_transaction, queue
+from .vacuum_storage import autovacuum
+
+ARITHMETIC = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul
+}
 
 
 def update_row(table, set_data, condition):
     """
     Update rows in a table based on condition
     """
-    tbl, meta = table_paths(table)
-    check_table_exists(tbl, meta)
+    tbl, _ = table_paths(table)
 
-    metadata = json.load(open(meta))
-    columns = [c[0] for c in metadata["columns"]]
+    info = get_table(table)
+    metadata = info.metadata
 
-    set_col, set_val = set_data
-    cond_col, op, cond_val = condition
+    assign = compile_set(info, set_data)
 
-    dtype = None
+    if in_transaction():
+        matches = compile_condition(info, condition, dictionary=False) if condition else None
+        pending = queue(table, ("UPDATE", assign, matches))
 
-    for c in metadata["columns"]:
-        if c[0] == set_col:
-            dtype = c[1]
+        print_trace("STORAGE ENGINE", [
+            f"Updating rows where {format_condition(condition)}",
+            f"Set : {format_set(set_data)}",
+            f"Queued in transaction : {pending} change(s) pending for {table}"
+        ])
 
-    validate_value(set_val, dtype)
+        print_result("✅ UPDATE Queued until COMMIT")
+        return
 
-    if dtype.upper() in ["CHAR", "VARCHAR"]:
-        set_val = remove_quotes(set_val)
+    heap = open_table(table, metadata)
 
-    si = columns.index(set_col)
-    ci = columns.index(cond_col)
+    # An index narrows the search down to a few rows
+    rids, index_used, residual = index_scan(table, metadata, condition)
 
-    new = []
-    updated = 0
+    # Without an index the matching rows may be found by worker processes
+    workers = parallel_degree(heap) if rids is None and residual else 1
+    if workers > 1:
+        rids, residual = parallel_rids(heap, info, residual, workers), None
 
-    for row in open(tbl):
-        vals = row.strip().split(",")
+    matches = compile_condition(info, residual) if residual else None
 
-        if compare(
-            vals[ci],
-            op,
-            cond_val
-        ):
-            vals[si] = set_val
-            updated += 1
+    # Zones whose value ranges cannot match are not read
+    zones = zone_filter(heap, info, residual) if rids is None else None
 
-        new.append(",".join(vals) + "\n")
+    source = heap.fetch(rids) if rids is not None else heap.scan(zones=zones)
+    changed = []
 
-    open(tbl, "w").writelines(new)
+    for rid, vals in source:
+        if matches is None or matches(vals):
+            new = list(vals)
+            assign(new)
+            changed.append((rid, vals, new))
 
-    print_trace("STORAGE ENGINE", [
-        f"Updating rows where {cond_col} {op} {cond_val}",
-        f"Rows Updated : {updated}"
-    ])
+    updated = len(changed)
+
+    # =====================================
+    # PRIMARY KEY CHECK
+    # =====================================
+
+    if updated and any(set_col in info.primary_key for set_col, _ in set_data):
+        positions = info.pk_positions
+        changed_rids = {rid for rid, _, _ in changed}
+        seen = set()
+
+        for rid, _, vals in changed:
+            for (i, _), pk_col in zip(positions, info.primary_key):
+                if vals[i] is None:
+                    raise Exception(
+                        f"Primary Key column '{pk_col}' cannot be NULL"
+                    )
+
+            key = pk_key(vals, positions)
+            owner = pk_lookup(table, metadata, key)
+            if key in seen or (owner is not None and owner not in changed_rids):
+                raise pk_violation(info, vals)
+            seen.add(key)
+
+    moved = write_updates(table, info, heap, changed) if updated else {}
+
+    in_place = updated - len(moved)
+
+    trace = [
+        f"Updating rows where {format_condition(condition)}",
+        f"Set : {format_set(set_data)}",
+        f"Index Lookup : {index_used or 'none (full scan)'}",
+        f"Rows Updated : {updated}",
+        f"In Place : {in_place}",
+        f"Relocated : {len(moved)}"
+    ]
+
+    if workers > 1:
+        trace.insert(3, f"Parallel Scan : {workers} workers")
+
+    if zones is not None:
+        trace.insert(3, f"Zone Map : {zones.skipped} zone(s) skipped")
+
+    if updated and autovacuum(table, heap):
+        trace.append("Autovacuum : table queued for background compaction")
+
+    print_trace("STORAGE ENGINE", trace)
 
     print_trace("FILE SYSTEM", [
-        f"{table}.tbl rewritten"
+        f"{table}.tbl : {in_place} record(s) overwritten in place, {len(moved)} relocated"
     ])
 
     print_result("✅ UPDATE Completed")
+
+
+def write_updates(table, info, heap, changed):
+    """
+    Write (rid, old values, new values) rows over their records and bring
+    the indexes up to date; returns {old rid: new rid} for the rows that
+    moved
+    """
+    metadata = info.metadata
+
+    # Records are overwritten where they are; the ones that grew move
+    moved = heap.update([(rid, new) for rid, _, new in changed])
+
+    # Index entries change for moved rows and for changed keys only
+    # (a moved row keeps its key, which the Bloom filter already holds)
+    positions = info.pk_positions
+    indexed = indexed_positions(metadata)
+    rekeyed = []
+    relocated = []
+    secondary = []
+
+    for rid, old, new in changed:
+        if pk_key(old, positions) != pk_key(new, positions):
+            rekeyed.append((rid, old, new))
+        elif rid in moved:
+            relocated.append((rid, old, new))
+        elif any(old[i] != new[i] for i in indexed):
+            secondary.append((rid, old, new))
+
+    for rows, primary, new_keys in ((rekeyed, True, True), (relocated, True, False), (secondary, False, False)):
+        if rows:
+            remove_from_indexes(table, metadata, [(rid, old) for rid, old, _ in rows], primary)
+            add_to_indexes(
+                table, metadata, [(moved.get(rid, rid), new) for rid, _, new in rows], primary, new_keys
+            )
+
+    return moved
+
+
+def format_set(set_data):
+    return ", ".join(f"{col} = {format_expression(expr)}" for col, expr in set_data)
+
+
+def compile_set(info, set_data):
+    """
+    Validate the SET assignments [(column, expression)] against the column
+    types once; returns a function that applies all of them to a row in
+    place. Every expression sees the row as it was before the UPDATE.
+    """
+    targets = []
+    evaluators = []
+
+    for set_col, expression in set_data:
+        si = info.position(set_col)
+        if si in targets:
+            raise Exception(f"Column {set_col} is assigned more than once")
+
+        targets.append(si)
+        evaluators.append(_compile_assignment(info, set_col, info.types[si].upper(), expression))
+
+    if len(targets) == 1:
+        si, evaluate = targets[0], evaluators[0]
+
+        def assign(vals):
+            vals[si] = evaluate(vals)
+        return assign
+
+    assignments = list(zip(targets, evaluators))
+
+    def assign(vals):
+        new = [(si, evaluate(vals)) for si, evaluate in assignments]
+        for si, value in new:
+            vals[si] = value
+    return assign
+
+
+def _compile_assignment(info, set_col, dtype, expression):
+    """Function of a row giving the value stored in set_col"""
+
+    # ---------- literal ----------
+
+    if isinstance(expression, str) and expression not in info.positions:
+        validate_value(expression, dtype)
+        value = parse_value(expression, dtype)
+        return lambda vals: value
+
+    evaluate, result = _compile_expression(info, expression)
+
+    # ---------- column or arithmetic ----------
+
+    if dtype in NUMERIC_TYPES:
+        if result not in NUMERIC_TYPES or (dtype == "INT" and result == "DOUBLE"):
+            raise Exception(f"Cannot assign {result} to {dtype} column {set_col}")
+        if dtype == "DOUBLE" and result == "INT":
+            return lambda vals: _to_double(evaluate(vals))
+        return evaluate
+
+    if result in NUMERIC_TYPES:
+        raise Exception(f"Cannot assign {result} to {dtype} column {set_col}")
+    return evaluate
+
+
+def _compile_expression(info, expression):
+    """
+    (function of a row, result type) for a column or an arithmetic
+    expression; any NULL operand makes the result NULL
+    """
+    if isinstance(expression, str):
+        if expression in info.positions:
+            ci = info.positions[expression]
+            return (lambda vals: vals[ci]), info.types[ci].upper()
+
+        value = _number(expression)
+        return (lambda vals: value), "INT" if isinstance(value, int) else "DOUBLE"
+
+    if expression["type"] == "NEGATE":
+        operand, result = _numeric_operand(info, expression["operand"])
+
+        def negate(vals):
+            value = operand(vals)
+            return None if value is None else -value
+        return negate, result
+
+    op = expression["op"]
+    left, left_type = _numeric_operand(info, expression["left"])
+    right, right_type = _numeric_operand(info, expression["right"])
+    result = "INT" if left_type == right_type == "INT" else "DOUBLE"
+    apply = ARITHMETIC[op] if op != "/" else (_int_divide if result == "INT" else _divide)
+
+    def arithmetic(vals):
+        a = left(vals)
+        b = right(vals)
+        if a is None or b is None:
+            return None
+        return apply(a, b)
+    return arithmetic, result
+
+
+def _numeric_operand(info, expression):
+    evaluate, result = _compile_expression(info, expression)
+    if result not in NUMERIC_TYPES:
+        raise Exception(f"Arithmetic needs numbers: {format_expression(expression)} is {result}")
+    return evaluate, result
+
+
+def _number(literal):
+    """A numeric literal of an expression as an int or a float"""
+    try:
+        return int(literal)
+    except ValueError:
+        pass
+
+    try:
+        return float(literal)
+    except ValueError:
+        raise Exception(f"Invalid value in SET expression: {literal} (not a column or a number)")
+
+
+def _to_double(value):
+    return None if value is None else float(value)
+
+
+def _divide(a, b):
+    if b == 0:
+        raise Exception("Division by zero in SET expression")
+    return a / b
+
+
+def _int_divide(a, b):
+    """INT / INT truncates toward zero, as in SQL"""
+    if b == 0:
+        raise Exception("Division by zero in SET expression")
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
@@ -0,0 +1,120 @@
+"""
+Storage operations for VACUUM, and background compaction
+
+DELETE, and UPDATE when it moves a grown row or replaces a column
+store block, leave dead rows in the table files (tombstones, see
+heapfile.py, compression.py and columnfile.py). VACUUM table rewrites
+the table without them and rebuilds its indexes, as the rows get new
+rids.
+
+After such a statement, a table whose share of dead rows reached
+config.AUTOVACUUM is compacted the same way by a background thread
+between statements: the thread and execute_query both hold
+statement_lock, so compaction never runs during a statement.
+"""
+import threading
+import config
+from visualizer import print_trace, print_result
+from .indexes import rebuild_indexes
+from .table import open_table
+from .catalog import get_table
+from .wal import commit, rollback
+
+# Held by every statement and by background compaction
+statement_lock = threading.RLock()
+
+# Tables waiting for background compaction, and the thread working on them
+_queued = []
+_worker = None
+
+
+def compact(table):
+    """Rewrite a table without its dead rows; returns (size before, size after) in pages"""
+    info = get_table(table)
+    heap = open_table(table, info.metadata)
+    before = heap.page_count()
+
+    heap.rewrite(record for _, record in heap.scan_records())
+    rebuild_indexes(table, info.metadata)
+
+    return before, heap.page_count()
+
+
+def vacuum_table(table):
+    """Reclaim the space of the rows deleted from a table"""
+    info = get_table(table)
+    heap = open_table(table, info.metadata)
+    unit = "Blocks" if heap.ENGINE == "COLUMNAR" else "Pages"
+    dead = heap.dead_ratio()
+
+    if not dead:
+        print_trace("STORAGE ENGINE", [
+            f"Dead Bytes : none in {table}",
+            "Nothing to reclaim"
+        ])
+        print_result("✅ VACUUM Completed")
+        return
+
+    before, after = compact(table)
+
+    print_trace("STORAGE ENGINE", [
+        f"Dead Bytes : {dead:.1%} of the stored rows of {table}",
+        "Live rows copied to a new file, indexes rebuilt",
+        f"{unit} : {before} -> {after}"
+    ])
+
+    print_trace("FILE SYSTEM", [
+        f"{table}.tbl rewritten"
+    ])
+
+    print_result("✅ VACUUM Completed")
+
+
+# ===================================
+# BACKGROUND COMPACTION
+# ===================================
+
+def autovacuum(table, heap):
+    """
+    Queue a table for background compaction if enough of it is dead;
+    called by DELETE and UPDATE, inside statement_lock. Returns True when queued.
+    """
+    global _worker
+
+    ratio = config.get_autovacuum()
+    if ratio is None or heap.dead_ratio() < ratio:
+        return False
+
+    with statement_lock:
+        if table not in _queued:
+            _queued.append(table)
+
+        if _worker is None:
+            # Not a daemon: an exit waits for a compaction under way
+            _worker = threading.Thread(target=_compact_queued, name="minidb-autovacuum")
+            _worker.start()
+
+    return True
+
+
+def _compact_queued():
+    global _worker
+
+    while True:
+        with statement_lock:
+            if not _queued:
+                _worker = None
+                return
+
+            table = _queued.pop(0)
+            ratio = config.get_autovacuum()
+
+            try:
+                info = get_table(table)
+                if ratio is not None and open_table(table, info.metadata).dead_ratio() >= ratio:
+                    compact(table)
+                    commit()
+            except Exception:
+                # Dropped or changed since the DELETE; nothing to do, and
+                # nothing left half done
+                rollback()
@@ -0,0 +1,368 @@
+"""
+Vectorized execution with NumPy
+
+Selected per session with SET EXECUTION VECTOR (config.EXECUTION). A full
+scan then reads the heap file BATCH_PAGES pages at a time and works on
+whole columns instead of single rows:
+
+  - the slot arrays of every page in the batch give the record offsets
+  - an INT or DOUBLE column sits at a fixed offset inside every record
+    (after the flags byte and the null bitmap), so it is gathered
+    straight from the page bytes into an int64 / float64 array, and its
+    NULL flags from the bitmap, without decoding any row
+  - a WHERE condition becomes a boolean mask over the batch
+  - aggregates are reduced per batch (per group with np.bincount and
+    ufunc.at) and merged into the usual accumulator states; the states of
+    GROUP BY are merged through the spilling hash aggregation, within the
+    aggregate memory budget
+
+Only INT / DOUBLE columns are handled this way, plus dictionary encoded
+text columns, whose 4 byte codes are filtered and grouped like numbers.
+Rows a query returns are decoded only when they pass the mask, and
+queries whose filter, groups or aggregates read other text columns run
+row by row as before. Per batch
+partial sums are added together, so a DOUBLE SUM / AVG may differ from
+row-by-row execution in the last digits.
+
+NumPy is optional; without it the session stays in ROW execution.
+"""
+from operator import itemgetter
+import config
+from utils import remove_quotes
+from .heapfile import PAGE_SIZE, PAGE_HEADER, SLOT, NUMERIC_TYPES
+from .predicates import OPERATORS, _literal_number, dictionary_matches
+from .aggregates import new_state, merge_state
+from .external_aggregate import external_aggregate
+from .dictionary import encoded_columns
+from .catalog import get_dictionary
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BATCH_PAGES = 256
+
+
+def vector_enabled(heap):
+    """
+    True when the session asked for vectorized execution, NumPy is there
+    and the table is a heap file
+    """
+    return np is not None and config.get_execution() == "VECTOR" and heap.ENGINE == "HEAP"
+
+
+def condition_columns(condition):
+    """Columns a WHERE condition reads"""
+    if condition is None:
+        return []
+
+    if isinstance(condition, tuple):
+        return [condition[0]]
+
+    if condition["type"] == "NOT":
+        return condition_columns(condition["condition"])
+
+    return [col for c in condition["conditions"] for col in condition_columns(c)]
+
+
+def vector_supported(info, columns, codes=False):
+    """
+    True if every one of the columns is INT or DOUBLE, or, with codes,
+    dictionary encoded (for filters and groups)
+    """
+    encoded = encoded_columns(info.metadata) if codes else []
+    return all(
+        info.types[info.position(col)].upper() in NUMERIC_TYPES or col in encoded
+        for col in columns
+    )
+
+
+# ===================================
+# BATCHES
+# ===================================
+
+def _u16(buf, pos):
+    return buf[pos].astype(np.int64) | buf[pos + 1].astype(np.int64) << 8
+
+
+class _Batch:
+    """The live records of a run of pages, with columns extracted on demand"""
+
+    def __init__(self, data, pages, layout):
+        self.data = data
+        self.layout = layout
+        buf = self.buf = np.frombuffer(data, np.uint8, pages * PAGE_SIZE)
+
+        # ---------- record offsets from the slot arrays ----------
+
+        bases = np.arange(pages, dtype=np.int64) * PAGE_SIZE
+        counts = _u16(buf, bases + 8)
+        total = int(counts.sum())
+
+        page_of = np.repeat(bases, counts)
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        slots = page_of + PAGE_HEADER.size + (np.arange(total) - first) * SLOT.size
+
+        live = _u16(buf, slots + 2) > 0
+        self.records = page_of[live] + _u16(buf, slots[live])
+        self.count = len(self.records)
+
+        self._values = {}
+        self._nulls = {}
+
+    def values(self, i):
+        """Column i as an int64 / float64 / uint32 code array (0 where NULL)"""
+        if i not in self._values:
+            offset, dtype, size = self.layout[i]
+            index = (self.records + offset)[:, None] + np.arange(size)
+            self._values[i] = self.buf[index].view(dtype).ravel()
+        return self._values[i]
+
+    def nulls(self, i):
+        """Boolean array, True where column i is NULL"""
+        if i not in self._nulls:
+            byte = self.buf[self.records + 1 + i // 8]
+            self._nulls[i] = (byte >> (i % 8) & 1).astype(bool)
+        return self._nulls[i]
+
+
+def _layout(codec):
+    """
+    Offset inside a record, NumPy dtype and size of every INT / DOUBLE and
+    dictionary encoded column
+    """
+    layout = {}
+    offset = 1 + codec.null_bytes
+
+    for i, datatype in enumerate(codec.types):
+        if i in codec.encoded:
+            layout[i] = (offset, "<u4", 4)
+            offset += 4
+        elif datatype in NUMERIC_TYPES:
+            layout[i] = (offset, "<i8" if datatype == "INT" else "<f8", 8)
+            offset += 8
+        else:
+            offset += 2
+
+    return layout
+
+
+def _batches(heap, stats=None, zones=None):
+    layout = _layout(heap.codec)
+
+    for data in heap.page_batches(BATCH_PAGES, zones):
+        batch = _Batch(data, len(data) // PAGE_SIZE, layout)
+        if stats is not None:
+            stats.rows_read += batch.count
+        yield batch
+
+
+# ===================================
+# MASKS
+# ===================================
+
+def compile_mask(info, condition):
+    """
+    Return a function of a batch giving the boolean mask of the rows that
+    match a condition on INT / DOUBLE columns; same results as
+    predicates.compile_condition.
+    """
+    if isinstance(condition, tuple):
+        return _comparison_mask(info, condition)
+
+    kind = condition["type"]
+
+    if kind == "NOT":
+        inner = compile_mask(info, condition["condition"])
+        return lambda batch: ~inner(batch)
+
+    parts = [compile_mask(info, c) for c in condition["conditions"]]
+
+    def combine(batch):
+        mask = parts[0](batch)
+        for part in parts[1:]:
+            mask = mask & part(batch) if kind == "AND" else mask | part(batch)
+        return mask
+    return combine
+
+
+def _comparison_mask(info, condition):
+    column, op, literal = condition
+    i = info.position(column)
+
+    if op == "!=":
+        equal = _comparison_mask(info, (column, "=", literal))
+        return lambda batch: ~batch.nulls(i) & ~equal(batch)
+
+    if op not in OPERATORS:
+        raise Exception(f"Unsupported operator {op}")
+
+    cmp = OPERATORS[op]
+    literal = remove_quotes(literal)
+
+    if column in encoded_columns(info.metadata):
+        return _dictionary_mask(info, column, op, literal)
+
+    if literal == "NULL" and op == "=":
+        return lambda batch: batch.nulls(i)
+
+    number = _literal_number(literal)
+
+    if number is None:
+        return lambda batch: np.zeros(batch.count, bool)
+
+    return lambda batch: ~batch.nulls(i) & cmp(batch.values(i), number)
+
+
+def _dictionary_mask(info, column, op, literal):
+    """A comparison on a dictionary encoded column, tested on the codes"""
+    i = info.position(column)
+    entries = get_dictionary(info.table).column(column)
+
+    # "= NULL" also matches the text 'NULL', as in predicates.py
+    null = literal == "NULL" and op == "="
+
+    if null:
+        matching = {"NULL"} & entries.codes.keys()
+    else:
+        matching = dictionary_matches(info, column, op, literal)
+
+    codes = np.array(sorted(entries.codes[v] for v in matching), np.int64)
+
+    def mask(batch):
+        found = ~batch.nulls(i) & np.isin(batch.values(i), codes)
+        return found | batch.nulls(i) if null else found
+    return mask
+
+
+# ===================================
+# OPERATORS
+# ===================================
+
+def vector_rows(heap, info, condition, stats=None, zones=None):
+    """Yield the rows matching condition, decoding only those rows"""
+    mask = compile_mask(info, condition) if condition else None
+    decode = heap.codec.decode
+
+    for batch in _batches(heap, stats, zones):
+        records = batch.records if mask is None else batch.records[mask(batch)]
+        for offset in records.tolist():
+            yield decode(batch.data, offset)
+
+
+def _partials(batch, aggs, selected, groups, count):
+    """
+    Per group partial states of the selected rows, as a list of columns
+    (one per aggregate) of count entries each; groups holds the group
+    number of every selected row.
+    """
+    columns = []
+
+    for a in aggs:
+        if a.func == "COUNT":
+            columns.append(np.bincount(groups, minlength=count).tolist())
+            continue
+
+        valid = ~batch.nulls(a.position)[selected]
+        values = batch.values(a.position)[selected][valid].astype(np.float64)
+        where = groups[valid]
+        seen = np.bincount(where, minlength=count)
+
+        if a.func == "SUM" or a.func == "AVG":
+            totals = np.bincount(where, weights=values, minlength=count)
+            columns.append([[t, n] for t, n in zip(totals.tolist(), seen.tolist())])
+            continue
+
+        if a.func == "MIN":
+            result = np.full(count, np.inf)
+            np.fmin.at(result, where, values)
+        else:
+            result = np.full(count, -np.inf)
+            np.fmax.at(result, where, values)
+
+        columns.append([v if n else None for v, n in zip(result.tolist(), seen.tolist())])
+
+    return columns
+
+
+def vector_aggregate(heap, info, condition, aggs, stats=None, zones=None):
+    """Aggregate state of the rows matching condition"""
+    mask = compile_mask(info, condition) if condition else None
+    state = new_state(aggs)
+
+    for batch in _batches(heap, stats, zones):
+        selected = mask(batch) if mask else np.ones(batch.count, bool)
+        groups = np.zeros(int(selected.sum()), np.int64)
+
+        columns = _partials(batch, aggs, selected, groups, 1)
+        merge_state(state, [column[0] for column in columns], aggs)
+
+    return state
+
+
+def _group_codes(columns):
+    """
+    Number the group keys of a batch: rows get the same int64 code exactly
+    when all their (nulls, values) group columns are equal
+    """
+    codes = None
+
+    for nulls, values in columns:
+        # 0 stands for NULL, the distinct values are numbered from 1
+        part = np.zeros(len(values), np.int64)
+        unique, inverse = np.unique(values[~nulls], return_inverse=True)
+        part[~nulls] = inverse.ravel() + 1
+
+        if codes is None:
+            codes = part
+        else:
+            # renumber so the next multiplication cannot overflow
+            _, codes = np.unique(codes * (len(unique) + 1) + part, return_inverse=True)
+            codes = codes.ravel()
+
+    return codes
+
+
+def vector_group(heap, info, condition, aggs, positions, stats=None, zones=None, agg_stats=None):
+    """
+    Yield (group key, state) pairs of the rows matching condition, grouped
+    on the columns at positions, in the order the groups were first seen.
+    The states of the batches are merged within the aggregate memory
+    budget, spilling to disk past it (counted in agg_stats)
+    """
+    partials = _group_partials(heap, info, condition, aggs, positions, stats, zones)
+
+    for key, state in external_aggregate(partials, itemgetter(0), aggs, stats=agg_stats, merge=True):
+        yield key, state
+
+
+def _group_partials(heap, info, condition, aggs, positions, stats, zones):
+    """(group key, state) of every group of every batch, batch by batch"""
+    mask = compile_mask(info, condition) if condition else None
+    lookups = {i: column.values for i, column in heap.codec.encoded.items()}
+
+    for batch in _batches(heap, stats, zones):
+        selected = mask(batch) if mask else np.ones(batch.count, bool)
+        columns = [
+            (batch.nulls(i)[selected], batch.values(i)[selected])
+            for i in positions
+        ]
+
+        _, first, inverse = np.unique(_group_codes(columns), return_index=True, return_inverse=True)
+        partials = _partials(batch, aggs, selected, inverse.ravel(), len(first))
+
+        # Python values of every group key, taken from its first row;
+        # dictionary codes are looked up once per group
+        fields = [
+            (nulls[first].tolist(), values[first].tolist(), lookups.get(i))
+            for i, (nulls, values) in zip(positions, columns)
+        ]
+
+        # Groups are added in the order of their first row
+        for g in np.argsort(first, kind="stable").tolist():
+            key = tuple(
+                None if nulls[g] else values[g] if lookup is None else lookup[values[g]]
+                for nulls, values, lookup in fields
+            )
+            yield key, [partial[g] for partial in partials]
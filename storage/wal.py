@@ -0,0 +1,526 @@
+"""
+Write-ahead log
+
+Every change a statement makes to a table in place is appended to one
+log, data/minidb.wal, before it is written to the table's files:
+
+  - WRITE  : bytes written at an offset of a file, optionally cutting the
+             file after them (the pages an INSERT, UPDATE or DELETE
+             changed, the blocks of a compressed or column store table),
+             with the bytes they replace and the old size of the file
+  - FILE   : the new contents of a small file written as a whole (a value
+             dictionary, a column store's block directory), with the old
+             contents
+  - SWAP   : table files rewritten as a whole (VACUUM, COMMIT) put in
+             place of the old ones (see below)
+  - COMMIT : the end of a statement
+
+A record is (payload length, crc32, lsn) followed by the pickled record,
+so a record torn by a crash is recognised and ignored together with
+everything after it.
+
+config.WAL_FSYNC picks how hard the log is pushed to disk:
+
+  - ALWAYS : fsync the log before every logged write and at every
+             COMMIT; a statement is on disk when it returns
+  - BATCH  : fsync the log before every logged write, but not at
+             COMMIT: the COMMIT record goes to disk with the next
+             statement's records, or GROUP_COMMIT_DELAY seconds later if
+             no statement follows. That is one fsync per statement
+             instead of two; a machine crash may lose the statements of
+             the last GROUP_COMMIT_DELAY seconds, which are undone.
+  - OFF    : never fsync. A crash of MiniDB itself loses nothing (the
+             operating system has the writes), a crash of the machine may
+             lose or tear anything recent.
+
+Either way a table file never holds bytes whose log record could be lost
+(the write-ahead rule): writes made together are logged together and
+share one fsync. Separate statements do not share that fsync: their
+writes are made to the table files as soon as they are logged, and no
+page is held in memory to be written after a later fsync.
+
+Recovery (recover(), run by minidb.setup) repeats history: every logged
+write is done again in log order, which changes nothing for the bytes
+that had reached the table files. The records after the last COMMIT
+belong to a statement the crash cut short; they are then undone in
+reverse order from their old bytes, so a statement is either all there
+or not at all. Indexes, zone maps and Bloom filters are not logged;
+those of the tables recovery touched are rebuilt from the tables.
+
+A table file rewritten as a whole is written next to the old one and
+fsynced instead of being logged; a SWAP record lists the pairs, then the
+old file is renamed to <path>.old and the new one into its place. The
+old files are deleted once the statement's COMMIT is on disk, and
+recovery puts them back for a statement it undoes. Writes logged before
+a SWAP of the same file are not repeated: the new file replaces them.
+
+A checkpoint fsyncs every file under data/ and metadata/ and empties the
+log. It runs between statements: when the log outgrows CHECKPOINT_SIZE,
+after recovery and around schema changes (CREATE, DROP, ALTER, TRUNCATE,
+indexes).
+"""
+import os
+import atexit
+import pickle
+import struct
+import threading
+import zlib
+import config
+from utils import DATA_DIR, META_DIR
+
+WAL_NAME = "minidb.wal"
+MAGIC = b"MINIDB\x00W"
+RECORD = struct.Struct("<IIQ")    # payload length, crc32, lsn
+
+CHECKPOINT_SIZE = 16 * 1024 * 1024
+GROUP_COMMIT_DELAY = 0.05
+
+_log = None
+
+
+def wal_path():
+    return os.path.join(DATA_DIR, WAL_NAME)
+
+
+def _table_of(path):
+    """Table a data file belongs to (data/<table>.tbl, data/<table>.<i>.col, ...)"""
+    return os.path.basename(path).split(".")[0]
+
+
+def _fsync_path(path):
+    """fsync a file, or a directory (where the platform allows it)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _read_records(path):
+    """Yield (lsn, record) for the intact records of a log file"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return
+
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                return
+
+            length, crc, lsn = RECORD.unpack(head)
+            payload = f.read(length)
+
+            # A torn record ends the log
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+
+            yield lsn, pickle.loads(payload)
+
+
+# ===================================
+# LOG
+# ===================================
+
+class WriteAheadLog:
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.lsn = 0
+        self.pending = 0
+        self.timer = None
+        self.backups = []    # old files of the swaps since the last COMMIT
+
+        if os.path.exists(path):
+            for lsn, _ in _read_records(path):
+                self.lsn = lsn
+
+        self.committed = self.lsn
+
+        # Unbuffered: a record is with the operating system once append returns
+        self.file = open(path, "ab", buffering=0)
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+
+    def append(self, record):
+        payload = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+
+        with self.lock:
+            self.lsn += 1
+            self.file.write(RECORD.pack(len(payload), zlib.crc32(payload), self.lsn) + payload)
+            return self.lsn
+
+    def size(self):
+        return self.file.tell()
+
+    # ---------- FSYNC ----------
+
+    def sync(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            os.fsync(self.file.fileno())
+            self.pending = 0
+
+    def _sync_pending(self):
+        with self.lock:
+            self.timer = None
+            if self.pending and not self.file.closed:
+                self.sync()
+
+    def logged(self):
+        """After logging writes, before making them: the records go to disk first"""
+        if config.get_wal_fsync() != "OFF":
+            self.sync()
+
+    def commit(self):
+        """
+        End a statement that logged anything, fsyncing the log as the fsync
+        mode asks
+        """
+        with self.lock:
+            if self.lsn == self.committed:
+                return
+
+            self.committed = self.append(("COMMIT",))
+            mode = config.get_wal_fsync()
+
+            if mode == "ALWAYS":
+                self.sync()
+
+            elif mode == "BATCH":
+                # The next statement's fsync before its writes covers this
+                # record; the timer does if none comes in time
+                self.pending += 1
+                if self.timer is None:
+                    self.timer = threading.Timer(GROUP_COMMIT_DELAY, self._sync_pending)
+                    self.timer.daemon = True
+                    self.timer.start()
+
+            # Old files of swapped tables are needed until the COMMIT is on disk
+            if self.backups:
+                if mode != "OFF":
+                    self.sync()
+                self._drop_backups()
+
+        if self.size() > CHECKPOINT_SIZE:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Make every data file durable and empty the log"""
+        with self.lock:
+            if config.get_wal_fsync() != "OFF":
+                for folder in (DATA_DIR, META_DIR):
+                    if not os.path.isdir(folder):
+                        continue
+                    for name in os.listdir(folder):
+                        path = os.path.join(folder, name)
+                        if name != WAL_NAME and os.path.isfile(path):
+                            _fsync_path(path)
+                    _fsync_path(folder)
+
+            self.file.truncate(0)
+            self.file.seek(0)
+            self.file.write(MAGIC)
+            self.committed = self.lsn
+
+            if config.get_wal_fsync() != "OFF":
+                self.sync()
+            else:
+                self.pending = 0
+
+            self._drop_backups()
+
+    def _drop_backups(self):
+        for path in self.backups:
+            if os.path.exists(path):
+                os.remove(path)
+        self.backups = []
+
+    def close(self):
+        with self.lock:
+            if self.pending:
+                self.sync()
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self.file.close()
+
+
+def get_log():
+    """The write-ahead log of the data directory, opened on first use"""
+    global _log
+    path = os.path.abspath(wal_path())
+
+    # DATA_DIR is relative to the working directory
+    if _log is None or _log.file.closed or _log.path != path:
+        if _log is not None and not _log.file.closed:
+            _log.close()
+        os.makedirs(DATA_DIR, exist_ok=True)
+        _log = WriteAheadLog(path)
+    return _log
+
+
+@atexit.register
+def _close_log():
+    if _log is not None and not _log.file.closed:
+        _log.close()
+
+
+# ===================================
+# LOGGED WRITES
+# ===================================
+
+def _write(path, offset, data, truncate):
+    with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+        f.seek(offset)
+        f.write(data)
+        if truncate:
+            f.truncate()
+
+
+def _replace(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _read(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _before(path, offset, length):
+    """(bytes at offset that a write of length bytes replaces, file size); None for no file"""
+    if not os.path.exists(path):
+        return b"", None
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        f.seek(offset)
+        return f.read(length if length is not None else -1), size
+
+
+def _swap(tmp, path):
+    """Put tmp in place of path, keeping the first old file as path.old"""
+    if not os.path.exists(tmp):
+        return
+    if os.path.exists(path) and not os.path.exists(path + ".old"):
+        os.replace(path, path + ".old")
+    os.replace(tmp, path)
+
+
+def write_at(path, offset, data, truncate=False):
+    """Write data at offset of a file (cutting the file after it), logged first"""
+    write_all([(path, offset, data, truncate)])
+
+
+def write_all(writes):
+    """
+    Make (path, offset, data, truncate) writes, none overlapping another:
+    all are logged, with one fsync, before the first is made
+    """
+    log = get_log()
+    for path, offset, data, truncate in writes:
+        before, size = _before(path, offset, None if truncate else len(data))
+        log.append(("WRITE", path, offset, bytes(data), truncate, before, size))
+    log.logged()
+
+    for path, offset, data, truncate in writes:
+        _write(path, offset, data, truncate)
+
+
+def replace_file(path, data):
+    """Replace the contents of a small file, logged first"""
+    log = get_log()
+    log.append(("FILE", path, bytes(data), _read(path)))
+    log.logged()
+    _replace(path, data)
+
+
+def replace_files(pairs):
+    """
+    Swap (new file, path) pairs in place of table files rewritten as a
+    whole. The new files are fsynced instead of logged, as are the old
+    ones: until the statement commits, undoing it means putting them back.
+    """
+    log = get_log()
+
+    if config.get_wal_fsync() != "OFF":
+        for tmp, path in pairs:
+            _fsync_path(tmp)
+            _fsync_path(path)
+
+    log.append(("SWAP", [(tmp, path, os.path.exists(path)) for tmp, path in pairs]))
+    log.logged()
+
+    for tmp, path in pairs:
+        _swap(tmp, path)
+        log.backups.append(path + ".old")
+
+    if config.get_wal_fsync() != "OFF":
+        _fsync_path(DATA_DIR)
+
+
+def commit():
+    get_log().commit()
+
+
+def rollback():
+    """
+    Undo what a statement that failed part way logged since the last
+    COMMIT, rebuild what is derived from the tables it touched and
+    checkpoint, so the undone records are never repeated
+    """
+    log = get_log()
+
+    with log.lock:
+        if log.lsn == log.committed:
+            return
+
+        records = [record for lsn, record in _read_records(log.path) if lsn > log.committed]
+        for record in reversed(records):
+            _undo(record)
+
+        log.backups = []
+        log.checkpoint()
+
+    _rebuild({_table_of(target) for record in records for target in _targets(record)})
+
+
+def checkpoint():
+    get_log().checkpoint()
+
+
+# ===================================
+# RECOVERY
+# ===================================
+
+def recover():
+    """
+    Repeat the log left by a crash and undo the statement it cut short,
+    rebuild the indexes, zone maps and Bloom filters of the tables it
+    touched and checkpoint. Returns the number of records replayed.
+    """
+    global _log
+
+    path = wal_path()
+    if not os.path.exists(path):
+        return 0
+
+    if _log is not None and not _log.file.closed:
+        _log.close()
+    _log = None
+
+    records = [record for _, record in _read_records(path)]
+    committed = max((i + 1 for i, record in enumerate(records) if record[0] == "COMMIT"), default=0)
+
+    # A file swapped in replaces what was written to the old one
+    swapped = {}
+    for i, record in enumerate(records):
+        if record[0] == "SWAP":
+            for _, target, _ in record[1]:
+                swapped[target] = i
+
+    for i, record in enumerate(records):
+        if record[0] == "SWAP":
+            for tmp, target, _ in record[1]:
+                _swap(tmp, target)
+        elif record[0] != "COMMIT" and swapped.get(record[1], -1) < i:
+            _redo(record)
+
+    for record in reversed(records[committed:]):
+        _undo(record)
+
+    # Old files of the committed swaps are no longer needed
+    for record in records[:committed]:
+        if record[0] == "SWAP":
+            for _, target, _ in record[1]:
+                if os.path.exists(target + ".old"):
+                    os.remove(target + ".old")
+
+    tables = {_table_of(target) for record in records for target in _targets(record)}
+    if tables:
+        _rebuild(tables)
+
+    checkpoint()
+    return sum(1 for record in records if record[0] != "COMMIT")
+
+
+def _targets(record):
+    """Paths of the files a record changes"""
+    if record[0] == "SWAP":
+        return [target for _, target, _ in record[1]]
+    if record[0] == "COMMIT":
+        return []
+    return [record[1]]
+
+
+def _redo(record):
+    if record[0] == "WRITE":
+        _, target, offset, data, truncate, _, _ = record
+        _write(target, offset, data, truncate)
+    elif record[0] == "FILE":
+        _replace(record[1], record[2])
+
+
+def _undo(record):
+    kind = record[0]
+
+    if kind == "WRITE":
+        _, target, offset, _, _, before, size = record
+        if size is None:
+            if os.path.exists(target):
+                os.remove(target)
+            return
+        _write(target, offset, before, False)
+        with open(target, "r+b") as f:
+            f.truncate(size)
+
+    elif kind == "FILE":
+        _, target, _, before = record
+        if before is not None:
+            _replace(target, before)
+        elif os.path.exists(target):
+            os.remove(target)
+
+    elif kind == "SWAP":
+        for tmp, target, existed in reversed(record[1]):
+            if os.path.exists(target + ".old"):
+                os.replace(target + ".old", target)
+            elif not existed and os.path.exists(target):
+                os.remove(target)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+def _rebuild(tables):
+    """Rebuild what is derived from the tables and not logged"""
+    from utils import table_paths
+    from .catalog import get_table, forget_table
+    from .indexes import rebuild_indexes, close_indexes
+    from .table import open_table
+
+    for table in sorted(tables):
+        tbl, meta = table_paths(table)
+        if not (os.path.exists(tbl) and os.path.exists(meta)):
+            continue
+
+        forget_table(table)
+        close_indexes(table)
+        metadata = get_table(table).metadata
+
+        # The zones are built again from the rows, as a rewrite does
+        heap = open_table(table, metadata)
+        if heap.zonemap is not None:
+            heap.zonemap.rebuild(heap)
+
+        rebuild_indexes(table, metadata)
@@ -0,0 +1,249 @@
+"""
+Zone maps: per-block minimum / maximum of the numeric columns
+
+The rows of a table are divided into zones - ZONE_PAGES pages of a heap
+file (one compressed block), or one block of a column store. For every
+INT / DOUBLE column a zone records the smallest and largest value and
+the number of NULLs:
+
+    data/<table>.zone    pickled (column positions, zone size, zones)
+
+Inserts widen the zones they write to and a rewrite builds the map
+again, so a zone's range always covers its live rows (deleted rows may
+leave it wider than needed). A zone without an entry, e.g. of a table
+written before zone maps existed, is never skipped, and stays without
+one when rows are added to it: only a zone written from its first page
+(or a whole block) gets a new entry. Recovery builds the map again from
+the table (rebuild).
+
+A WHERE condition is checked against the ranges once per zone: zones
+that cannot hold a match are skipped by scans, UPDATE and DELETE without
+being read.
+"""
+import os
+import pickle
+from utils import remove_quotes
+from .heapfile import NUMERIC_TYPES, page_slots
+from .compression import BLOCK_PAGES
+
+# A zone of a heap file is one compressed block
+ZONE_PAGES = BLOCK_PAGES
+
+
+def zone_path(table_path):
+    return table_path[:-len(".tbl")] + ".zone"
+
+
+def _widen(entry, value):
+    """entry is [min, max, NULL count] of one column in one zone"""
+    if value is None:
+        entry[2] += 1
+    elif value != value:
+        # NaN has no place in the order; the zone can no longer be skipped
+        entry[0], entry[1] = float("-inf"), float("inf")
+    elif entry[0] is None:
+        entry[0] = entry[1] = value
+    elif value < entry[0]:
+        entry[0] = value
+    elif value > entry[1]:
+        entry[1] = value
+
+
+class ZoneMap:
+
+    def __init__(self, path, types, zone_size):
+        self.path = path
+        self.positions = [i for i, t in enumerate(types) if t.upper() in NUMERIC_TYPES]
+        self.zone_size = zone_size
+        self.zones = []
+        self._loaded = False
+
+    def load(self):
+        if not self._loaded:
+            self._loaded = True
+            if os.path.exists(self.path):
+                with open(self.path, "rb") as f:
+                    positions, zone_size, zones = pickle.load(f)
+                # A map of other columns (before an ALTER) is of no use
+                if positions == self.positions and zone_size == self.zone_size:
+                    self.zones = zones
+        return self.zones
+
+    def save(self):
+        # Never write out a map that was not read, over the zones on disk
+        self.load()
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump((self.positions, self.zone_size, self.zones), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+    def invalidate(self):
+        """Remove the file, e.g. while the data it describes is replaced"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def reset(self):
+        self._loaded = True
+        self.zones = []
+
+    def _zone(self, zone_no, fresh):
+        """
+        The entry of a zone, created if fresh (nothing in the zone but what
+        is being added); None for a zone whose rows are not all known
+        """
+        zones = self.load()
+        while len(zones) <= zone_no:
+            zones.append(None)
+        if zones[zone_no] is None and fresh:
+            zones[zone_no] = [[None, None, 0] for _ in self.positions]
+        return zones[zone_no]
+
+    def rebuild(self, table_file):
+        """Build the map again from every row of the table file"""
+        self.reset()
+        if self.positions:
+            for rid, vals in table_file.scan():
+                self.add_rows(rid[0] // self.zone_size, [vals], True)
+        self.save()
+
+    # ---------- MAINTENANCE ----------
+
+    def add_rows(self, zone_no, rows, fresh=False):
+        """Widen a zone with rows of values"""
+        if not self.positions:
+            return
+        zone = self._zone(zone_no, fresh)
+        if zone is None:
+            return
+        for vals in rows:
+            for entry, i in zip(zone, self.positions):
+                _widen(entry, vals[i])
+
+    def add_page(self, page_no, page, codec):
+        """Widen the zone of a heap page with all the records on it"""
+        if not self.positions:
+            return
+        zone = self._zone(page_no // self.zone_size, page_no % self.zone_size == 0)
+        if zone is None:
+            return
+        unpack = codec.fixed.unpack_from
+
+        for _, offset, _ in page_slots(page):
+            parts = unpack(page, offset)
+            nulls = int.from_bytes(parts[1], "little")
+            for entry, i in zip(zone, self.positions):
+                _widen(entry, None if nulls >> i & 1 else parts[2 + i])
+
+    def set_rows(self, zone_no, rows):
+        """Replace a zone with the ranges of rows (a rewritten block)"""
+        zones = self.load()
+        if zone_no < len(zones):
+            zones[zone_no] = None
+        self.add_rows(zone_no, rows, True)
+
+
+# ===================================
+# ZONE FILTERS
+# ===================================
+
+class ZoneFilter:
+    """
+    Called with a zone number, True when the zone may hold rows matching
+    the condition; counts the zones it rules out. Each zone is tested
+    once, so it may be called for every row of a zone.
+    """
+
+    def __init__(self, zonemap, test):
+        self.zones = zonemap.load()
+        self.zone_size = zonemap.zone_size
+        self.test = test
+        self.results = {}
+        self.skipped = 0
+
+    def __call__(self, zone_no):
+        result = self.results.get(zone_no)
+        if result is None:
+            zone = self.zones[zone_no] if zone_no < len(self.zones) else None
+            result = self.results[zone_no] = zone is None or bool(self.test(zone))
+            if not result:
+                self.skipped += 1
+        return result
+
+    def skips(self, rid):
+        """True when the row at rid is in a zone that cannot match"""
+        return not self(rid[0] // self.zone_size)
+
+
+def zone_filter(table_file, info, condition):
+    """A ZoneFilter for a WHERE condition, or None if no zone can be ruled out"""
+    zonemap = getattr(table_file, "zonemap", None)
+    if condition is None or zonemap is None or not zonemap.load():
+        return None
+
+    slots = {i: k for k, i in enumerate(zonemap.positions)}
+    test = _compile_zone_test(info, condition, slots)
+
+    return ZoneFilter(zonemap, test) if test is not None else None
+
+
+def _compile_zone_test(info, condition, slots):
+    """
+    Function of a zone that is False only when no row of the zone can
+    match; None when the condition never rules a zone out
+    """
+    if isinstance(condition, tuple):
+        return _comparison_test(info, condition, slots)
+
+    # A zone that may match the inner condition may also match its
+    # negation, so NOT rules nothing out
+    if condition["type"] == "NOT":
+        return None
+
+    parts = [_compile_zone_test(info, c, slots) for c in condition["conditions"]]
+
+    if condition["type"] == "AND":
+        parts = [p for p in parts if p is not None]
+        if not parts:
+            return None
+        return lambda zone: all(p(zone) for p in parts)
+
+    if any(p is None for p in parts):
+        return None
+    return lambda zone: any(p(zone) for p in parts)
+
+
+def _comparison_test(info, condition, slots):
+    # predicates imports the table module, which imports this one
+    from .predicates import _literal_number
+
+    column, op, literal = condition
+    i = info.position(column)
+
+    if i not in slots:
+        return None
+
+    k = slots[i]
+    literal = remove_quotes(literal)
+
+    if literal == "NULL":
+        return (lambda zone: zone[k][2] > 0) if op == "=" else None
+
+    number = _literal_number(literal)
+    if number is None:
+        return None
+
+    # zone[k] is [min, max, NULLs]; min is None when all values are NULL
+    if op == "=":
+        return lambda zone: zone[k][0] is not None and zone[k][0] <= number <= zone[k][1]
+    if op == "<":
+        return lambda zone: zone[k][0] is not None and zone[k][0] < number
+    if op == "<=":
+        return lambda zone: zone[k][0] is not None and zone[k][0] <= number
+    if op == ">":
+        return lambda zone: zone[k][0] is not None and zone[k][1] > number
+    if op == ">=":
+        return lambda zone: zone[k][0] is not None and zone[k][1] >= number
+    if op == "!=":
+        return lambda zone: zone[k][0] is not None and not (zone[k][0] == zone[k][1] == number)
+
+    return None
@@ -0,0 +1,105 @@
+"""
+Column store writes touch only the rows and columns they change
+
+Run from the repository root: python -m pytest tests
+"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from parser import parse_query
+from executor import execute_query
+from storage.catalog import get_table
+from storage.columnfile import BLOCK_ROWS
+from storage.indexes import pk_lookup, pk_key
+from storage.table import open_table
+
+
+def run(sql):
+    with contextlib.redirect_stdout(io.StringIO()):
+        execute_query(parse_query(sql))
+
+
+class ColumnFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp(prefix="minidb-test")
+        os.chdir(self.dir)
+        os.makedirs("data")
+        os.makedirs("metadata")
+
+        self.mode = config.get_mode()
+        config.set_mode("PRODUCTION")
+
+        self.table = "col"
+        run(f"CREATE TABLE {self.table} (id INT, name VARCHAR, v DOUBLE, PRIMARY KEY (id)) ENGINE = COLUMNAR")
+
+    def tearDown(self):
+        config.set_mode(self.mode)
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _heap(self):
+        info = get_table(self.table)
+        return info, open_table(self.table, info.metadata)
+
+    def _sizes(self):
+        _, heap = self._heap()
+        return [os.path.getsize(heap.column_path(i)) for i in range(heap.width)]
+
+    def test_inserts_add_pieces_to_the_last_block(self):
+        run(f"INSERT INTO {self.table} VALUES " + ", ".join(f"({i}, 'n{i}', {i})" for i in range(BLOCK_ROWS - 100)))
+        run(f"DELETE FROM {self.table} WHERE id < 10")
+        sizes = self._sizes()
+
+        for i in range(BLOCK_ROWS - 100, BLOCK_ROWS + 50):
+            run(f"INSERT INTO {self.table} VALUES ({i}, 'n{i}', {i})")
+
+        info, heap = self._heap()
+        blocks = heap._load()
+
+        # The full block was merged into one piece, in place of its pieces
+        self.assertEqual([rows for rows, _ in blocks], [BLOCK_ROWS, 50])
+        self.assertEqual([len(pieces) for pieces in blocks[0][1]], [1, 1, 1])
+        self.assertLess(max(len(pieces) for pieces in blocks[1][1]), 8)
+        self.assertLess(self._sizes()[0], sizes[0] * 1.1)
+
+        rows = list(heap.scan())
+        self.assertEqual(sorted(vals[0] for _, vals in rows), list(range(10, BLOCK_ROWS + 50)))
+        for rid, vals in rows:
+            self.assertEqual(vals, [vals[0], f"n{vals[0]}", vals[0]])
+            self.assertEqual(pk_lookup(self.table, info.metadata, pk_key(vals, info.pk_positions)), rid)
+
+    def test_update_writes_only_the_assigned_column(self):
+        run(f"INSERT INTO {self.table} VALUES " + ", ".join(f"({i}, 'n{i}', {i})" for i in range(3000)))
+        sizes = self._sizes()
+
+        # A DOUBLE that stays not NULL is overwritten where it is
+        for i in range(0, 300, 3):
+            run(f"UPDATE {self.table} SET v = {i * 10} WHERE id = {i}")
+        self.assertEqual(self._sizes(), sizes)
+
+        # A VARCHAR piece is written again, in its own column file only
+        run(f"UPDATE {self.table} SET name = 'a much longer name' WHERE id = 7")
+        after = self._sizes()
+        self.assertEqual((after[0], after[2]), (sizes[0], sizes[2]))
+        self.assertGreater(after[1], sizes[1])
+
+        _, heap = self._heap()
+        rows = {vals[0]: vals for _, vals in heap.scan()}
+        self.assertEqual(len(rows), 3000)
+        self.assertEqual(rows[3], [3, "n3", 30])
+        self.assertEqual(rows[4], [4, "n4", 4])
+        self.assertEqual(rows[7], [7, "a much longer name", 7])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+"""
+Open index handles never outlive the files they were opened on
+
+Run from the repository root: python -m pytest tests
+"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from parser import parse_query
+from executor import execute_query
+from storage.btree import BPlusTree
+from storage.catalog import get_table
+from storage.indexes import pk_lookup, pk_key
+
+
+def run(sql):
+    with contextlib.redirect_stdout(io.StringIO()):
+        execute_query(parse_query(sql))
+
+
+class IndexHandleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dirs = []
+        self.mode = config.get_mode()
+        config.set_mode("PRODUCTION")
+
+    def tearDown(self):
+        config.set_mode(self.mode)
+        os.chdir(self.cwd)
+        for path in self.dirs:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _enter_new_directory(self):
+        path = tempfile.mkdtemp(prefix="minidb-test")
+        self.dirs.append(path)
+        os.chdir(path)
+        os.makedirs("data")
+        os.makedirs("metadata")
+
+    def _create(self, first, last):
+        run("CREATE TABLE t (id INT, name VARCHAR, PRIMARY KEY (id))")
+        run("CREATE INDEX t_name ON t (name)")
+        run("INSERT INTO t VALUES " + ", ".join(f"({n}, 'n{n}')" for n in range(first, last)))
+
+    def _lookup(self, key):
+        info = get_table("t")
+        return pk_lookup("t", info.metadata, pk_key([key], info.pk_positions))
+
+    def test_same_table_in_another_directory(self):
+        self._enter_new_directory()
+        self._create(0, 100)
+        self.assertIsNotNone(self._lookup(50))
+
+        # The keys of the first directory are not found in the second one
+        self._enter_new_directory()
+        self._create(100, 200)
+        self.assertIsNone(self._lookup(50))
+        self.assertIsNotNone(self._lookup(150))
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            execute_query(parse_query("SELECT * FROM t WHERE name = 'n150'"))
+        self.assertIn("150 | n150", out.getvalue())
+
+    def test_table_dropped_and_created_again(self):
+        self._enter_new_directory()
+        self._create(0, 100)
+        self.assertIsNotNone(self._lookup(50))
+
+        run("DROP TABLE t")
+        self._create(100, 200)
+        self.assertIsNone(self._lookup(50))
+
+        # A key of the dropped table can be inserted again
+        run("INSERT INTO t VALUES (50, 'again')")
+        self.assertIsNotNone(self._lookup(50))
+
+    def test_new_key_descends_the_tree_once(self):
+        self._enter_new_directory()
+        run("CREATE TABLE t (id INT, name VARCHAR, PRIMARY KEY (id))")
+        run("INSERT INTO t VALUES " + ", ".join(f"({n}, 'n{n}')" for n in range(1000)))
+
+        calls = []
+        find_leaf = BPlusTree._find_leaf
+
+        def counted(tree, key):
+            calls.append(key)
+            return find_leaf(tree, key)
+
+        # The Bloom filter rules the key out, and the insert does not
+        # search the tree for it again
+        with mock.patch.object(BPlusTree, "_find_leaf", counted):
+            run("INSERT INTO t VALUES (5000, 'n5000')")
+        self.assertEqual(len(calls), 1)
+
+        self.assertIsNotNone(self._lookup(5000))
+        with self.assertRaises(Exception):
+            execute_query(parse_query("INSERT INTO t VALUES (500, 'again')"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Statements inside a transaction see the rows it queued
+
+Run from the repository root: python -m pytest tests
+"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from parser import parse_query
+from executor import execute_query
+from storage.catalog import get_table
+from storage.indexes import pk_lookup, pk_key
+from storage.table import open_table
+
+
+def run(sql):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        execute_query(parse_query(sql))
+    return out.getvalue()
+
+
+class TransactionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp(prefix="minidb-test")
+        os.chdir(self.dir)
+        os.makedirs("data")
+        os.makedirs("metadata")
+
+        self.mode = config.get_mode()
+        self.autovacuum = config.get_autovacuum()
+        config.set_mode("PRODUCTION")
+        config.set_autovacuum("OFF")
+
+    def tearDown(self):
+        config.set_mode(self.mode)
+        config.set_autovacuum("OFF" if self.autovacuum is None else self.autovacuum)
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _rows(self, table):
+        info = get_table(table)
+        rows = list(open_table(table, info.metadata).scan())
+        for rid, vals in rows:
+            self.assertEqual(pk_lookup(table, info.metadata, pk_key(vals, info.pk_positions)), rid)
+        return sorted(vals for _, vals in rows)
+
+    def _create(self, name, options=""):
+        table = f"txn_{name}"
+        run(f"CREATE TABLE {table} (id INT, name VARCHAR, PRIMARY KEY (id)){options}")
+        run(f"INSERT INTO {table} VALUES " + ", ".join(f"({n}, 'n{n}')" for n in range(100)))
+        return table
+
+    def test_new_dictionary_values_match_inside_the_transaction(self):
+        table = "txn"
+        run(f"CREATE TABLE {table} (id INT, city VARCHAR, n INT) PRIMARY KEY (id) DICTIONARY (city)")
+        run(f"INSERT INTO {table} VALUES (1, 'Pune', 1)")
+
+        # Mysore and Delhi are not in the table's dictionary until COMMIT
+        run("BEGIN")
+        run(f"INSERT INTO {table} VALUES (2, 'Mysore', 2), (3, 'Mysore', 3), (4, 'Delhi', 4)")
+        self.assertIn("COUNT = 2", run(f"SELECT COUNT(*) FROM {table} WHERE city = 'Mysore'"))
+
+        run(f"UPDATE {table} SET n = 30 WHERE city = 'Mysore' AND id = 3")
+        run(f"DELETE FROM {table} WHERE city = 'Delhi'")
+        run("COMMIT")
+
+        self.assertEqual(self._rows(table), [[1, "Pune", 1], [2, "Mysore", 2], [3, "Mysore", 30]])
+
+    def test_commit_writes_rows_in_place(self):
+        for i, options in enumerate(["", " COMPRESSION = ZLIB", " ENGINE = COLUMNAR"]):
+            table = self._create(i, options)
+            rids = {vals[0]: rid for rid, vals in open_table(table, get_table(table).metadata).scan()}
+
+            # A freed key is taken again, a row grows and one keeps its size
+            run("BEGIN")
+            run(f"DELETE FROM {table} WHERE id < 10")
+            run(f"INSERT INTO {table} VALUES (5, 'again'), (100, 'new')")
+            run(f"UPDATE {table} SET name = 'a much longer name' WHERE id = 20")
+            run(f"UPDATE {table} SET name = 'm50' WHERE id = 50")
+            run("COMMIT")
+
+            rows = self._rows(table)
+            self.assertEqual(len(rows), 92)
+            self.assertIn([5, "again"], rows)
+            self.assertIn([20, "a much longer name"], rows)
+
+            # The row that kept its size was overwritten where it was
+            info = get_table(table)
+            self.assertEqual(pk_lookup(table, info.metadata, pk_key([50, "m50"], info.pk_positions)), rids[50])
+
+    def test_failed_commit_leaves_every_table_unchanged(self):
+        first = self._create("a")
+        second = self._create("b")
+        before = self._rows(first), self._rows(second)
+
+        run("BEGIN")
+        run(f"DELETE FROM {first} WHERE id < 50")
+        run(f"UPDATE {second} SET name = 'x' WHERE id < 50")
+
+        # The first table is written, then the second one fails
+        with mock.patch("storage.transaction_storage.write_updates", side_effect=Exception("disk failure")):
+            with self.assertRaises(Exception):
+                run("COMMIT")
+
+        self.assertEqual((self._rows(first), self._rows(second)), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
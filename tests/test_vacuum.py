@@ -0,0 +1,82 @@
+"""
+The dead share of a table counts row bytes, so small tables get vacuumed
+
+Run from the repository root: python -m pytest tests
+"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from parser import parse_query
+from executor import execute_query
+from storage.catalog import get_table
+from storage.table import open_table
+from storage.vacuum_storage import compact
+
+
+def run(sql):
+    with contextlib.redirect_stdout(io.StringIO()):
+        execute_query(parse_query(sql))
+
+
+class DeadRatioTest(unittest.TestCase):
+
+    OPTIONS = ["", " COMPRESSION = ZLIB", " ENGINE = COLUMNAR"]
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp(prefix="minidb-test")
+        os.chdir(self.dir)
+        os.makedirs("data")
+        os.makedirs("metadata")
+
+        self.mode = config.get_mode()
+        self.autovacuum = config.get_autovacuum()
+        config.set_mode("PRODUCTION")
+        config.set_autovacuum("OFF")
+
+    def tearDown(self):
+        config.set_mode(self.mode)
+        config.set_autovacuum("OFF" if self.autovacuum is None else self.autovacuum)
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _heap(self, table):
+        return open_table(table, get_table(table).metadata)
+
+    def test_deleting_the_only_row_leaves_the_table_all_dead(self):
+        for i, options in enumerate(self.OPTIONS):
+            table = f"dead_{i}"
+            run(f"CREATE TABLE {table} (id INT, name VARCHAR, PRIMARY KEY (id)){options}")
+            run(f"INSERT INTO {table} VALUES (1, 'only')")
+            self.assertEqual(self._heap(table).dead_ratio(), 0.0)
+
+            run(f"DELETE FROM {table} WHERE id = 1")
+            self.assertEqual(self._heap(table).dead_ratio(), 1.0)
+
+            compact(table)
+            self.assertEqual(self._heap(table).dead_ratio(), 0.0)
+
+    def test_relocating_update_counts_the_old_row(self):
+        table = "dead"
+        run(f"CREATE TABLE {table} (id INT, name VARCHAR, PRIMARY KEY (id))")
+        run(f"INSERT INTO {table} VALUES (1, 'a'), (2, 'b')")
+        live, _ = self._heap(table).byte_counts()
+
+        run(f"UPDATE {table} SET name = 'a much longer name' WHERE id = 1")
+        after, dead = self._heap(table).byte_counts()
+
+        self.assertEqual(dead, live // 2)
+        self.assertEqual(after, live + len("a much longer name") - 1)
+        self.assertAlmostEqual(self._heap(table).dead_ratio(), dead / (after + dead))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+"""
+Vectorized GROUP BY merges the batch states within the aggregate memory
+budget
+
+Run from the repository root: python -m pytest tests
+"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from parser import parse_query
+from executor import execute_query
+from storage import vectorized
+from storage.aggregates import build_aggregates, final_values
+from storage.catalog import get_table
+from storage.external_aggregate import AggregateStats
+from storage.operators import ScanStats, hash_aggregate
+from storage.table import open_table
+
+
+def run(sql):
+    with contextlib.redirect_stdout(io.StringIO()):
+        execute_query(parse_query(sql))
+
+
+@unittest.skipIf(vectorized.np is None, "NumPy is not installed")
+class VectorGroupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp(prefix="minidb-test")
+        os.chdir(self.dir)
+        os.makedirs("data")
+        os.makedirs("metadata")
+
+        self.mode = config.get_mode()
+        self.memory = config.get_aggregate_memory()
+        config.set_mode("PRODUCTION")
+
+    def tearDown(self):
+        config.set_mode(self.mode)
+        config.set_aggregate_memory(self.memory)
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_batch_states_spill_past_the_budget(self):
+        table = "vec"
+        run(f"CREATE TABLE {table} (id INT, k INT, x DOUBLE, PRIMARY KEY (id))")
+        values = ", ".join(f"({i}, {i % 500}, {i % 7})" for i in range(5000))
+        run(f"INSERT INTO {table} VALUES {values}")
+
+        info = get_table(table)
+        heap = open_table(table, info.metadata)
+        aggs = build_aggregates(info, [("COUNT", "*"), ("SUM", "x"), ("MIN", "x")])
+        positions = [info.position("k")]
+
+        expected = [
+            (key, final_values(state, aggs))
+            for key, state in hash_aggregate((vals for _, vals in heap.scan()), positions, aggs)
+        ]
+
+        # Batches of one page, and room for a few groups only
+        config.set_aggregate_memory(4096)
+        stats = ScanStats()
+        agg_stats = AggregateStats()
+
+        with mock.patch("storage.vectorized.BATCH_PAGES", 1):
+            groups = vectorized.vector_group(heap, info, None, aggs, positions, stats, None, agg_stats)
+            result = [(key, final_values(state, aggs)) for key, state in groups]
+
+        self.assertEqual(result, expected)
+        self.assertEqual(stats.rows_read, 5000)
+        self.assertEqual(agg_stats.groups, 500)
+        self.assertGreater(agg_stats.partitions, 0)
+        self.assertFalse([name for name in os.listdir("data") if name.endswith(".part")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+Recovery redoes committed statements and undoes the one a crash cut short
+
+A crash is simulated by leaving logged writes without their COMMIT and
+running recovery in the same process (the log and the table files are
+then as the operating system had them).
+
+Run from the repository root: python -m pytest tests
+"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from parser import parse_query
+from executor import execute_query
+from storage import wal
+from storage.catalog import get_table
+from storage.indexes import pk_lookup, pk_key
+from storage.table import open_table
+from storage.vacuum_storage import compact
+
+
+def run(sql):
+    with contextlib.redirect_stdout(io.StringIO()):
+        execute_query(parse_query(sql))
+
+
+class RecoveryTest(unittest.TestCase):
+
+    OPTIONS = ["", " COMPRESSION = ZLIB", " ENGINE = COLUMNAR"]
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp(prefix="minidb-test")
+        os.chdir(self.dir)
+        os.makedirs("data")
+        os.makedirs("metadata")
+
+        self.mode = config.get_mode()
+        self.autovacuum = config.get_autovacuum()
+        config.set_mode("PRODUCTION")
+        config.set_autovacuum("OFF")
+
+    def tearDown(self):
+        config.set_mode(self.mode)
+        config.set_autovacuum("OFF" if self.autovacuum is None else self.autovacuum)
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _create(self, i, options):
+        table = f"wal_{i}"
+        run(f"CREATE TABLE {table} (id INT, name VARCHAR, PRIMARY KEY (id)){options}")
+        values = ", ".join(f"({n}, 'n{n}')" for n in range(200))
+        run(f"INSERT INTO {table} VALUES {values}")
+        return table
+
+    def _rows(self, table):
+        info = get_table(table)
+        rows = list(open_table(table, info.metadata).scan())
+        for rid, vals in rows:
+            self.assertEqual(pk_lookup(table, info.metadata, pk_key(vals, info.pk_positions)), rid)
+        return sorted(vals for _, vals in rows)
+
+    def test_statement_without_commit_is_undone(self):
+        for i, options in enumerate(self.OPTIONS):
+            table = self._create(i, options)
+            before = self._rows(table)
+
+            # An UPDATE that moves rows and a DELETE, cut short before COMMIT
+            info = get_table(table)
+            heap = open_table(table, info.metadata)
+            rows = [(rid, [vals[0], vals[1] * 10]) for rid, vals in heap.scan() if vals[0] % 2]
+            heap.update(rows)
+            heap.delete([rid for rid, vals in heap.scan() if vals[0] < 50])
+
+            wal.recover()
+            self.assertEqual(self._rows(table), before)
+            self.assertEqual(open_table(table, info.metadata).dead_ratio(), 0.0)
+
+    def test_committed_statement_is_kept(self):
+        for i, options in enumerate(self.OPTIONS):
+            table = self._create(i, options)
+            run(f"UPDATE {table} SET name = 'a much longer name' WHERE id < 10")
+            after = self._rows(table)
+
+            wal.recover()
+            self.assertEqual(self._rows(table), after)
+
+    def test_rewrite_without_commit_puts_the_old_file_back(self):
+        for i, options in enumerate(self.OPTIONS):
+            table = self._create(i, options)
+            run(f"DELETE FROM {table} WHERE id < 100")
+            before = self._rows(table)
+            pages = open_table(table, get_table(table).metadata).page_count()
+
+            compact(table)
+            wal.recover()
+
+            heap = open_table(table, get_table(table).metadata)
+            self.assertEqual(self._rows(table), before)
+            self.assertEqual(heap.page_count(), pages)
+            self.assertFalse([name for name in os.listdir("data") if name.endswith((".old", ".tmp"))])
+
+    def test_failed_statement_is_rolled_back(self):
+        table = self._create(0, "")
+        before = self._rows(table)
+
+        # The rows are written, then adding them to the indexes fails
+        with mock.patch("storage.insert_storage.add_to_indexes", side_effect=Exception("index failure")):
+            with self.assertRaises(Exception):
+                run(f"INSERT INTO {table} VALUES (500, 'x'), (501, 'y')")
+
+        self.assertEqual(self._rows(table), before)
+        run(f"INSERT INTO {table} VALUES (500, 'x')")
+        self.assertEqual(len(self._rows(table)), len(before) + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -14,7 +14,7 @@ KEYWORDS = {
 
 "UPDATE","SET",
 
-"GROUP","BY",
+"GROUP","BY","HAVING",
 
 "ORDER",
 
@@ -24,7 +24,13 @@ KEYWORDS = {
 
 "ALTER","COLUMN","MODIFY","ADD","RENAME","TO","CONSTRAINT",
 
-"SHOW","TABLES","DESCRIBE","TRUNCATE"
+"SHOW","TABLES","DESCRIBE","TRUNCATE","VACUUM",
+
+"INDEX","ON","USING",
+
+"AND","OR","NOT",
+
+"BEGIN","TRANSACTION","COMMIT","ROLLBACK"
 
 }
 
@@ -105,6 +111,33 @@ def tokenize(query):
             continue
 
 
+        # ---------- COMPARISON OPERATORS ----------
+
+        if ch in "<>!":
+
+            if current:
+
+                tokens.append(current)
+
+                current = ""
+
+            op = query[i:i + 2]
+
+            if op in ["<=", ">=", "!=", "<>"]:
+
+                tokens.append(op)
+
+                i += 2
+
+            else:
+
+                tokens.append(ch)
+
+                i += 1
+
+            continue
+
+
         # ---------- SPACE ----------
 
         if ch.isspace():
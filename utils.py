@@ -38,6 +38,11 @@ def table_paths(table):
     )
 
 
+def index_path(table, name):
+
+    return os.path.join(DATA_DIR, f"{table}.{name}.idx")
+
+
 def check_table_exists(tbl, meta):
 
     if not os.path.exists(tbl) or not os.path.exists(meta):
@@ -76,6 +81,10 @@ def compare(cell, op, val):
 
     val = remove_quotes(val)
 
+    if cell is None:
+
+        cell = "NULL"
+
     try:
 
         cell_num = float(cell)
@@ -97,6 +106,83 @@ def compare(cell, op, val):
 
     return False
 
+def format_condition(condition):
+
+    """Text of a WHERE condition: a (column, op, value) tuple or an AND / OR / NOT tree"""
+
+    if isinstance(condition, tuple):
+
+        return " ".join(condition)
+
+    if condition["type"] == "NOT":
+
+        inner = condition["condition"]
+
+        text = format_condition(inner)
+
+        return f"NOT {text}" if isinstance(inner, tuple) else f"NOT ({text})"
+
+    parts = []
+
+    for c in condition["conditions"]:
+
+        text = format_condition(c)
+
+        parts.append(text if isinstance(c, tuple) or c["type"] == "NOT" else f"({text})")
+
+    return f" {condition['type']} ".join(parts)
+
+
+# Binding strength of the arithmetic operators of SET expressions
+PRECEDENCE = {"+": 1, "-": 1, "*": 2, "/": 2}
+
+
+def format_expression(expression):
+
+    """Text of a SET expression: a literal or column token, or an ARITHMETIC / NEGATE tree"""
+
+    if isinstance(expression, str):
+
+        return expression
+
+    if expression["type"] == "NEGATE":
+
+        inner = expression["operand"]
+
+        text = format_expression(inner)
+
+        return f"-{text}" if isinstance(inner, str) else f"-({text})"
+
+    op = expression["op"]
+
+    left = format_expression(expression["left"])
+
+    right = format_expression(expression["right"])
+
+    # Parentheses where the tree binds tighter than the text would read
+    if _binds_looser(expression["left"], PRECEDENCE[op]):
+
+        left = f"({left})"
+
+    if _binds_looser(expression["right"], PRECEDENCE[op] + (op in "-/")):
+
+        right = f"({right})"
+
+    return f"{left} {op} {right}"
+
+
+def _binds_looser(expression, precedence):
+
+    return (
+
+        isinstance(expression, dict)
+
+        and expression["type"] == "ARITHMETIC"
+
+        and PRECEDENCE[expression["op"]] < precedence
+
+    )
+
 # ===============================
 # DATATYPE VALIDATION
 # ===============================
@@ -180,4 +266,83 @@ def validate_value(value, datatype):
 
             f"Unsupported datatype {datatype}"
 
-        )
\ No newline at end of file
+        )
+
+
+# ===============================
+# TYPED VALUES
+# ===============================
+
+def parse_value(value, datatype):
+
+    """Convert a validated SQL literal into the value stored for datatype"""
+
+    datatype = datatype.upper()
+
+    value = value.strip()
+
+    if value == "NULL":
+
+        return None
+
+    if datatype == "INT":
+
+        return int(value)
+
+    if datatype == "DOUBLE":
+
+        return float(value)
+
+    return remove_quotes(value)
+
+
+def cast_value(value, datatype):
+
+    """Convert a stored value (or legacy text) to another datatype"""
+
+    datatype = datatype.upper()
+
+    if value is None:
+
+        return None
+
+    try:
+
+        if datatype == "INT":
+
+            if isinstance(value, str):
+
+                try:
+
+                    return int(value)
+
+                except ValueError:
+
+                    pass
+
+            return int(float(value))
+
+        if datatype == "DOUBLE":
+
+            return float(value)
+
+    except (ValueError, OverflowError):
+
+        raise Exception(
+
+            f"Cannot convert {format_value(value)} to {datatype}"
+
+        )
+
+    return format_value(value)
+
+
+def format_value(value):
+
+    """Text shown for a stored value"""
+
+    if value is None:
+
+        return "NULL"
+
+    return str(value)